@@ -1,5 +1,11 @@
 import streamlit as st
-from data_processor import process_bill_track, process_provider_alerts, send_email_notification, fetch_new_alerts
+from jobs import JobRunner
+from log_buffer import LogBuffer, render_phase_html
+from pipeline import run_update_pipeline, run_notify
+from profiling import list_profiles
+from data_processor import get_setting
+import json
+import os
 import psycopg2
 import pandas as pd
 
@@ -88,42 +94,79 @@ st.markdown("""
 # st.markdown('<img src="https://your-logo-url.png" width="120" style="margin-bottom: -2em;">', unsafe_allow_html=True)
 
 st.markdown('<h1 class="main-header">Medirate Email Alerts Dashboard</h1>', unsafe_allow_html=True)
-st.markdown('<p class="sub-header">Runs Bill Track and Provider Alerts processing in sequence, and shows detailed logs with animation. Use the separate button to send emails.</p>', unsafe_allow_html=True)
+st.markdown('<p class="sub-header">Runs Bill Track and Provider Alerts processing in parallel, and shows detailed logs with animation. Use the separate button to send emails.</p>', unsafe_allow_html=True)
+
+UPDATE_JOB_NAME = "update_database"
+
+@st.cache_resource
+def get_job_runner():
+    """One background job runner shared by every session of this server process"""
+    return JobRunner()
+
+job_runner = get_job_runner()
+
+def run_update_database(profile=None):
+    result = run_update_pipeline(notify=True, profile=profile)
+    if not result['succeeded']:
+        raise RuntimeError("one or more pipelines failed; see the Processing log")
+
+def update_database_steps(profile=None):
+    return [("Updating Bill Track and Provider Alerts in parallel", lambda: run_update_database(profile))]
+
+# Unticked leaves it to the PROFILE_RUNS setting
+profile_runs = st.checkbox("🔬 Profile runs started here", key="profile_runs",
+                           help="Save cProfile stats, stack samples and top allocations per phase; listed under Profiles below.") or None
 
 col1, col2 = st.columns(2)
 
 with col1:
-    if st.button("🗂️ Update Database", key="update_db", type="primary"):
-        st.session_state['logs_by_phase'] = {}
-        st.session_state['processing_log'] = []
-        with st.spinner("🔗 Connecting to Supabase and Database..."):
-            st.markdown("### 🟢 Connecting...")
-            from data_processor import log_connection_status
-            log_connection_status()
-        with st.spinner("⬇️ Downloading and processing Bill Track data..."):
-            st.markdown("### 📋 Processing Bill Track...")
-            process_bill_track()
-        with st.spinner("⬇️ Downloading and processing Provider Alerts data..."):
-            st.markdown("### 🔔 Processing Provider Alerts...")
-            process_provider_alerts()
-        st.success("🎉 Database update complete!")
+    update_running = job_runner.is_running(UPDATE_JOB_NAME)
+    if st.button("🗂️ Update Database", key="update_db", type="primary", disabled=update_running):
+        job, started = job_runner.submit(UPDATE_JOB_NAME, update_database_steps(profile_runs))
+        if not started:
+            st.info("A database update is already running; showing its progress.")
+
+    @st.fragment(run_every=2)
+    def update_job_status():
+        job = job_runner.latest(UPDATE_JOB_NAME)
+        if job is None:
+            return
+        snapshot = job.snapshot()
+        if snapshot['status'] in ("pending", "running"):
+            step = snapshot['current_step'] or "Starting"
+            st.progress(snapshot['progress'], text=f"⏳ {step}... ({snapshot['completed_steps']}/{snapshot['total_steps']}) · job {snapshot['job_id']}")
+            for record in snapshot['logs'].tail(5):
+                st.caption(record.formatted)
+            return
+        # Copy the finished job's logs into this session once, then rerun the full page
+        # so the Processing Log section below picks them up.
+        if st.session_state.get('synced_job_id') != snapshot['job_id']:
+            st.session_state['synced_job_id'] = snapshot['job_id']
+            st.session_state['log_buffer'] = snapshot['logs'].copy()
+            st.rerun()
+        if snapshot['status'] == "succeeded":
+            st.success(f"🎉 Database update complete! (job {snapshot['job_id']}, finished {snapshot['finished_at']:%H:%M:%S})")
+        else:
+            st.error(f"❌ Database update failed: {snapshot['error']} (job {snapshot['job_id']})")
+
+    update_job_status()
 
 with col2:
     if st.button("✉️ Send Email Notifications", key="send_emails", type="primary"):
-        st.session_state['logs_by_phase'] = st.session_state.get('logs_by_phase', {})
-        st.session_state['processing_log'] = st.session_state.get('processing_log', [])
-        new_alerts = fetch_new_alerts()
-        print("[DEBUG] new_alerts fetched:", new_alerts)
-        if new_alerts and len(new_alerts) > 0:
-            with st.spinner("✉️ Sending Email Notifications..."):
-                st.markdown("### ✉️ Sending Email Notifications...")
-                emails_sent = send_email_notification(len(new_alerts))
-            if emails_sent > 0:
-                st.success("🎉 Email notifications sent!")
-            else:
-                st.info("No emails sent: No users matched any new alerts based on their preferences.")
-        else:
+        st.session_state.setdefault('log_buffer', LogBuffer())
+        with st.spinner("✉️ Sending Email Notifications..."):
+            st.markdown("### ✉️ Sending Email Notifications...")
+            notify_result = run_notify(profile=profile_runs)
+        if not notify_result['connected']:
+            st.error("❌ Could not connect to Supabase; no emails sent.")
+        elif not notify_result['succeeded']:
+            st.error("❌ Email notifications finished with errors; see the Processing Log.")
+        elif not notify_result['new_alerts']:
             st.info("No new alerts to send emails for.")
+        elif notify_result['emails_sent'] > 0:
+            st.success("🎉 Email notifications sent!")
+        else:
+            st.info("No emails sent: No users matched any new alerts based on their preferences.")
 
 st.markdown("---")
 st.markdown("## 📝 Processing Log")
@@ -134,24 +177,31 @@ if 'expand_all_logs' not in st.session_state:
 if st.button("Show All Logs" if not st.session_state['expand_all_logs'] else "Collapse All Logs", key="toggle_logs"):
     st.session_state['expand_all_logs'] = not st.session_state['expand_all_logs']
 
-if 'logs_by_phase' in st.session_state:
-    for phase in ["Connection", "Download", "Excel", "Database", "Update", "Processing", "Notification", "General"]:
-        logs = st.session_state['logs_by_phase'].get(phase, [])
-        if logs:
-            with st.expander(f"{phase} Logs ({len(logs)})", expanded=st.session_state['expand_all_logs'] or (phase in ["Processing", "Connection", "Notification"])):
-                for msg, msg_type in logs:
-                    indent = "&nbsp;&nbsp;&nbsp;" if phase != "General" else ""
-                    if msg_type == "success":
-                        st.markdown(f'{indent}<span style="color: #22c55e; font-weight: bold;">{msg}</span>', unsafe_allow_html=True)
-                    elif msg_type == "error":
-                        st.markdown(f'{indent}<span style="color: #ef4444; font-weight: bold;">{msg}</span>', unsafe_allow_html=True)
-                    elif msg_type == "warning":
-                        st.markdown(f'{indent}<span style="color: #eab308; font-weight: bold;">{msg}</span>', unsafe_allow_html=True)
-                    else:
-                        st.markdown(f'{indent}<span style="color: #60a5fa;">{msg}</span>', unsafe_allow_html=True)
+log_buffer = st.session_state.get('log_buffer')
+if log_buffer is not None and len(log_buffer):
+    for phase in log_buffer.phases():
+        with st.expander(f"{phase} Logs ({log_buffer.total(phase)})", expanded=st.session_state['expand_all_logs'] or (phase in ["Processing", "Connection", "Notification"])):
+            # One markdown block per phase keeps the widget count flat however long the run
+            st.markdown(render_phase_html(log_buffer, phase), unsafe_allow_html=True)
 else:
     st.info("No logs yet. Click 'Update Database' or 'Send Email Notifications' to start processing.")
 
+profiles = list_profiles(get_setting("PROFILE_DIR", "profiles"), limit=10)
+if profiles:
+    with st.expander(f"🔬 Profiles ({len(profiles)})", expanded=False):
+        st.caption("Open .pstats with `python -m pstats` or snakeviz; .folded files are collapsed stacks for flamegraph.pl or speedscope.")
+        for name, modified, files in profiles:
+            st.markdown(f"**{name}** · {modified:%Y-%m-%d %H:%M:%S}")
+            summary_path = os.path.join(os.path.dirname(files[0]), "summary.json") if files else None
+            if summary_path and os.path.exists(summary_path):
+                with open(summary_path, encoding="utf-8") as f:
+                    phases = pd.DataFrame(json.load(f)["phases"]).T
+                st.dataframe(phases[["steps", "seconds", "samples", "allocated_bytes"]], use_container_width=True)
+            cols = st.columns(min(len(files), 6) or 1)
+            for i, path in enumerate(files):
+                with open(path, "rb") as f:
+                    cols[i % len(cols)].download_button(os.path.basename(path), f.read(), file_name=f"{name}-{os.path.basename(path)}", key=f"profile_{name}_{i}")
+
 # --- Display full tables from the database, editable ---
 st.markdown("---")
 st.markdown("## 📊 Database Tables (Editable)")
@@ -168,108 +218,168 @@ DB_NAME = SUPABASE_DB
 DB_USER = SUPABASE_USER
 DB_PASS = SUPABASE_PASS
 
-# Fetch service categories for dropdowns
+@st.cache_resource
+def get_db_pool():
+    """Connections shared by the dashboard's reads, so concurrent loads don't each reconnect"""
+    from psycopg2.pool import ThreadedConnectionPool
+    return ThreadedConnectionPool(1, 4, host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
+
+def read_query(sql, params=None, pool=None):
+    """DataFrame of a SELECT, run on a pooled connection"""
+    pool = pool or get_db_pool()
+    conn = pool.getconn()
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
+
+def category_options(df_service_list):
+    """Sorted service categories for the dropdowns"""
+    return sorted(df_service_list['categories'].dropna().unique().tolist(), key=lambda x: x.lower())
+
+def type_alert_table(df, table, options):
+    """Give bill_track_50 or provider_alerts rows the ingest schema's dtypes for editing.
+
+    Categoricals also allow the dropdown options, so edits stay within the categories.
+    """
+    from data_processor import SERVICE_LINE_COLUMNS, US_STATE_MAP
+    from schema import apply_schema
+    categories = {col: options for col in SERVICE_LINE_COLUMNS}
+    categories['state'] = [*US_STATE_MAP.keys(), *US_STATE_MAP.values()]
+    categories['is_new'] = ['yes', 'no']
+    apply_schema(df, table, categories=categories)
+    if 'Delete?' not in df.columns:
+        df['Delete?'] = False
+    return df
+
+def type_live_table(df, table, frames):
+    """Dashboard dtypes for freshly read rows of a live table (see live_frames.LiveFrames)"""
+    if table == "service_category_list":
+        if 'Delete?' not in df.columns:
+            df['Delete?'] = False
+        return df
+    service_list = frames.get("service_category_list")
+    return type_alert_table(df, table, [] if service_list is None else category_options(service_list))
+
+def with_category_options(df, options):
+    """df, or a shallow copy whose service line categoricals also allow options added since it was typed"""
+    from data_processor import SERVICE_LINE_COLUMNS
+    missing = {}
+    for col in SERVICE_LINE_COLUMNS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            extra = [option for option in options if option not in df[col].cat.categories]
+            if extra:
+                missing[col] = extra
+    if not missing:
+        return df
+    df = df.copy(deep=False)
+    for col, extra in missing.items():
+        df[col] = df[col].cat.add_categories(extra)
+    return df
+
+@st.cache_resource
+def get_live_frames():
+    """The dashboard tables, loaded once for every session and patched from NOTIFY (sql/change_notify.sql)"""
+    from live_frames import LiveFrames
+    # Resolved here: the loader and listener threads can't call cached functions
+    pool = get_db_pool()
+    live = LiveFrames(
+        lambda sql, params=None: read_query(sql, params, pool),
+        lambda: psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS),
+        transform=type_live_table,
+    )
+    return live.start()
+
+def db_value(value):
+    """A DataFrame cell as a value psycopg2 can bind (NA/NaT -> None, numpy scalars -> Python)"""
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+# Session table -> (live table, its data_editor key)
+LIVE_TABLES = {
+    'df_bills': ("bill_track_50", "edit_bills_editor"),
+    'df_alerts': ("provider_alerts", "edit_alerts_editor"),
+    'df_service_list': ("service_category_list", "edit_service_list_editor"),
+}
+LIVE_POLL_SECONDS = 5
+
+def has_pending_edits(editor_key):
+    state = st.session_state.get(editor_key) or {}
+    return any(state.get(kind) for kind in ('edited_rows', 'added_rows', 'deleted_rows'))
+
+def sync_live_frames(live, force=False):
+    """Point the session's tables at the latest live frames.
+
+    A table with unsaved edits in its editor keeps its rows until they are saved (or
+    force is given); returns the tables held back.
+    """
+    held = []
+    for key, (table, editor_key) in LIVE_TABLES.items():
+        frame, version = live.get(table)
+        if st.session_state.get(f'{key}_version') == version:
+            continue
+        if key in st.session_state and has_pending_edits(editor_key) and not force:
+            held.append(table)
+            continue
+        if table != "service_category_list":
+            frame = with_category_options(frame, service_categories)
+        # Live frames are never modified, so the session shares them instead of copying
+        st.session_state[key] = frame
+        st.session_state[f'{key}_original'] = frame
+        st.session_state[f'{key}_version'] = version
+    return held
+
+# Load data from database (once per process, shared by every session, then kept live)
 try:
-    conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-    df_service_categories = pd.read_sql_query("SELECT DISTINCT categories FROM service_category_list", conn)
-    conn.close()
-    service_categories = sorted(df_service_categories['categories'].dropna().unique().tolist(), key=lambda x: x.lower())
+    with st.spinner("Loading bill_track_50, provider_alerts and service_category_list from database..."):
+        live = get_live_frames()
 except Exception as e:
-    service_categories = []
+    live = None
+    st.error(f"Error loading tables from database: {e}")
+
+# Fetch service categories for dropdowns
+service_categories = category_options(live.get("service_category_list")[0]) if live is not None else []
 
 # Show warning if service_categories is empty
 if not service_categories:
     st.warning("No service categories found. Please add entries to the service_category_list table below.")
 
-# Load data from database (only once, outside expanders)
-if 'df_bills' not in st.session_state:
-    try:
-        with st.spinner("Loading bill_track_50 table from database..."):
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-            df_bills = pd.read_sql_query("SELECT * FROM bill_track_50", conn)
-            conn.close()
-        if 'Delete?' not in df_bills.columns:
-            df_bills['Delete?'] = False
-        st.session_state['df_bills'] = df_bills
-        st.session_state['df_bills_original'] = df_bills.copy()
-    except Exception as e:
-        st.error(f"Error loading bill_track_50: {e}")
-        st.session_state['df_bills'] = pd.DataFrame()
-        st.session_state['df_bills_original'] = pd.DataFrame()
-
-if 'df_alerts' not in st.session_state:
-    try:
-        with st.spinner("Loading provider_alerts table from database..."):
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-            df_alerts = pd.read_sql_query("SELECT * FROM provider_alerts", conn)
-            conn.close()
-        if 'Delete?' not in df_alerts.columns:
-            df_alerts['Delete?'] = False
-        st.session_state['df_alerts'] = df_alerts
-        st.session_state['df_alerts_original'] = df_alerts.copy()
-    except Exception as e:
-        st.error(f"Error loading provider_alerts: {e}")
-        st.session_state['df_alerts'] = pd.DataFrame()
-        st.session_state['df_alerts_original'] = pd.DataFrame()
-
-if 'df_service_list' not in st.session_state:
-    try:
-        with st.spinner("Loading service_category_list table from database..."):
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-            df_service_list = pd.read_sql_query("SELECT * FROM service_category_list", conn)
-            conn.close()
-        if 'Delete?' not in df_service_list.columns:
-            df_service_list['Delete?'] = False
-        st.session_state['df_service_list'] = df_service_list
-        st.session_state['df_service_list_original'] = df_service_list.copy()
-    except Exception as e:
-        st.error(f"Error loading service_category_list: {e}")
-        st.session_state['df_service_list'] = pd.DataFrame()
-        st.session_state['df_service_list_original'] = pd.DataFrame()
+if live is not None:
+    sync_live_frames(live)
+else:
+    for key in LIVE_TABLES:
+        st.session_state.setdefault(key, pd.DataFrame())
+        st.session_state.setdefault(f'{key}_original', pd.DataFrame())
 
-# Add refresh buttons to reload data from database
-col1, col2, col3 = st.columns(3)
-with col1:
-    if st.button("🔄 Refresh Bills Data", key="refresh_bills"):
-        try:
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-            df_bills = pd.read_sql_query("SELECT * FROM bill_track_50", conn)
-            conn.close()
-            if 'Delete?' not in df_bills.columns:
-                df_bills['Delete?'] = False
-            st.session_state['df_bills'] = df_bills
-            st.session_state['df_bills_original'] = df_bills.copy()
-            st.success("Bills data refreshed!")
-        except Exception as e:
-            st.error(f"Error refreshing bills data: {e}")
+@st.fragment(run_every=LIVE_POLL_SECONDS)
+def live_status():
+    """Rerun the page when a table changed in the database; report the listener's state"""
+    if live is None:
+        return
+    changed, held = [], []
+    for key, (table, editor_key) in LIVE_TABLES.items():
+        if live.get(table)[1] != st.session_state.get(f'{key}_version'):
+            (held if has_pending_edits(editor_key) else changed).append(table)
+    if changed:
+        st.rerun()
+    unwatched = [table for _, (table, _) in LIVE_TABLES.items() if table not in live.notifying]
+    if not live.listening:
+        st.caption(f"🔴 Live updates reconnecting: {live.last_error or 'connection lost'}")
+    elif unwatched:
+        st.caption(f"⚠️ No change triggers on {', '.join(unwatched)}; apply sql/change_notify.sql to keep them live.")
+    else:
+        last = live.last_change_at.strftime('%H:%M:%S') if live.last_change_at else "none yet"
+        st.caption(f"🟢 Live: {live.rows_patched} changed rows patched in, last change {last}")
+    for table in held:
+        st.caption(f"⏸️ {table} changed in the database; save your edits to see the update.")
+    if not live.listening or unwatched:
+        if st.button("🔄 Reload tables", key="reload_live_tables"):
+            live.load_all()
+            st.rerun()
 
-with col2:
-    if st.button("🔄 Refresh Alerts Data", key="refresh_alerts"):
-        try:
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-            df_alerts = pd.read_sql_query("SELECT * FROM provider_alerts", conn)
-            conn.close()
-            if 'Delete?' not in df_alerts.columns:
-                df_alerts['Delete?'] = False
-            st.session_state['df_alerts'] = df_alerts
-            st.session_state['df_alerts_original'] = df_alerts.copy()
-            st.success("Alerts data refreshed!")
-        except Exception as e:
-            st.error(f"Error refreshing alerts data: {e}")
-
-with col3:
-    if st.button("🔄 Refresh Service Categories", key="refresh_service"):
-        try:
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-            df_service_list = pd.read_sql_query("SELECT * FROM service_category_list", conn)
-            conn.close()
-            if 'Delete?' not in df_service_list.columns:
-                df_service_list['Delete?'] = False
-            st.session_state['df_service_list'] = df_service_list
-            st.session_state['df_service_list_original'] = df_service_list.copy()
-            st.success("Service categories refreshed!")
-        except Exception as e:
-            st.error(f"Error refreshing service categories: {e}")
+live_status()
 
 # Add this function near the top of the file, before the expanders
 
@@ -279,10 +389,54 @@ def highlight_is_new(df):
         for _, row in df.iterrows()
     ]
 
+# --- Full-text search over bills and provider alerts (sql/alert_search.sql) ---
+SEARCH_MAX_ROWS = 200
+
+def search_alerts(query):
+    """({'bill': [url_key, ...], 'provider_alert': [id, ...]}, query ms): the best matches, best first"""
+    import time
+    started = time.perf_counter()
+    hits = read_query("SELECT source, key FROM search_alerts(%s, %s)", (query, SEARCH_MAX_ROWS))
+    seconds = time.perf_counter() - started
+    return {source: group['key'].tolist() for source, group in hits.groupby('source', sort=False)}, seconds * 1000
+
+def rows_by_key(df, key_column, keys):
+    """The rows of df under keys, in the order of keys"""
+    positions = pd.Index(df[key_column]).get_indexer_for(keys)
+    return df.iloc[positions[positions >= 0]]
+
+def search_rows(table, key_column, keys):
+    """Just the rows of table under keys, read from the database and typed for editing, in the order of keys"""
+    rows = read_query(f"SELECT * FROM {table} WHERE {key_column} = ANY(%s)", (list(keys),))
+    return rows_by_key(type_alert_table(rows, table, service_categories), key_column, keys)
+
+search_query = st.text_input(
+    "🔍 Search bills and provider alerts",
+    key="alert_search",
+    placeholder='e.g. HB1234, "home health", rate -hospice',
+).strip()
+# Matching rows are read from the database by key, not filtered out of the live frames
+search_frames = None
+if search_query:
+    try:
+        search_hits, search_ms = search_alerts(search_query)
+        bill_hits, alert_hits = len(search_hits.get('bill', [])), len(search_hits.get('provider_alert', []))
+        limited = f"; showing the best {SEARCH_MAX_ROWS}" if bill_hits + alert_hits >= SEARCH_MAX_ROWS else ""
+        st.caption(f"{bill_hits} bills and {alert_hits} provider alerts match ({search_ms:.0f} ms{limited})")
+        search_frames = {
+            'df_bills': search_rows("bill_track_50", "url_key", search_hits.get('bill', [])),
+            'df_alerts': search_rows("provider_alerts", "id", search_hits.get('provider_alert', [])),
+        }
+    except Exception as e:
+        st.error(f"Search failed (is sql/alert_search.sql applied?): {e}")
+
 # --- Editable bills_test_by_dev Table ---
 with st.expander("Edit bill_track_50 Table", expanded=True):
     try:
         df_bills = st.session_state['df_bills']
+        bills_original = st.session_state.get('df_bills_original', pd.DataFrame())
+        if search_frames is not None:
+            df_bills = bills_original = search_frames['df_bills']
         col_bills1, col_bills2 = st.columns(2)
         with col_bills1:
             show_no_service = st.button("Show entries with no service category (bills)", key="show_no_service_bills")
@@ -318,13 +472,11 @@ with st.expander("Edit bill_track_50 Table", expanded=True):
             num_rows="dynamic",
             key="edit_bills_editor",
             use_container_width=True,
-            disabled=['url'],
+            disabled=['url', 'url_key'],
             column_config=column_config if column_config else None
         )
-        st.session_state['df_bills'] = edited_bills
         # Save Changes button
         if st.button("Save Changes to bill_track_50", key="save_bills_changes"):
-            import psycopg2
             import pandas as pd
             try:
                 print("[SAVE] Starting save operation for bill_track_50...")
@@ -332,20 +484,23 @@ with st.expander("Edit bill_track_50 Table", expanded=True):
                 if 'Delete?' in edited_bills.columns:
                     edited_bills = edited_bills.drop(columns=['Delete?'])
                 # Compare to original and only update changed rows
-                original_bills = st.session_state.get('df_bills_original', pd.DataFrame())
+                original_bills = bills_original
                 if 'Delete?' in original_bills.columns:
                     original_bills = original_bills.drop(columns=['Delete?'])
                 changed_rows = []
-                for idx, row in edited_bills.iterrows():
-                    url = row['url']
-                    orig_row = original_bills[original_bills['url'] == url]
-                    if orig_row.empty:
+                # Original rows by int64 url key, so each edited row is one dict lookup
+                from urls import url_keys
+                known = original_bills[original_bills['url'].notna()]
+                originals = dict(zip(url_keys(known['url']), (orig for _, orig in known.iterrows())))
+                edited = edited_bills[edited_bills['url'].notna()]
+                for (idx, row), key in zip(edited.iterrows(), url_keys(edited['url'])):
+                    orig_row = originals.get(key)
+                    if orig_row is None:
                         continue
-                    orig_row = orig_row.iloc[0]
                     # Compare all columns except 'url'
                     changed = False
                     for col in edited_bills.columns:
-                        if col == 'url':
+                        if col in ('url', 'url_key'):
                             continue
                         if pd.isna(row[col]) and pd.isna(orig_row[col]):
                             continue
@@ -362,22 +517,19 @@ with st.expander("Edit bill_track_50 Table", expanded=True):
                     conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
                     cursor = conn.cursor()
                     for idx, row in changed_rows:
-                        update_cols = [col for col in edited_bills.columns if col != 'url']
+                        update_cols = [col for col in edited_bills.columns if col not in ('url', 'url_key')]
                         set_clause = ', '.join([f'"{col}" = %s' for col in update_cols])
-                        values = [row[col] for col in update_cols] + [row['url']]
+                        values = [db_value(row[col]) for col in update_cols] + [db_value(row['url'])]
                         print(f"[SAVE] Updating row {idx} (url={row['url']})")
                         cursor.execute(f"UPDATE bill_track_50 SET {set_clause} WHERE url = %s", values)
                     conn.commit()
                     conn.close()
-                    print(f"[SAVE] Updated {len(changed_rows)} rows. Reloading table...")
+                    print(f"[SAVE] Updated {len(changed_rows)} rows. Patching them into the live table...")
                     st.success(f"Saved {len(changed_rows)} changes to bill_track_50!")
-                    # Reload table from DB
-                    conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-                    df_bills = pd.read_sql_query("SELECT * FROM bill_track_50", conn)
-                    conn.close()
-                    st.session_state['df_bills'] = df_bills
-                    st.session_state['df_bills_original'] = df_bills.copy()
-                    print("[SAVE] Reload complete. Triggering rerun.")
+                    # Re-read just the saved rows
+                    get_live_frames().patch("bill_track_50", [row['url_key'] for _, row in changed_rows])
+                    sync_live_frames(get_live_frames(), force=True)
+                    print("[SAVE] Patch complete. Triggering rerun.")
                     st.rerun()
             except Exception as e:
                 print(f"[SAVE][ERROR] {e}")
@@ -389,6 +541,9 @@ with st.expander("Edit bill_track_50 Table", expanded=True):
 with st.expander("Edit provider_alerts Table", expanded=True):
     try:
         df_alerts = st.session_state['df_alerts']
+        alerts_original = st.session_state.get('df_alerts_original', pd.DataFrame())
+        if search_frames is not None:
+            df_alerts = alerts_original = search_frames['df_alerts']
         col_alerts1, col_alerts2 = st.columns(2)
         with col_alerts1:
             show_no_service_alerts = st.button("Show entries with no service category (alerts)", key="show_no_service_alerts")
@@ -418,19 +573,17 @@ with st.expander("Edit provider_alerts Table", expanded=True):
             num_rows="dynamic",
             key="edit_alerts_editor",
             use_container_width=True,
-            disabled=['id'] if 'id' in df_alerts.columns else [],
+            disabled=[col for col in ('id', 'natural_key') if col in df_alerts.columns],
             column_config=column_config_alerts if column_config_alerts else None
         )
-        st.session_state['df_alerts'] = edited_alerts
         # Save Changes button
         if st.button("Save Changes to provider_alerts", key="save_alerts_changes"):
-            import psycopg2
             import pandas as pd
             try:
                 print("[SAVE] Starting save operation for provider_alerts...")
                 if 'Delete?' in edited_alerts.columns:
                     edited_alerts = edited_alerts.drop(columns=['Delete?'])
-                original_alerts = st.session_state.get('df_alerts_original', pd.DataFrame())
+                original_alerts = alerts_original
                 if 'Delete?' in original_alerts.columns:
                     original_alerts = original_alerts.drop(columns=['Delete?'])
                 changed_rows = []
@@ -444,7 +597,7 @@ with st.expander("Edit provider_alerts Table", expanded=True):
                     orig_row = orig_row.iloc[0]
                     changed = False
                     for col in edited_alerts.columns:
-                        if col == 'id':
+                        if col in ('id', 'natural_key'):
                             continue
                         if pd.isna(row[col]) and pd.isna(orig_row[col]):
                             continue
@@ -461,22 +614,20 @@ with st.expander("Edit provider_alerts Table", expanded=True):
                     conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
                     cursor = conn.cursor()
                     for idx, row in changed_rows:
-                        update_cols = [col for col in edited_alerts.columns if col != 'id']
+                        # natural_key follows the edited columns (set by the table's trigger)
+                        update_cols = [col for col in edited_alerts.columns if col not in ('id', 'natural_key')]
                         set_clause = ', '.join([f'"{col}" = %s' for col in update_cols])
-                        values = [row[col] for col in update_cols] + [row['id']]
+                        values = [db_value(row[col]) for col in update_cols] + [db_value(row['id'])]
                         print(f"[SAVE] Updating row {idx} (id={row['id']})")
                         cursor.execute(f"UPDATE provider_alerts SET {set_clause} WHERE id = %s", values)
                     conn.commit()
                     conn.close()
-                    print(f"[SAVE] Updated {len(changed_rows)} rows. Reloading table...")
+                    print(f"[SAVE] Updated {len(changed_rows)} rows. Patching them into the live table...")
                     st.success(f"Saved {len(changed_rows)} changes to provider_alerts!")
-                    # Reload table from DB
-                    conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-                    df_alerts = pd.read_sql_query("SELECT * FROM provider_alerts", conn)
-                    conn.close()
-                    st.session_state['df_alerts'] = df_alerts
-                    st.session_state['df_alerts_original'] = df_alerts.copy()
-                    print("[SAVE] Reload complete. Triggering rerun.")
+                    # Re-read just the saved rows
+                    get_live_frames().patch("provider_alerts", [row['id'] for _, row in changed_rows])
+                    sync_live_frames(get_live_frames(), force=True)
+                    print("[SAVE] Patch complete. Triggering rerun.")
                     st.rerun()
             except Exception as e:
                 print(f"[SAVE][ERROR] {e}")
@@ -514,14 +665,8 @@ with st.expander("Edit service_category_list Table", expanded=True):
                         conn.commit()
                         conn.close()
                         st.success(f"Added new category: {new_category}")
-                        # Reload table from DB
-                        conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-                        df_service_list = pd.read_sql_query("SELECT * FROM service_category_list", conn)
-                        conn.close()
-                        if 'Delete?' not in df_service_list.columns:
-                            df_service_list['Delete?'] = False
-                        st.session_state['df_service_list'] = df_service_list
-                        st.session_state['df_service_list_original'] = df_service_list.copy()
+                        get_live_frames().patch("service_category_list", [new_category.strip()])
+                        sync_live_frames(get_live_frames(), force=True)
                         st.rerun()
                     except Exception as e:
                         st.error(f"Error adding category: {e}")
@@ -541,15 +686,11 @@ with st.expander("Edit service_category_list Table", expanded=True):
                         pass
             conn.commit()
             conn.close()
-            st.success(f"Saved all changes to service_category_list.")
-            # Reload data from database to refresh session state
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-            df_service_list = pd.read_sql_query("SELECT * FROM service_category_list", conn)
-            conn.close()
-            if 'Delete?' not in df_service_list.columns:
-                df_service_list['Delete?'] = False
-            st.session_state['df_service_list'] = df_service_list
-            st.session_state['df_service_list_original'] = df_service_list.copy()
+            st.success("Saved all changes to service_category_list.")
+            # Re-read the rows just written
+            saved = [row['categories'] for _, row in st.session_state['df_service_list'].iterrows() if row['categories'] and row['categories'].strip()]
+            get_live_frames().patch("service_category_list", saved)
+            sync_live_frames(get_live_frames(), force=True)
             st.rerun()
         
         # Delete checked rows
@@ -564,14 +705,9 @@ with st.expander("Edit service_category_list Table", expanded=True):
             conn.commit()
             conn.close()
             st.success(f"Deleted {len(to_delete)} row(s) from service_category_list.")
-            # Reload data from database to refresh session state
-            conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASS)
-            df_service_list = pd.read_sql_query("SELECT * FROM service_category_list", conn)
-            conn.close()
-            if 'Delete?' not in df_service_list.columns:
-                df_service_list['Delete?'] = False
-            st.session_state['df_service_list'] = df_service_list
-            st.session_state['df_service_list_original'] = df_service_list.copy()
+            # Drop the deleted rows from the live table
+            get_live_frames().patch("service_category_list", [row['categories'] for _, row in to_delete.iterrows() if row['categories']])
+            sync_live_frames(get_live_frames(), force=True)
             st.rerun()
     except Exception as e:
         st.error(f"Error loading or saving service_category_list: {e}") 
\ No newline at end of file
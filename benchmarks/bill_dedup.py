@@ -0,0 +1,238 @@
+"""Bill dedup and url upserts (sql/bill_track_50_dedup.sql, sql/bill_track_50_url_key.sql) against a real Postgres.
+
+    python -m benchmarks.bill_dedup --dsn postgresql://localhost/medirate_dev --rows 20000
+    python -m benchmarks.bill_dedup --embedded /tmp/pgdata     # throwaway server (pip install pgserver)
+
+Seeds bill_track_50 with synthetic bills plus exact url duplicates in a scratch schema and
+times both migration scripts. It checks that:
+  - dedupe_bill_track_50() keeps the most recently extracted row per url, then per url key
+    (trivial url variants), and reports the rows and urls it removed;
+  - the url index is bill_track_50_url_uniq, also after a deployment that still has it as
+    bill_track_50_url_key, and data_processor.remove_duplicates_from_db() renames it too;
+  - an upsert of a url variant on url_key updates the stored bill and a plain insert of
+    one is rejected;
+  - the partial-column upsert data_processor.update_all_columns() sends for changed bills,
+    replayed the way PostgREST runs it (INSERT of the payload's columns ... ON CONFLICT DO
+    UPDATE), updates the stored bills through the url_key trigger and adds no rows.
+The schema is dropped at the end.
+"""
+import argparse
+import os
+import time
+
+SCHEMA = "bill_dedup_bench"
+OLD = "2023-06-01"
+LATEST = "2024-01-01"
+
+
+def _create_table(cursor, rows):
+    from psycopg2.extras import execute_values
+    from benchmarks import synthetic
+    from benchmarks.scenarios import _bill_db_row
+
+    bills = [_bill_db_row(row) for row in synthetic.bill_rows(rows)]
+    columns = [col for col in bills[0] if col != "url_key"]
+    # Every 10th bill was extracted twice before, every 20th once more after (the one to keep)
+    duplicates = [dict(bill, date_extracted=OLD, last_action="older") for bill in bills[::10]]
+    duplicates += [dict(bill, date_extracted=OLD, last_action="older") for bill in bills[::10]]
+    duplicates += [dict(bill, date_extracted="2024-02-01", last_action="newer") for bill in bills[::20]]
+
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path TO {SCHEMA}")
+    cursor.execute(f"CREATE TABLE bill_track_50 ({', '.join(f'{col} text' for col in columns)})")
+    cursor.execute("ALTER TABLE bill_track_50 ALTER date_extracted TYPE date USING date_extracted::date")
+    execute_values(cursor, f"INSERT INTO bill_track_50 ({', '.join(columns)}) VALUES %s",
+                   [[bill[col] for col in columns] for bill in bills + duplicates])
+    return bills, columns, len(duplicates), len(bills[::10])
+
+
+def _indexes(cursor):
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = %s AND tablename = 'bill_track_50'", (SCHEMA,))
+    return sorted(name for (name,) in cursor.fetchall())
+
+
+def _apply(cursor, path):
+    from benchmarks.live_frames import ROOT
+    started = time.perf_counter()
+    with open(os.path.join(ROOT, path)) as f:
+        cursor.execute(f.read())
+    deleted = cursor.fetchone()
+    return deleted, (time.perf_counter() - started) * 1000
+
+
+class _RecordingClient:
+    """Collects the table writes data_processor makes instead of sending them"""
+
+    def __init__(self):
+        self.writes = []
+
+    def table(self, name):
+        return _RecordedQuery(self, name)
+
+
+class _RecordedQuery:
+    def __init__(self, client, table):
+        self._client, self._table = client, table
+
+    def upsert(self, rows, on_conflict=None):
+        self._client.writes.append((self._table, rows, on_conflict))
+        return self
+
+    def delete(self):
+        return self
+
+    def insert(self, rows):
+        return self
+
+    def in_(self, column, values):
+        return self
+
+    def execute(self):
+        return type("Response", (), {"data": []})()
+
+
+def _postgrest_upsert(cursor, table, rows, on_conflict):
+    """Run an upsert as PostgREST does: insert the payload's columns, merge them on conflict"""
+    from psycopg2.extras import execute_values
+    columns = list(rows[0])
+    execute_values(cursor, f"""
+        INSERT INTO {table} ({', '.join(columns)}) VALUES %s
+        ON CONFLICT ({on_conflict}) DO UPDATE SET {', '.join(f'{col} = EXCLUDED.{col}' for col in columns)}
+    """, [[row[col] for col in columns] for row in rows])
+
+
+def _changed_bill_upserts(cursor, bills):
+    """The bill_track_50 upserts update_all_columns() sends when the sheet changes the given bills"""
+    import pandas as pd
+    import data_processor
+    from urls import add_url_key
+
+    cursor.execute("SELECT * FROM bill_track_50 WHERE url_key = ANY(%s)", ([bill["url_key"] for bill in bills],))
+    stored = pd.DataFrame(cursor.fetchall(), columns=[col.name for col in cursor.description]).astype({"date_extracted": str})
+    db_data = add_url_key(data_processor.apply_ingest_schema(stored.drop(columns=["url_key"]), "bill_track_50"))
+    # The sheet lists the bills under a trivial url variant, with a new last action
+    sheet = pd.DataFrame([dict(bill, url=bill["url"].upper() + "/", last_action="changed in sheet") for bill in bills])
+    excel_data = add_url_key(data_processor.apply_ingest_schema(sheet.drop(columns=["url_key"]), "bill_track_50"))
+
+    client = _RecordingClient()
+    data_processor.set_client("supabase", client)
+    try:
+        data_processor.update_all_columns(excel_data, db_data)
+    finally:
+        data_processor.set_client("supabase", None)
+    return [(rows, on_conflict) for table, rows, on_conflict in client.writes if table == "bill_track_50"]
+
+
+def _check(label, passed, detail=""):
+    print(f"  {label:<52} {'yes' if passed else 'NO'}  {detail}")
+    return passed
+
+
+def run(dsn, rows):
+    import psycopg2
+    from psycopg2.extensions import make_dsn
+    import data_processor
+
+    schema_dsn = make_dsn(dsn, options=f"-c search_path={SCHEMA}")
+    conn = psycopg2.connect(schema_dsn)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    bills, columns, duplicate_rows, duplicate_urls = _create_table(cursor, rows)
+    expected_indexes = ["bill_track_50_url_key_uniq", "bill_track_50_url_uniq"]
+    print(f"{len(bills)} bills, {duplicate_rows} duplicate rows over {duplicate_urls} urls")
+
+    ok = True
+    deleted, ms = _apply(cursor, "sql/bill_track_50_dedup.sql")
+    ok &= _check("dedup script removes url duplicates", deleted == (duplicate_rows, duplicate_urls), f"{deleted} in {ms:.0f} ms")
+    cursor.execute("SELECT count(*), count(*) FILTER (WHERE last_action = 'older') FROM bill_track_50")
+    remaining, older = cursor.fetchone()
+    cursor.execute("SELECT count(*) FROM bill_track_50 WHERE last_action = 'newer'")
+    newer = cursor.fetchone()[0]
+    ok &= _check("latest extraction kept per url", (remaining, older, newer) == (len(bills), 0, len(bills[::20])))
+    ok &= _check("url index is bill_track_50_url_uniq", _indexes(cursor) == ["bill_track_50_url_uniq"])
+
+    # A deployment from before the rename, with trivial url variants the url index allows
+    cursor.execute("ALTER INDEX bill_track_50_url_uniq RENAME TO bill_track_50_url_key")
+    variants = [dict(bill, url=bill["url"].upper() + "/", date_extracted=OLD, last_action="variant") for bill in bills[::25]]
+    cursor.executemany(f"INSERT INTO bill_track_50 ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                       [[bill[col] for col in columns] for bill in variants])
+    deleted, ms = _apply(cursor, "sql/bill_track_50_url_key.sql")
+    ok &= _check("url key script removes url variants", deleted == (len(variants), len(variants)), f"{deleted} in {ms:.0f} ms")
+    cursor.execute("SELECT count(*), count(*) FILTER (WHERE last_action = 'variant') FROM bill_track_50")
+    ok &= _check("latest extraction kept per url key", cursor.fetchone() == (len(bills), 0))
+    ok &= _check("old url index renamed, url_key index added", _indexes(cursor) == expected_indexes, str(_indexes(cursor)))
+
+    cursor.execute("ALTER INDEX bill_track_50_url_uniq RENAME TO bill_track_50_url_key")
+    previous_dsn = os.environ.get("DATABASE_URL")
+    os.environ["DATABASE_URL"] = schema_dsn
+    try:
+        result = data_processor.remove_duplicates_from_db()
+    finally:
+        if previous_dsn is None:
+            os.environ.pop("DATABASE_URL", None)
+        else:
+            os.environ["DATABASE_URL"] = previous_dsn
+    ok &= _check("remove_duplicates_from_db on a clean table", result == (0, 0), str(result))
+    ok &= _check("remove_duplicates_from_db renames the old index", _indexes(cursor) == expected_indexes, str(_indexes(cursor)))
+    cursor.execute("SELECT * FROM dedupe_bill_track_50()")
+    ok &= _check("dedupe_bill_track_50() on a clean table", cursor.fetchone() == (0, 0))
+    ok &= _check("indexes unchanged by a rerun", _indexes(cursor) == expected_indexes)
+
+    # Ingest upserts on url_key (on_conflict='url_key'); a variant updates the stored bill
+    bill = bills[0]
+    variant = dict(bill, url=" " + bill["url"].upper() + "#summary", last_action="upserted", date_extracted="2024-03-01")
+    cursor.execute(f"""
+        INSERT INTO bill_track_50 ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})
+        ON CONFLICT (url_key) DO UPDATE SET last_action = EXCLUDED.last_action, date_extracted = EXCLUDED.date_extracted
+    """, [variant[col] for col in columns])
+    cursor.execute("SELECT count(*), max(url), max(last_action) FROM bill_track_50 WHERE url_key = %s", (bill["url_key"],))
+    ok &= _check("url variant upserts onto the stored bill", cursor.fetchone() == (1, bill["url"], "upserted"))
+    cursor.execute(f"INSERT INTO bill_track_50 ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) ON CONFLICT (url) DO NOTHING",
+                   [bill[col] for col in columns])
+    ok &= _check("same url upserts on url", cursor.rowcount == 0)
+    try:
+        cursor.execute(f"INSERT INTO bill_track_50 ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                       [variant[col] for col in columns])
+        rejected = False
+    except psycopg2.errors.UniqueViolation:
+        rejected = True
+    ok &= _check("plain insert of a url variant rejected", rejected)
+    cursor.execute("SELECT count(*) FROM bill_track_50")
+    ok &= _check("one row per bill", cursor.fetchone()[0] == len(bills))
+
+    # Changed bills: update_all_columns() upserts only some columns; the trigger must still
+    # find the stored bill, so the payload has to carry its url
+    changed = bills[1:51]
+    upserts = _changed_bill_upserts(cursor, changed)
+    for rows, on_conflict in upserts:
+        _postgrest_upsert(cursor, "bill_track_50", rows, on_conflict)
+    keys = [bill["url_key"] for bill in changed]
+    cursor.execute("SELECT count(*), count(*) FILTER (WHERE last_action = 'changed in sheet'), count(*) FILTER (WHERE url = ANY(%s)) "
+                   "FROM bill_track_50 WHERE url_key = ANY(%s)", ([bill["url"] for bill in changed], keys))
+    ok &= _check("partial-column update upserts onto the stored bills", len(upserts) == 1 and cursor.fetchone() == (len(changed),) * 3)
+    cursor.execute("SELECT count(*), count(*) FILTER (WHERE url IS NULL OR url_key IS NULL) FROM bill_track_50")
+    ok &= _check("partial-column update adds no rows", cursor.fetchone() == (len(bills), 0))
+
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.close()
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="Postgres to run against (default DATABASE_URL)")
+    parser.add_argument("--embedded", metavar="DIR", help="start a throwaway server in DIR with pgserver instead")
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    dsn = args.dsn
+    if args.embedded:
+        import pgserver
+        dsn = pgserver.get_server(args.embedded, cleanup_mode=None).get_uri()
+    if not dsn:
+        parser.error("pass --dsn, --embedded or set DATABASE_URL")
+    if not run(dsn, args.rows):
+        raise SystemExit("bill dedup checks failed")
+
+
+if __name__ == "__main__":
+    main()
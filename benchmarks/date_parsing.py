@@ -0,0 +1,78 @@
+"""Checks dates.DateParser on messy date columns and times it on a large mixed column.
+
+    python -m benchmarks.date_parsing
+    python -m benchmarks.date_parsing --rows 500000
+
+Each case parses one column with DateParser.parse, as apply_ingest_schema does, and checks the
+resulting dates and the unparseable values reported. Unparseable values must become NaT
+and be reported; no column may make the parse raise. Cases:
+  - one format throughout, plus blanks;
+  - US dates mixed with ISO dates and a value no format parses;
+  - ISO timestamps with different UTC offsets (pandas returns those as an object Series
+    unless parsed in UTC), with a bad value among them;
+  - values that are already datetime64, tz-naive and tz-aware.
+"""
+import argparse
+import time
+
+import pandas as pd
+
+CASES = [
+    ("one format, blanks", ["01/05/2024", "12/31/2023", "", None], ["2024-01-05", "2023-12-31", None, None], 0),
+    ("mixed formats, one unparseable", ["01/05/2024", "2024-02-03", "March 4, 2024", "not a date"],
+     ["2024-01-05", "2024-02-03", "2024-03-04", None], 1),
+    ("mixed UTC offsets, one unparseable",
+     ["2024-01-01T10:00:00+02:00", "2024-01-02T00:00:00Z", "2024-01-01T23:30:00-05:00", "bad", None],
+     ["2024-01-01", "2024-01-02", "2024-01-02", None, None], 1),
+    ("mixed UTC offsets after a US date", ["01/05/2024", "2024-02-03T01:00:00+02:00", "2024-02-03T12:00:00-03:00"],
+     ["2024-01-05", "2024-02-02", "2024-02-03"], 0),
+    ("datetime64, tz-naive", pd.to_datetime(["2024-01-05 13:00", None]), ["2024-01-05", None], 0),
+    ("datetime64, tz-aware", pd.to_datetime(["2024-01-05 23:00"]).tz_localize("America/New_York"), ["2024-01-06"], 0),
+]
+
+
+def _check_case(parser, label, values, expected, unparseable):
+    key = f"check.{label}"
+    try:
+        parsed = parser.parse(pd.Series(values, name="action_date"), key=key)
+        got = [None if pd.isna(value) else f"{value:%Y-%m-%d}" for value in parsed]
+        reported = parser.take_unparseable().get(key, (0, []))[0]
+        passed = str(parsed.dtype) == "datetime64[ns]" and got == expected and reported == unparseable
+        detail = "" if passed else f"got {got} ({parsed.dtype}), {reported} reported"
+    except Exception as e:
+        passed, detail = False, f"raised {type(e).__name__}: {e}"
+    print(f"  {label:<40} {'yes' if passed else 'NO'}  {detail}")
+    return passed
+
+
+def _time_mixed_column(parser, rows):
+    offsets = ["+02:00", "Z", "-05:00", "+05:30"]
+    values = pd.Series([f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}T{i % 24:02d}:00:00{offsets[i % 4]}" for i in range(rows)])
+    started = time.perf_counter()
+    parsed = parser.parse(values, key="timing.mixed_offsets")
+    seconds = time.perf_counter() - started
+    print(f"  {rows} timestamps with mixed UTC offsets parsed in {seconds * 1000:.0f} ms, {int(parsed.isna().sum())} NaT")
+    return parsed.notna().all()
+
+
+def run(rows):
+    from dates import DateParser
+
+    parser = DateParser()
+    ok = True
+    for label, values, expected, unparseable in CASES:
+        ok &= _check_case(parser, label, values, expected, unparseable)
+    ok &= _time_mixed_column(parser, rows)
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000, help="rows in the timed mixed-offset column")
+    args = parser.parse_args(argv)
+    if not run(args.rows):
+        raise SystemExit("date parsing checks failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""In-process stand-ins for Azure Blob Storage, the Supabase table API and Brevo.
+
+They implement only the calls data_processor makes, keep everything in memory, count
+calls, and can add a fixed per-call latency to approximate network round trips. Inject
+them with data_processor.set_client:
+
+    fakes = install_fakes(blobs={...}, tables={...}, latency_ms=5)
+"""
+import json
+import re
+import threading
+import time
+from collections import Counter
+
+import data_processor
+from data_access import ThreadedDataAccess
+
+
+class CallStats:
+    """Thread-safe call and payload counters shared by the fakes"""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self._lock = threading.Lock()
+        self.calls = Counter()
+        self.rows = Counter()
+        self.bytes = Counter()
+
+    def record(self, key, rows=0, nbytes=0):
+        with self._lock:
+            self.calls[key] += 1
+            self.rows[key] += rows
+            self.bytes[key] += nbytes
+        if self.latency:
+            time.sleep(self.latency)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "rows": {key: value for key, value in self.rows.items() if value},
+                "bytes": {key: value for key, value in self.bytes.items() if value},
+            }
+
+
+# ----------------------------------------------------------------------------
+# Azure Blob Storage
+# ----------------------------------------------------------------------------
+
+class _FakeDownload:
+    def __init__(self, content):
+        self._content = content
+
+    def readall(self):
+        return self._content
+
+
+class FakeBlobClient:
+    def __init__(self, service, container, name):
+        self._service = service
+        self.container_name = container
+        self.blob_name = name
+
+    def exists(self):
+        self._service.stats.record("blob.exists")
+        return (self.container_name, self.blob_name) in self._service.blobs
+
+    def download_blob(self):
+        content = self._service.blobs[(self.container_name, self.blob_name)]
+        self._service.stats.record("blob.download", nbytes=len(content))
+        return _FakeDownload(content)
+
+    def upload_blob(self, data, overwrite=False):
+        key = (self.container_name, self.blob_name)
+        if key in self._service.blobs and not overwrite:
+            raise FileExistsError(self.blob_name)
+        content = data if isinstance(data, bytes) else data.read()
+        self._service.blobs[key] = content
+        self._service.stats.record("blob.upload", nbytes=len(content))
+
+
+class FakeBlobServiceClient:
+    def __init__(self, stats, blobs=None):
+        self.stats = stats
+        self.blobs = dict(blobs or {})
+
+    def get_blob_client(self, container, blob):
+        return FakeBlobClient(self, container, blob)
+
+
+# ----------------------------------------------------------------------------
+# Supabase (PostgREST) table API
+# ----------------------------------------------------------------------------
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+def _like_to_regex(pattern):
+    return re.compile("^" + ".*".join(re.escape(part) for part in pattern.split("%")) + "$", re.IGNORECASE | re.DOTALL)
+
+
+class FakeQuery:
+    """Chainable builder mirroring the subset of postgrest-py used by data_processor"""
+
+    def __init__(self, db, table):
+        self._db = db
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._payload = None
+        self._on_conflict = None
+        self._filters = []
+        self._order = None
+        self._limit = None
+
+    # --- operations ---
+    def select(self, columns="*", count=None):
+        self._op, self._columns = "select", columns
+        return self
+
+    def insert(self, rows):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self._op, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, values):
+        if not isinstance(values, dict):
+            raise TypeError("update() expects a single dict of column values")
+        self._op, self._payload = "update", values
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    # --- filters ---
+    def eq(self, column, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self._filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def gt(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def gte(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def lt(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def is_(self, column, value):
+        expected = None if value in (None, "null") else value
+        self._filters.append(lambda row: row.get(column) is expected)
+        return self
+
+    def ilike(self, column, pattern):
+        regex = _like_to_regex(pattern)
+        self._filters.append(lambda row: row.get(column) is not None and bool(regex.match(str(row.get(column)))))
+        return self
+
+    def order(self, column, desc=False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    # --- execution ---
+    def _matches(self, row):
+        return all(f(row) for f in self._filters)
+
+    def _project(self, row):
+        if self._columns.strip() == "*":
+            return dict(row)
+        return {column.strip(): row.get(column.strip()) for column in self._columns.split(",")}
+
+    def execute(self):
+        if self._payload is not None:
+            # postgrest-py sends the payload as JSON; values json.dumps rejects fail here too
+            self._payload = json.loads(json.dumps(self._payload))
+        with self._db.lock:
+            rows = self._db.tables.setdefault(self._table, [])
+            if self._op == "select":
+                data = [row for row in rows if self._matches(row)]
+                if self._order:
+                    column, desc = self._order
+                    data.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+                if self._limit is not None:
+                    data = data[:self._limit]
+                data = [self._project(row) for row in data]
+            elif self._op == "insert":
+                payload = self._payload if isinstance(self._payload, list) else [self._payload]
+                data = [dict(row) for row in payload]
+                rows.extend(data)
+            elif self._op == "upsert":
+                payload = self._payload if isinstance(self._payload, list) else [self._payload]
+                keys = [key.strip() for key in (self._on_conflict or "id").split(",")]
+                index = {tuple(row.get(key) for key in keys): row for row in rows}
+                data = []
+                for new_row in payload:
+                    existing = index.get(tuple(new_row.get(key) for key in keys))
+                    if existing is None:
+                        existing = dict(new_row)
+                        rows.append(existing)
+                        index[tuple(new_row.get(key) for key in keys)] = existing
+                    else:
+                        existing.update(new_row)
+                    data.append(dict(existing))
+            elif self._op == "update":
+                data = []
+                for row in rows:
+                    if self._matches(row):
+                        row.update(self._payload)
+                        data.append(dict(row))
+            elif self._op == "delete":
+                data = [row for row in rows if self._matches(row)]
+                self._db.tables[self._table] = [row for row in rows if not self._matches(row)]
+            else:
+                raise ValueError(f"unsupported operation {self._op}")
+        self._db.stats.record(f"db.{self._table}.{self._op}", rows=len(data))
+        return FakeResponse(data)
+
+
+class FakeSupabase:
+    """Stands in for supabase.Client: tables are lists of dict rows"""
+
+    def __init__(self, stats, tables=None):
+        self.stats = stats
+        self.lock = threading.RLock()
+        self.tables = {name: [dict(row) for row in rows] for name, rows in (tables or {}).items()}
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return FakeRpc(self, name, params or {})
+
+
+class FakeRpc:
+    """The SQL functions data_processor calls through supabase.rpc, in Python"""
+
+    def __init__(self, db, name, params):
+        self._db, self._name, self._params = db, name, params
+
+    def execute(self):
+        with self._db.lock:
+            if self._name == "dedupe_bill_track_50":
+                rows = self._db.tables.setdefault("bill_track_50", [])
+                latest = {}
+                for row in rows:
+                    key = row.get("url_key")
+                    if key is None:
+                        continue
+                    kept = latest.get(key)
+                    if kept is None or str(row.get("date_extracted") or "") > str(kept.get("date_extracted") or ""):
+                        latest[key] = row
+                kept_ids = {id(row) for row in latest.values()}
+                deleted = [row for row in rows if row.get("url_key") is not None and id(row) not in kept_ids]
+                self._db.tables["bill_track_50"] = [row for row in rows if row.get("url_key") is None or id(row) in kept_ids]
+                data = [{"deleted_rows": len(deleted), "duplicate_urls": len({row["url_key"] for row in deleted})}]
+            else:
+                raise ValueError(f"unsupported rpc {self._name}")
+        self._db.stats.record(f"db.rpc.{self._name}", rows=len(data))
+        return FakeResponse(data)
+
+
+# ----------------------------------------------------------------------------
+# Brevo TransactionalEmailsApi
+# ----------------------------------------------------------------------------
+
+class FakeTransactionalEmailsApi:
+    """Accepts every message and keeps its recipient and HTML size"""
+
+    def __init__(self, stats, fail_every=0):
+        self.stats = stats
+        self.fail_every = fail_every
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send_transac_email(self, email):
+        html = getattr(email, "html_content", "") or ""
+        with self._lock:
+            attempt = len(self.sent) + 1
+            if self.fail_every and attempt % self.fail_every == 0:
+                self.sent.append(None)
+                raise RuntimeError("simulated Brevo failure")
+            self.sent.append((email.to[0]["email"], len(html.encode("utf-8"))))
+        self.stats.record("email.send", nbytes=len(html.encode("utf-8")))
+        return {"messageId": f"<fake-{attempt}@medirate.test>"}
+
+
+class Fakes:
+    def __init__(self, stats, blob_service, supabase, email_api):
+        self.stats = stats
+        self.blob_service = blob_service
+        self.supabase = supabase
+        self.email_api = email_api
+
+
+def install_fakes(blobs=None, tables=None, latency_ms=0.0, email_fail_every=0):
+    """Create fakes and register them as data_processor's memoized clients"""
+    stats = CallStats(latency_ms)
+    container = data_processor.get_container_name()
+    fakes = Fakes(
+        stats,
+        FakeBlobServiceClient(stats, {(container, name): content for name, content in (blobs or {}).items()}),
+        FakeSupabase(stats, tables),
+        FakeTransactionalEmailsApi(stats, email_fail_every),
+    )
+    data_processor.set_client("blob_service", fakes.blob_service)
+    data_processor.set_client("supabase", fakes.supabase)
+    data_processor.set_client("email_api", fakes.email_api)
+    data_processor.set_client("data_access", ThreadedDataAccess(data_processor.get_supabase))
+    return fakes
+
+
+def uninstall_fakes():
+    data_access = data_processor._clients.get("data_access")
+    if isinstance(data_access, ThreadedDataAccess):
+        data_access.close()
+    for name in ("blob_service", "supabase", "email_api", "data_access"):
+        data_processor.set_client(name, None)
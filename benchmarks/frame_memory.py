@@ -0,0 +1,66 @@
+"""Memory of the ingest and diff DataFrames as read (all object columns) and with the ingest schema.
+
+    python -m benchmarks.frame_memory                       # 10k and 100k rows
+    python -m benchmarks.frame_memory --rows 1000,250000
+
+Builds the bill and provider-alert sheets from the synthetic generators the way
+pd.read_excel(..., dtype=str) returns them, plus the bill_track_50 rows the diff fetches,
+and reports memory_usage(deep=True) before and after schema.apply_schema, with the
+largest columns.
+"""
+import argparse
+import time
+
+import pandas as pd
+
+
+def _frames(rows):
+    from benchmarks import synthetic
+    from benchmarks.scenarios import _bill_db_row
+
+    bills = pd.DataFrame(list(synthetic.bill_rows(rows)), columns=synthetic.BILL_HEADERS, dtype=str)
+    bills.columns = pd.io.common.dedup_names(list(bills.columns), is_potential_multiindex=False)  # .1/.2/.3 like read_excel
+    alerts = pd.DataFrame(list(synthetic.provider_alert_rows(rows)), columns=synthetic.PROVIDER_ALERT_HEADERS, dtype=str)
+    db_bills = pd.DataFrame([_bill_db_row(row) for row in synthetic.bill_rows(rows)])
+    return (("bill sheet", "bill_track_50", bills), ("provider alert sheet", "provider_alerts", alerts),
+            ("bill_track_50 rows", "bill_track_50", db_bills))
+
+
+def measure(rows, top=3):
+    from dates import DateParser
+    from schema import apply_schema, memory_mb
+
+    results = []
+    for label, table, df in _frames(rows):
+        before = memory_mb(df)
+        before_columns = df.memory_usage(deep=True, index=False)
+        parser = DateParser()
+        started = time.perf_counter()
+        typed = apply_schema(df.copy(), table, parse_dates=lambda values, col: parser.parse(values, key=col))
+        seconds = time.perf_counter() - started
+        after = memory_mb(typed)
+        after_columns = typed.memory_usage(deep=True, index=False)
+        largest = before_columns.sort_values(ascending=False).index[:top]
+        results.append({
+            "frame": label, "rows": rows, "before_mb": round(before, 2), "after_mb": round(after, 2),
+            "seconds": round(seconds, 3),
+            "columns": {col: (round(before_columns[col] / 2**20, 2), round(after_columns[col] / 2**20, 2)) for col in largest},
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,100000", help="comma separated row counts")
+    args = parser.parse_args(argv)
+
+    print(f"{'frame':<22} {'rows':>8} {'before_mb':>10} {'after_mb':>9} {'saved':>7} {'convert_s':>10}  largest columns (before -> after MB)")
+    for rows in (int(value) for value in args.rows.split(",")):
+        for result in measure(rows):
+            saved = 1 - result["after_mb"] / result["before_mb"] if result["before_mb"] else 0
+            columns = ", ".join(f"{col} {before}->{after}" for col, (before, after) in result["columns"].items())
+            print(f"{result['frame']:<22} {rows:>8} {result['before_mb']:>10.1f} {result['after_mb']:>9.1f} {saved:>7.0%} {result['seconds']:>10.2f}  {columns}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Import-time benchmark for the modules loaded on every Streamlit rerun and worker start.
+
+    python -m benchmarks.importtime                    # report
+    python -m benchmarks.importtime --budget-ms 800    # also fail if over budget
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter, reports the
+cumulative import time and the slowest packages, and fails if any SDK that is meant
+to be loaded lazily shows up at import time.
+"""
+import argparse
+import subprocess
+import sys
+
+# Packages that must not be imported just by importing data_processor
+LAZY_PACKAGES = ("streamlit", "azure", "supabase", "sib_api_v3_sdk", "dotenv")
+
+
+def measure(module, runs=3):
+    """Return (best total microseconds, {top-level package: cumulative microseconds}) over runs"""
+    best_total, best_packages = None, {}
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+        total, packages = 0, {}
+        for line in proc.stderr.splitlines():
+            # "import time:   self [us] | cumulative | imported package", nesting shown by indent
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            name = name.strip()
+            cumulative = int(cumulative)
+            if depth == 0 and name == module:
+                total = cumulative
+            # Direct imports of the module, grouped by top-level package
+            elif depth == 1:
+                package = name.split(".")[0]
+                packages[package] = packages.get(package, 0) + cumulative
+            elif name.split(".")[0] in LAZY_PACKAGES:
+                packages.setdefault(name.split(".")[0], 0)
+        if best_total is None or total < best_total:
+            best_total, best_packages = total, packages
+    return best_total, best_packages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="data_processor")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if the import takes longer than this")
+    args = parser.parse_args(argv)
+
+    total, packages = measure(args.module, args.runs)
+    print(f"import {args.module}: {total / 1000:.1f} ms (best of {args.runs})")
+    for name, cumulative in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    eager = [name for name in packages if name in LAZY_PACKAGES]
+    if eager:
+        print(f"❌ Imported eagerly but expected to be lazy: {', '.join(sorted(eager))}")
+        failed = True
+    if args.budget_ms is not None and total / 1000 > args.budget_ms:
+        print(f"❌ Over budget: {total / 1000:.1f} ms > {args.budget_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""Live dashboard frames against a real Postgres: change latency and correctness vs full reloads.
+
+    python -m benchmarks.live_frames --dsn postgresql://localhost/medirate_dev --rows 10000
+    python -m benchmarks.live_frames --embedded /tmp/pgdata     # throwaway server (pip install pgserver)
+
+Creates bill_track_50, provider_alerts and service_category_list in a scratch schema,
+applies sql/bill_track_50_dedup.sql, sql/bill_track_50_url_key.sql,
+sql/provider_alerts_natural_key.sql and sql/change_notify.sql, seeds synthetic rows and starts live_frames.LiveFrames. Then it
+updates, inserts, upserts and deletes rows from another connection and after each step
+reports how long the change took to reach the frame. It checks the patched frame equals a
+full reload and reports the time a full reload takes instead. The schema is dropped at the end.
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+SCHEMA = "live_frames_bench"
+SQL_FILES = ("sql/bill_track_50_dedup.sql", "sql/bill_track_50_url_key.sql", "sql/provider_alerts_natural_key.sql",
+             "sql/change_notify.sql")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _create_tables(cursor, rows, schema=SCHEMA):
+    from psycopg2.extras import execute_values
+    from benchmarks import synthetic
+    from benchmarks.scenarios import _bill_db_row
+
+    bills = [_bill_db_row(row) for row in synthetic.bill_rows(rows)]
+    bill_columns = [col for col in bills[0] if col != "url_key"]
+    alerts = list(synthetic.provider_alert_rows(max(rows // 10, 10)))
+    alert_columns = ["state", "subject", "announcement_date", "links", "summary", "service_lines_impacted",
+                     "service_lines_impacted_1", "service_lines_impacted_2", "service_lines_impacted_3", "is_new"]
+
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}; SET search_path TO {schema}")
+    cursor.execute(f"CREATE TABLE bill_track_50 ({', '.join(f'{col} text' for col in bill_columns)})")
+    cursor.execute("ALTER TABLE bill_track_50 ALTER date_extracted TYPE date USING date_extracted::date")
+    cursor.execute(f"CREATE TABLE provider_alerts (id bigserial PRIMARY KEY, {', '.join(f'{col} text' for col in alert_columns)})")
+    cursor.execute("CREATE TABLE service_category_list (categories text PRIMARY KEY)")
+    execute_values(cursor, f"INSERT INTO bill_track_50 ({', '.join(bill_columns)}) VALUES %s",
+                   [[bill[col] for col in bill_columns] for bill in bills])
+    execute_values(cursor, f"INSERT INTO provider_alerts ({', '.join(alert_columns)}) VALUES %s",
+                   [alert[1:] + ["no"] for alert in alerts])
+    execute_values(cursor, "INSERT INTO service_category_list (categories) VALUES %s",
+                   [[category] for category in synthetic.SERVICE_CATEGORIES])
+    for path in SQL_FILES:
+        with open(os.path.join(ROOT, path)) as f:
+            cursor.execute(f.read())
+
+
+def _transform(df, table, frames):
+    from schema import TABLE_SCHEMAS, apply_schema
+    if table in TABLE_SCHEMAS:
+        categories = frames.get("service_category_list", pd.DataFrame(columns=["categories"]))["categories"]
+        from data_processor import SERVICE_LINE_COLUMNS
+        apply_schema(df, table, categories={col: list(categories) for col in SERVICE_LINE_COLUMNS})
+    return df
+
+
+def _same(frame, fresh, key_column):
+    """frame and a full reload hold the same rows (compared as text, by key)"""
+    def text(df):
+        return df.astype(str).sort_values(key_column).reset_index(drop=True)[sorted(df.columns)]
+    return len(frame) == len(fresh) and text(frame).equals(text(fresh))
+
+
+def run(dsn, rows, debounce=0.05):
+    import psycopg2
+    from live_frames import TABLE_KEYS, LiveFrames
+
+    options = f"-c search_path={SCHEMA}"
+    admin = psycopg2.connect(dsn, options=options)
+    admin.autocommit = True
+    cursor = admin.cursor()
+    _create_tables(cursor, rows)
+
+    def read(sql, params=None):
+        conn = psycopg2.connect(dsn, options=options)
+        try:
+            return pd.read_sql_query(sql, conn, params=params)
+        finally:
+            conn.close()
+
+    live = LiveFrames(read, lambda: psycopg2.connect(dsn, options=options), transform=_transform, debounce=debounce)
+    started = time.perf_counter()
+    live.start()
+    load_seconds = time.perf_counter() - started
+    print(f"loaded {', '.join(f'{table} ({len(live.get(table)[0])} rows)' for table in TABLE_KEYS)} in {load_seconds:.2f}s; "
+          f"triggers on: {', '.join(sorted(live.notifying)) or 'none'}")
+
+    steps = [
+        ("update 10 bills", "bill_track_50",
+         "UPDATE bill_track_50 SET name = name || ' (amended)' WHERE url IN (SELECT url FROM bill_track_50 ORDER BY url LIMIT 10)"),
+        ("insert 5 bills", "bill_track_50",
+         "INSERT INTO bill_track_50 (url, name, state, is_new) SELECT 'https://bills.example/new/' || g, 'new bill', 'CA', 'yes' FROM generate_series(1, 5) g"),
+        ("upsert 2 bills", "bill_track_50",
+         "INSERT INTO bill_track_50 (url, name) VALUES ('https://bills.example/new/1', 'renamed'), ('https://bills.example/new/6', 'sixth') "
+         "ON CONFLICT (url_key) DO UPDATE SET name = EXCLUDED.name"),
+        ("delete 3 bills", "bill_track_50",
+         "DELETE FROM bill_track_50 WHERE url IN (SELECT url FROM bill_track_50 ORDER BY url DESC LIMIT 3)"),
+        ("change a bill url", "bill_track_50",
+         "UPDATE bill_track_50 SET url = 'https://bills.example/moved' WHERE url = 'https://bills.example/new/2'"),
+        ("update 20 provider alerts", "provider_alerts",
+         "UPDATE provider_alerts SET is_new = 'yes' WHERE id IN (SELECT id FROM provider_alerts ORDER BY id LIMIT 20)"),
+        ("upsert 2 provider alerts", "provider_alerts",
+         "INSERT INTO provider_alerts (state, subject, announcement_date, links, summary, is_new) "
+         "SELECT state, subject, announcement_date, links, 'revised', 'no' FROM provider_alerts WHERE id = 1 "
+         "UNION ALL SELECT 'CA', 'A new alert', '2025-01-01', 'https://medicaid.example.gov/new', 'new', 'yes' "
+         "ON CONFLICT (natural_key) DO UPDATE SET summary = EXCLUDED.summary"),
+        ("add a category", "service_category_list",
+         "INSERT INTO service_category_list (categories) VALUES ('TELEHEALTH')"),
+        ("use the new category", "bill_track_50",
+         "UPDATE bill_track_50 SET service_lines_impacted = 'TELEHEALTH' WHERE url = 'https://bills.example/moved'"),
+    ]
+    ok = True
+    print(f"{'step':<26} {'latency_ms':>10} {'reload_ms':>10}  matches reload")
+    for label, table, sql in steps:
+        _, version = live.get(table)
+        started = time.perf_counter()
+        cursor.execute(sql)
+        while live.get(table)[1] == version and time.perf_counter() - started < 10:
+            time.sleep(0.002)
+        latency = time.perf_counter() - started
+        started = time.perf_counter()
+        fresh = _transform(read(f"SELECT * FROM {table}"), table, live.frames)
+        reload_seconds = time.perf_counter() - started
+        same = _same(live.get(table)[0], fresh, TABLE_KEYS[table][0])
+        ok = ok and same
+        print(f"{label:<26} {latency * 1000:>10.1f} {reload_seconds * 1000:>10.1f}  {'yes' if same else 'NO'}")
+
+    live.stop()
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    admin.close()
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="Postgres to run against (default DATABASE_URL)")
+    parser.add_argument("--embedded", metavar="DIR", help="start a throwaway server in DIR with pgserver instead")
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    dsn = args.dsn
+    if args.embedded:
+        import pgserver
+        dsn = pgserver.get_server(args.embedded, cleanup_mode=None).get_uri()
+    if not dsn:
+        parser.error("pass --dsn, --embedded or set DATABASE_URL")
+    if not run(dsn, args.rows):
+        raise SystemExit("live frames diverged from a full reload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""End-to-end scenario benchmarks against in-process fakes (no Azure, Supabase or Brevo).
+
+    python -m benchmarks.scenarios                              # all scenarios at 1k/10k/100k rows
+    python -m benchmarks.scenarios --scenario notify --rows 1000,10000 --latency-ms 5
+    python -m benchmarks.scenarios --scenario notify_sharded --shards 4 --rows 10000
+    python -m benchmarks.scenarios --scenario notify --transport file        # real .eml output
+    python -m benchmarks.scenarios --scenario notify --transport smtp --smtp-port 0   # in-process aiosmtpd
+    python -m benchmarks.scenarios --json bench.json
+    python -m benchmarks.scenarios --scenario bill_track --rows 100000 --profile profiles   # save profiling artifacts
+
+Each (scenario, rows) case runs in a fresh spawned process so peak RSS is per case.
+Reported: wall time, current and peak RSS, fake-service call counts and the run metrics.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+SCENARIOS = ("bill_track", "provider_alerts", "notify", "notify_sharded")
+DEFAULT_ROWS = (1000, 10000, 100000)
+
+
+def _rss_mb():
+    """Current resident set size in MB (Linux /proc; falls back to peak elsewhere)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _bill_db_row(row, is_new="no"):
+    """Convert a synthetic sheet row into a bill_track_50 record (url_key as the DB trigger sets it)"""
+    from urls import url_key
+    (url, bill_number, state, name, bill_progress, last_action, action_date,
+     sponsor_list, ai_summary, created, *service_lines) = row
+    month, day, year = action_date.split("/")
+    record = {
+        "url": url, "url_key": url_key(url), "bill_number": bill_number, "state": state, "name": name,
+        "bill_progress": bill_progress, "last_action": last_action, "action_date": f"{year}-{month}-{day}",
+        "sponsor_list": sponsor_list, "ai_summary": ai_summary, "created": created,
+        "date_extracted": "2024-01-01", "is_new": is_new,
+    }
+    for column, value in zip(["service_lines_impacted", "service_lines_impacted_1", "service_lines_impacted_2", "service_lines_impacted_3"], service_lines):
+        record[column] = value
+    return record
+
+
+def _provider_alert_db_row(row, is_new="no"):
+    """Convert a synthetic sheet row into a provider_alerts record (natural_key as the DB trigger sets it)"""
+    from benchmarks.synthetic import PROVIDER_ALERT_HEADERS
+    from data_processor import provider_alert_key
+    record = dict(zip(PROVIDER_ALERT_HEADERS, row))
+    record["id"] = int(record["id"])
+    record["natural_key"] = provider_alert_key(record)
+    record["is_new"] = is_new
+    return record
+
+
+def _users(count, seed=0):
+    from benchmarks.synthetic import SERVICE_CATEGORIES
+    from data_processor import US_STATE_MAP
+    rng = random.Random(seed)
+    states = list(US_STATE_MAP)
+    return [
+        {
+            "user_email": f"user{i}@medirate.test",
+            "preferences": {
+                "states": rng.sample(states, rng.randint(1, 8)),
+                "categories": rng.sample(SERVICE_CATEGORIES, rng.randint(1, 5)),
+            },
+            "updated_at": f"2024-01-01T00:00:{i % 60:02d}",
+        }
+        for i in range(count)
+    ]
+
+
+def _notify_tables(rows, users):
+    from benchmarks import synthetic
+    return {
+        "bill_track_50": [_bill_db_row(row, is_new="yes") for row in synthetic.bill_rows(rows)],
+        "provider_alerts": [_provider_alert_db_row(row, is_new="yes") for row in synthetic.provider_alert_rows(rows // 10)],
+        "user_email_preferences": _users(users),
+    }
+
+
+def _install_shard_worker(rows, users, latency_ms, outbox_path):
+    """Process pool initializer for notify_sharded: the same synthetic tables in every worker.
+
+    outbox_path=None keeps the default outbox (in Postgres when DATABASE_URL is set).
+    """
+    from benchmarks.fakes import install_fakes
+    import data_processor
+    from outbox import EmailOutbox
+    install_fakes(tables=_notify_tables(rows, users), latency_ms=latency_ms)
+    if outbox_path is not None:
+        data_processor.set_client("outbox", EmailOutbox(outbox_path))
+    data_processor.set_log_sink(lambda record: None)
+    sys.stdout = open(os.devnull, "w")  # send_email_notification's debug prints
+
+
+def _prepare(scenario, rows, workdir, existing_fraction, users, latency_ms=0.0, shards=4):
+    """Build the fake blobs and tables for one case; returns (blobs, tables, runner)"""
+    from benchmarks import synthetic
+    import data_processor
+
+    existing = int(rows * existing_fraction)
+    if scenario == "bill_track":
+        path = synthetic.write_bill_workbook(workdir, rows)
+        db_rows = []
+        for i, row in enumerate(synthetic.bill_rows(existing)):
+            record = _bill_db_row(row)
+            if i % 10 == 0:
+                record["bill_progress"] = "Introduced"  # stale copy, so the diff finds updates
+            if i % 20 == 0:
+                db_rows.append(dict(record, date_extracted="2023-12-01"))  # older duplicate, removed by the dedup
+            if i % 40 == 0:
+                record["url"] = record["url"].upper() + "/"  # stored as a trivial variant; still the same bill
+            db_rows.append(record)
+        with open(path, "rb") as f:
+            blobs = {os.path.basename(path): f.read()}
+        return blobs, {"bill_track_50": db_rows, "provider_alerts": []}, lambda: data_processor.process_bill_track(notify=False)
+    if scenario == "provider_alerts":
+        path = synthetic.write_provider_alerts_workbook(workdir, rows)
+        db_rows = []
+        for i, row in enumerate(synthetic.provider_alert_rows(existing)):
+            record = _provider_alert_db_row(row)
+            if i % 10 == 0:
+                record["summary"] = "Superseded summary."  # stale copy, so the diff finds updates
+            db_rows.append(record)
+        with open(path, "rb") as f:
+            blobs = {os.path.basename(path): f.read()}
+        return blobs, {"provider_alerts": db_rows, "bill_track_50": []}, data_processor.process_provider_alerts
+    if scenario == "notify":
+        return {}, _notify_tables(rows, users), lambda: data_processor.send_email_notification(rows)
+    if scenario == "notify_sharded":
+        from pipeline import run_sharded_notify
+        initargs = (rows, users, latency_ms, os.path.join(workdir, "email_outbox.sqlite3"))
+        return {}, {}, lambda: run_sharded_notify(shards, shards, initializer=_install_shard_worker, initargs=initargs)
+    raise ValueError(f"unknown scenario {scenario}")
+
+
+def _start_smtp_sink():
+    """Start an in-process aiosmtpd server that discards mail; returns (controller, port)"""
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.handlers import Sink
+    controller = Controller(Sink(), hostname="127.0.0.1", port=0)
+    controller.start()
+    return controller, controller.server.sockets[0].getsockname()[1]
+
+
+def _install_transport(transport, workdir, smtp_host, smtp_port):
+    """Replace the mail transport for one case; 'fake' keeps Brevo pointed at the fake API"""
+    import data_processor
+    import transports
+    if transport == "fake":
+        data_processor.set_client("mail_transport", None)
+        return None
+    if transport == "file":
+        data_processor.set_client("mail_transport", transports.FileSinkTransport(data_processor.MAIL_SENDER, os.path.join(workdir, "mail")))
+        return None
+    controller = None
+    if not smtp_port:
+        controller, smtp_port = _start_smtp_sink()
+    data_processor.set_client("mail_transport", transports.SmtpTransport(data_processor.MAIL_SENDER, smtp_host, smtp_port))
+    return controller
+
+
+def run_case(scenario, rows, latency_ms=0.0, existing_fraction=0.9, users=200, shards=4,
+             transport="fake", smtp_host="127.0.0.1", smtp_port=0, profile_dir=None, sample_only=False):
+    """Run one scenario in the current process and return its measurements"""
+    from benchmarks.fakes import install_fakes
+    import data_processor
+    from data_processor import set_log_sink
+    from metrics import metrics_run
+    from outbox import EmailOutbox
+    from profiling import profile_run
+
+    levels = {}
+
+    def count_levels(record):
+        levels[record.level] = levels.get(record.level, 0) + 1
+
+    with tempfile.TemporaryDirectory(prefix="medirate-bench-") as workdir:
+        blobs, tables, runner = _prepare(scenario, rows, workdir, existing_fraction, users, latency_ms, shards)
+        fakes = install_fakes(blobs=blobs, tables=tables, latency_ms=latency_ms)
+        data_processor.set_client("outbox", EmailOutbox(os.path.join(workdir, "email_outbox.sqlite3")))
+        smtp_server = _install_transport(transport, workdir, smtp_host, smtp_port)
+        set_log_sink(count_levels)
+        previous_cwd = os.getcwd()
+        os.chdir(workdir)  # download_file writes next to the working directory
+        rss_before = _rss_mb()
+        try:
+            with profile_run(scenario, enabled=profile_dir is not None, directory=os.path.abspath(profile_dir or "."),
+                             deterministic=not sample_only) as profile, \
+                    metrics_run(scenario) as run, contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                outcome = runner()
+                wall = time.perf_counter() - started
+            if profile is not None:
+                profile.write()
+        finally:
+            os.chdir(previous_cwd)
+            set_log_sink(None)
+            data_processor.set_client("outbox", None)
+            transport_stats = data_processor.get_mail_transport().stats.summary()
+            data_processor.get_mail_transport().close()
+            data_processor.set_client("mail_transport", None)
+            if smtp_server is not None:
+                smtp_server.stop()
+
+    return {
+        "scenario": scenario,
+        "rows": rows,
+        "latency_ms": latency_ms,
+        "outcome": outcome,
+        "wall_seconds": round(wall, 3),
+        "rows_per_second": round(rows / wall, 1) if wall else None,
+        "rss_before_mb": round(rss_before, 1),
+        "rss_after_mb": round(_rss_mb(), 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "log_levels": levels,
+        "fake_calls": fakes.stats.to_dict(),
+        # Sharded runs send from worker processes, each with its own transport
+        "emails_sent": outcome["emails_sent"] if scenario == "notify_sharded" else run.to_dict()["counters"].get("emails_sent", 0),
+        "transport": transport_stats,
+        "metrics": run.to_dict(),
+        "profile": profile.directory if profile is not None else None,
+    }
+
+
+def _print_row(result):
+    calls = sum(result["fake_calls"]["calls"].values())
+    errors = result["log_levels"].get("error", 0)
+    print(
+        f"{result['scenario']:<16} {result['rows']:>8} {result['wall_seconds']:>9.2f} "
+        f"{result['rss_after_mb']:>9.1f} {result['peak_rss_mb']:>9.1f} {calls:>7} "
+        f"{result['emails_sent']:>7} {errors:>6} {result['transport']['messages_per_second'] or 0:>8.1f} "
+        f"{result['transport']['latency_p95_ms'] or 0:>7.2f}",
+        flush=True,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable; default: all")
+    parser.add_argument("--rows", default=",".join(str(rows) for rows in DEFAULT_ROWS), help="comma separated row counts")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated latency per fake service call")
+    parser.add_argument("--existing-fraction", type=float, default=0.9, help="share of sheet rows already in the DB")
+    parser.add_argument("--users", type=int, default=200, help="recipients for the notify scenario")
+    parser.add_argument("--shards", type=int, default=4, help="shards and worker processes for notify_sharded")
+    parser.add_argument("--transport", choices=("fake", "file", "smtp"), default="fake", help="mail backend for notify (default: fake Brevo API)")
+    parser.add_argument("--smtp-host", default="127.0.0.1")
+    parser.add_argument("--smtp-port", type=int, default=0, help="SMTP server for --transport smtp; 0 starts an in-process aiosmtpd sink")
+    parser.add_argument("--in-process", action="store_true", help="run cases in this process (peak RSS is then cumulative)")
+    parser.add_argument("--json", help="also write all results to this file")
+    parser.add_argument("--profile", metavar="DIR", help="profile each case and save the artifacts under DIR")
+    parser.add_argument("--sample-only", action="store_true", help="with --profile, skip cProfile (stack samples and tracemalloc only)")
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenario or list(SCENARIOS)
+    sizes = [int(rows) for rows in args.rows.split(",") if rows.strip()]
+    print(f"{'scenario':<16} {'rows':>8} {'wall_s':>9} {'rss_mb':>9} {'peak_mb':>9} {'calls':>7} {'emails':>7} {'errors':>6} {'mail/s':>8} {'p95_ms':>7}")
+
+    results = []
+    for scenario in scenarios:
+        for rows in sizes:
+            case = (scenario, rows, args.latency_ms, args.existing_fraction, args.users, args.shards,
+                    args.transport, args.smtp_host, args.smtp_port, args.profile, args.sample_only)
+            if args.in_process:
+                result = run_case(*case)
+            else:
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    result = pool.submit(run_case, *case).result()
+            _print_row(result)
+            if result["profile"]:
+                print(f"  profile: {result['profile']}", flush=True)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
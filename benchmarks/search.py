@@ -0,0 +1,111 @@
+"""Full-text alert search (sql/alert_search.sql) against a real Postgres: latency and index upkeep.
+
+    python -m benchmarks.search --dsn postgresql://localhost/medirate_dev --rows 100000,300000
+    python -m benchmarks.search --embedded /tmp/pgdata     # throwaway server (pip install pgserver)
+
+Seeds bill_track_50 and provider_alerts with synthetic rows in a scratch schema, applies
+the url key, change notification and search scripts, then times search_alerts() for a few
+queries (median of several runs) and checks the plan uses the GIN index. It also checks
+that inserts, updates, url changes and deletes keep alert_search in step with the tables.
+The schema is dropped at the end.
+"""
+import argparse
+import os
+import statistics
+import time
+
+SCHEMA = "search_bench"
+QUERIES = ("HB1234", "\"sen. waiver\"", "medicaid", "rate -hospice", "waiver or telehealth", "zzzunknown")
+
+
+def _time_query(cursor, query, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor.execute("SELECT source, key, rank FROM search_alerts(%s, 200)", (query,))
+        hits = cursor.fetchall()
+        times.append(time.perf_counter() - started)
+    return len(hits), statistics.median(times) * 1000
+
+
+def _in_step(cursor):
+    """alert_search has exactly one document per bill url_key and provider alert id"""
+    cursor.execute("""
+        SELECT (SELECT count(DISTINCT url_key) FROM bill_track_50) + (SELECT count(*) FROM provider_alerts),
+               (SELECT count(*) FROM alert_search),
+               (SELECT count(*) FROM alert_search s WHERE s.source = 'bill'
+                  AND s.document IS DISTINCT FROM (SELECT bill_search_document(b.bill_number, b.name, b.ai_summary, b.last_action, b.sponsor_list)
+                                                   FROM bill_track_50 b WHERE b.url_key = s.key))
+    """)
+    expected, indexed, stale = cursor.fetchone()
+    return expected == indexed and stale == 0
+
+
+def run(dsn, rows, repeat=5):
+    import psycopg2
+    from benchmarks.live_frames import ROOT, _create_tables
+
+    conn = psycopg2.connect(dsn, options=f"-c search_path={SCHEMA}")
+    conn.autocommit = True
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    _create_tables(cursor, rows, schema=SCHEMA)
+    with open(os.path.join(ROOT, "sql/alert_search.sql")) as f:
+        cursor.execute(f.read())
+    cursor.execute("ANALYZE")
+    print(f"{rows} bills: seeded and indexed in {time.perf_counter() - started:.1f}s")
+
+    ok = True
+    print(f"  {'query':<24} {'hits':>6} {'median_ms':>10}  plan")
+    for query in QUERIES:
+        hits, ms = _time_query(cursor, query, repeat)
+        cursor.execute(
+            "EXPLAIN SELECT s.source, s.key FROM alert_search s, websearch_to_tsquery('english', %s) q WHERE s.document @@ q",
+            (query,))
+        plan = " ".join(line for (line,) in cursor.fetchall())
+        uses_index = "alert_search_document_idx" in plan
+        print(f"  {query:<24} {hits:>6} {ms:>10.2f}  {'GIN index' if uses_index else 'seq scan'}")
+
+    steps = (
+        ("insert", "INSERT INTO bill_track_50 (url, name, ai_summary) VALUES ('https://bills.example/search/1', 'Quokka waiver act', 'About quokkas')"),
+        ("update", "UPDATE bill_track_50 SET name = 'Wombat waiver act' WHERE url = 'https://bills.example/search/1'"),
+        ("flag reset", "UPDATE bill_track_50 SET is_new = 'no' WHERE url IN (SELECT url FROM bill_track_50 LIMIT 1000)"),
+        ("url change", "UPDATE bill_track_50 SET url = 'https://bills.example/search/2' WHERE url = 'https://bills.example/search/1'"),
+        ("provider insert", "INSERT INTO provider_alerts (subject, summary) VALUES ('Quokka notice', 'Rates change')"),
+        ("delete", "DELETE FROM bill_track_50 WHERE url = 'https://bills.example/search/2'"),
+    )
+    for label, sql in steps:
+        started = time.perf_counter()
+        cursor.execute(sql)
+        ms = (time.perf_counter() - started) * 1000
+        in_step = _in_step(cursor)
+        ok = ok and in_step
+        print(f"  {label:<16} {ms:>8.2f} ms  alert_search in step: {'yes' if in_step else 'NO'}")
+    cursor.execute("SELECT count(*) FROM search_alerts('wombat')")
+    ok = ok and cursor.fetchone()[0] == 0
+
+    cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.close()
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="Postgres to run against (default DATABASE_URL)")
+    parser.add_argument("--embedded", metavar="DIR", help="start a throwaway server in DIR with pgserver instead")
+    parser.add_argument("--rows", default="100000", help="comma separated bill counts")
+    args = parser.parse_args(argv)
+
+    dsn = args.dsn
+    if args.embedded:
+        import pgserver
+        dsn = pgserver.get_server(args.embedded, cleanup_mode=None).get_uri()
+    if not dsn:
+        parser.error("pass --dsn, --embedded or set DATABASE_URL")
+    for rows in (int(value) for value in args.rows.split(",")):
+        if not run(dsn, rows):
+            raise SystemExit("alert_search fell out of step with the tables")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Sharded notify across local processes against a real Postgres and the fake mail API.
+
+    python -m benchmarks.sharded_notify --dsn postgresql://localhost/medirate_dev --rows 2000 --users 300
+    python -m benchmarks.sharded_notify --embedded /tmp/pgdata     # throwaway server (pip install pgserver)
+
+Seeds user_email_preferences and alert_service_lines (sql/alert_service_lines.sql) in a
+scratch schema and points DATABASE_URL at it, so every worker process claims shards with
+pg_try_advisory_lock (shards.AdvisoryShardLocks), matches through match_alert_recipients()
+and shares the Postgres outbox and ledger (outbox.PgEmailOutbox), as workers on several
+hosts would. Alerts come from the in-memory fakes, mail goes to the fake API. Checks that:
+  - a shard whose advisory lock another session holds is skipped, and a rerun picks it up;
+  - a message left pending by an earlier run of that shard is only sent by the shard;
+  - every recipient match_alert_recipients() finds gets exactly one message, although
+    workers revisit shards another process already finished (the outbox skips them), and
+    each shard is reported once;
+  - a third run sends nothing, and no advisory locks are left behind.
+The schema is dropped at the end.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+SCHEMA = "sharded_notify_bench"
+
+
+def _create_tables(cursor, rows, users):
+    from psycopg2.extras import Json, execute_values
+    from benchmarks.scenarios import _notify_tables
+    from benchmarks.live_frames import ROOT
+    from data_processor import alert_key, alert_service_line_rows
+
+    tables = _notify_tables(rows, users)
+    alerts = [dict(row, source="bill") for row in tables["bill_track_50"]]
+    alerts += [dict(row, source="provider_alert") for row in tables["provider_alerts"]]
+
+    cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path TO {SCHEMA}")
+    cursor.execute("CREATE TABLE user_email_preferences (user_email text PRIMARY KEY, preferences jsonb, updated_at text)")
+    execute_values(cursor, "INSERT INTO user_email_preferences (user_email, preferences, updated_at) VALUES %s",
+                   [(user["user_email"], Json(user["preferences"]), user["updated_at"]) for user in tables["user_email_preferences"]])
+    with open(os.path.join(ROOT, "sql/alert_service_lines.sql")) as f:
+        cursor.execute(f.read())
+    rows = alert_service_line_rows(alerts)
+    execute_values(cursor, "INSERT INTO alert_service_lines (alert_key, state_code, category, source) VALUES %s",
+                   [(row["alert_key"], row["state_code"], row["category"], row["source"]) for row in rows])
+    return sorted({alert_key(alert) for alert in alerts})
+
+
+def _advisory_locks(cursor):
+    from shards import LOCK_NAMESPACE
+    cursor.execute("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND classid = %s", (LOCK_NAMESPACE,))
+    return cursor.fetchone()[0]
+
+
+def run(dsn, rows, users, shards=8, processes=4):
+    import psycopg2
+    from psycopg2.extensions import make_dsn
+    from benchmarks.fakes import install_fakes, uninstall_fakes
+    from benchmarks.scenarios import _install_shard_worker, _notify_tables
+    import data_processor
+    from pipeline import run_sharded_notify
+    from shards import AdvisoryShardLocks
+
+    schema_dsn = make_dsn(dsn, options=f"-c search_path={SCHEMA}")
+    admin = psycopg2.connect(schema_dsn)
+    admin.autocommit = True
+    cursor = admin.cursor()
+    alert_keys = _create_tables(cursor, rows, users)
+    cursor.execute("SELECT count(DISTINCT user_email) FROM match_alert_recipients(%s)", (alert_keys,))
+    expected = cursor.fetchone()[0]
+    print(f"{len(alert_keys)} alerts, {users} users, {expected} recipients with matches; {shards} shards over {processes} processes")
+
+    ok = True
+    previous = {name: os.environ.get(name) for name in ("DATABASE_URL", "OUTBOX_PATH")}
+    try:
+        with tempfile.TemporaryDirectory(prefix="medirate-shards-") as workdir:
+            # Inherited by the spawned workers; no local SQLite outbox to import
+            os.environ["DATABASE_URL"] = schema_dsn
+            os.environ["OUTBOX_PATH"] = os.path.join(workdir, "email_outbox.sqlite3")
+            initargs = (rows, users, 0.0, None)
+            # The parent checks the Supabase connection and reports the outbox queue
+            install_fakes(tables=_notify_tables(rows, users))
+            outbox = data_processor.get_outbox()
+            # A digest an earlier run of shard 3 left pending: only shard 3 may send it
+            stale_run = "stale" + data_processor.shard_run_pattern((3, shards))[1:]
+            outbox.enqueue(stale_run, [("stale@example.com", "Earlier digest", "<p>earlier</p>", [])])
+
+            def notify(label):
+                started = time.perf_counter()
+                result = run_sharded_notify(shards, processes, initializer=_install_shard_worker, initargs=initargs)
+                done = [shard["shard"] for shard in result["shards"]]
+                print(f"  {label:<28} {result['emails_sent']:>6} emails  shards {done}  {time.perf_counter() - started:.1f}s")
+                return result, done if result["succeeded"] else None
+
+            # Another session holds shard 3, as a worker on another host would
+            held = AdvisoryShardLocks(psycopg2.connect(schema_dsn))
+            held.try_acquire(3)
+            first, done = notify("shard 3 held elsewhere")
+            ok = ok and done == [shard for shard in range(shards) if shard != 3]
+            stale_pending = outbox.pending_count(stale_run)
+            print(f"  shard 3's earlier digest left for shard 3: {'yes' if stale_pending == 1 else 'NO'}")
+            held.close()
+
+            second, done = notify("rerun after release")
+            ok = ok and done == list(range(shards)) and stale_pending == 1 and outbox.stats(stale_run) == {"sent": 1}
+            third, done = notify("third run")
+            ok = ok and done is not None and third["emails_sent"] == 0
+
+            cursor.execute("SELECT count(*), count(DISTINCT lower(recipient)) FROM email_outbox WHERE status = 'sent' AND run_id <> %s", (stale_run,))
+            messages = cursor.fetchone()
+            sent = first["emails_sent"] + second["emails_sent"] - 1
+            exactly_once = messages == (expected, expected) and sent == expected
+            print(f"  each recipient mailed once: {'yes' if exactly_once else 'NO'} ({sent} sent, outbox {messages[0]} messages to {messages[1]} recipients)")
+            leftover = _advisory_locks(cursor)
+            print(f"  advisory locks left: {leftover}")
+            ok = ok and exactly_once and leftover == 0
+    finally:
+        uninstall_fakes()
+        data_processor.set_client("outbox", None)
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        cursor.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        admin.close()
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=os.getenv("DATABASE_URL"), help="Postgres to run against (default DATABASE_URL)")
+    parser.add_argument("--embedded", metavar="DIR", help="start a throwaway server in DIR with pgserver instead")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    dsn = args.dsn
+    if args.embedded:
+        import pgserver
+        dsn = pgserver.get_server(args.embedded, cleanup_mode=None).get_uri()
+    if not dsn:
+        parser.error("pass --dsn, --embedded or set DATABASE_URL")
+    if not run(dsn, args.rows, args.users, args.shards, args.processes):
+        raise SystemExit("sharded notify did not mail every recipient exactly once")
+
+
+if __name__ == "__main__":
+    main()
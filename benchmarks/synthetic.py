@@ -0,0 +1,135 @@
+"""Synthetic workbooks shaped like the files the pipeline downloads from Azure.
+
+    python -m benchmarks.synthetic --rows 10000 --out /tmp/bench
+
+Bill sheets mimic "MMYY Medicaid Rates bill sheet with categories.xlsx" (one MMDDYY sheet
+per extract) and provider alerts mimic "provideralerts_data.xlsx". Rows are deterministic
+for a given seed so runs are comparable.
+"""
+import argparse
+import os
+import random
+from datetime import date, datetime, timedelta
+
+from data_processor import US_STATE_MAP, get_file_name_for_date
+
+SERVICE_CATEGORIES = [
+    "Home and Community Based Services", "Behavioral Health", "Dental", "Durable Medical Equipment",
+    "Hospice", "Nursing Facility", "Pharmacy", "Physician Services", "Telehealth", "Transportation",
+    "Applied Behavior Analysis", "Personal Care", "Ambulance", "Laboratory", "Hospital Inpatient",
+]
+BILL_PROGRESS = ["Introduced", "In Committee", "Passed Chamber", "Passed Both", "Enacted", "Failed"]
+WORDS = (
+    "medicaid rate reimbursement provider service payment fee schedule adjustment managed care "
+    "waiver eligibility coverage program state plan amendment federal funding increase reduce"
+).split()
+
+# Headers as exported: the four service line columns share a name, so pandas suffixes them .1/.2/.3
+BILL_HEADERS = [
+    "url", "bill number", "state", "name", "bill progress", "last action", "action date",
+    "sponsor list", "ai summary", "created",
+    "service_lines_impacted", "service_lines_impacted", "service_lines_impacted", "service_lines_impacted",
+]
+PROVIDER_ALERT_HEADERS = [
+    "id", "state", "subject", "announcement_date", "links", "summary",
+    "service_lines_impacted", "service_lines_impacted_1", "service_lines_impacted_2", "service_lines_impacted_3",
+]
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _service_lines(rng):
+    picked = rng.sample(SERVICE_CATEGORIES, rng.randint(1, 4))
+    return picked + [None] * (4 - len(picked))
+
+
+def bill_rows(rows, seed=0):
+    """Yield bill sheet rows (lists matching BILL_HEADERS)"""
+    rng = random.Random(seed)
+    states = list(US_STATE_MAP)
+    start = date(2024, 1, 1)
+    for i in range(rows):
+        state = rng.choice(states)
+        action_date = start + timedelta(days=rng.randint(0, 600))
+        yield [
+            f"https://www.billtrack50.com/billdetail/{1000000 + i}",
+            f"{state} HB{i % 5000}",
+            state,
+            _sentence(rng, 8),
+            rng.choice(BILL_PROGRESS),
+            _sentence(rng, 6),
+            action_date.strftime("%m/%d/%Y"),
+            ", ".join(f"Sen. {rng.choice(WORDS).title()}" for _ in range(rng.randint(1, 3))),
+            _sentence(rng, rng.randint(40, 120)),
+            (action_date - timedelta(days=rng.randint(0, 90))).strftime("%m/%d/%Y"),
+            *_service_lines(rng),
+        ]
+
+
+def provider_alert_rows(rows, seed=0):
+    """Yield provider alert rows (lists matching PROVIDER_ALERT_HEADERS)"""
+    rng = random.Random(seed + 1)
+    states = list(US_STATE_MAP.values())
+    start = date(2024, 1, 1)
+    for i in range(rows):
+        yield [
+            str(i + 1),
+            rng.choice(states),
+            _sentence(rng, 10),
+            (start + timedelta(days=rng.randint(0, 600))).strftime("%Y-%m-%d"),
+            f"https://medicaid.example.gov/notices/{i}",
+            _sentence(rng, rng.randint(20, 80)),
+            *_service_lines(rng),
+        ]
+
+
+def _write_workbook(path, sheets):
+    """Write {sheet_name: (headers, rows)} with openpyxl's streaming write-only mode"""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    for sheet_name, (headers, rows) in sheets.items():
+        sheet = workbook.create_sheet(sheet_name)
+        sheet.append(headers)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def write_bill_workbook(directory, rows, seed=0, extract_date=None, extra_sheets=2):
+    """Write this month's bill workbook with the latest MMDDYY sheet holding `rows` bills.
+
+    A couple of older, smaller MMDDYY sheets are added so get_latest_date_sheet has to choose.
+    Returns the path; the file name is the one get_available_file_name looks for.
+    """
+    extract_date = extract_date or datetime.now()
+    sheets = {}
+    # Older extracts stay within the month: MMDDYY names only sort correctly within a year
+    for day in sorted({max(1, extract_date.day - 7 * back) for back in range(1, extra_sheets + 1)} - {extract_date.day}):
+        older = extract_date.replace(day=day)
+        sheets[older.strftime("%m%d%y")] = (BILL_HEADERS, bill_rows(min(rows, 100), seed + day))
+    sheets[extract_date.strftime("%m%d%y")] = (BILL_HEADERS, bill_rows(rows, seed))
+    path = os.path.join(directory, get_file_name_for_date(extract_date))
+    return _write_workbook(path, sheets)
+
+
+def write_provider_alerts_workbook(directory, rows, seed=0):
+    path = os.path.join(directory, "provideralerts_data.xlsx")
+    return _write_workbook(path, {"provideralerts_data": (PROVIDER_ALERT_HEADERS, provider_alert_rows(rows, seed))})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=".")
+    args = parser.parse_args(argv)
+    os.makedirs(args.out, exist_ok=True)
+    print(write_bill_workbook(args.out, args.rows, args.seed))
+    print(write_provider_alerts_workbook(args.out, args.rows, args.seed))
+
+
+if __name__ == "__main__":
+    main()
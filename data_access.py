@@ -0,0 +1,117 @@
+import asyncio
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# ============================================================================
+# CONCURRENT READS
+# ============================================================================
+
+# One table read: the columns to select and (operator, column, value) filters, with the
+# operators PostgREST and the supabase query builder share (eq, gte, ilike, is).
+TableQuery = namedtuple("TableQuery", ["table", "columns", "filters"])
+
+
+def table_query(table, columns="*", *filters):
+    return TableQuery(table, columns, tuple(filters))
+
+
+def query_params(query):
+    """PostgREST query string parameters of a TableQuery"""
+    params = [("select", query.columns.replace(" ", ""))]
+    params += [(column, f"{op}.{value}") for op, column, value in query.filters]
+    return params
+
+
+def run_on_builder(client, query):
+    """Execute a TableQuery through a supabase-style client (table().select()...execute()) -> rows"""
+    builder = client.table(query.table).select(query.columns)
+    for op, column, value in query.filters:
+        builder = getattr(builder, "is_" if op == "is" else op)(column, value)
+    return builder.execute().data
+
+
+class _LoopThread:
+    """An asyncio event loop running forever in a daemon thread, so connections outlive a call"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="data-access-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class PostgrestDataAccess:
+    """Reads tables over Supabase's REST API (PostgREST) with one httpx.AsyncClient.
+
+    fetch_many() issues all of its queries at once over the client's shared connection
+    pool and waits for them together, so a batch takes about as long as its slowest query.
+    It is a plain blocking call: the coroutines run on a background event loop.
+    """
+
+    def __init__(self, url, key, max_connections=10, timeout=30.0):
+        self.base_url = url.rstrip("/") + "/rest/v1"
+        self.headers = {"apikey": key, "Authorization": f"Bearer {key}", "Accept": "application/json"}
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+        self._loop = _LoopThread()
+
+    def _http(self):
+        # Created on the loop thread, which owns the pool
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def fetch(self, query):
+        response = await self._http().get(f"/{query.table}", params=query_params(query))
+        response.raise_for_status()
+        return response.json()
+
+    async def _gather(self, queries):
+        return await asyncio.gather(*(self.fetch(query) for query in queries))
+
+    def fetch_many(self, queries):
+        """[rows of each query], in order; raises the first error"""
+        if not queries:
+            return []
+        return self._loop.run(self._gather(list(queries)))
+
+    def close(self):
+        if self._client is not None:
+            self._loop.run(self._client.aclose())
+            self._client = None
+        self._loop.stop()
+
+
+class ThreadedDataAccess:
+    """The same fetch_many() over a synchronous supabase-style client, one worker thread per query.
+
+    get_client is called for every batch, so an injected client (e.g. a benchmark fake) is
+    always the one used.
+    """
+
+    def __init__(self, get_client, max_workers=8):
+        self.get_client = get_client
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="data-access")
+
+    def fetch_many(self, queries):
+        client = self.get_client()
+        futures = [self._pool.submit(run_on_builder, client, query) for query in queries]
+        return [future.result() for future in futures]
+
+    def close(self):
+        self._pool.shutdown(wait=True)
@@ -1,30 +1,130 @@
-from azure.storage.blob import BlobServiceClient
+import numpy as np
 import pandas as pd
 import os
 import warnings
-from dotenv import load_dotenv
-from supabase import create_client, Client
 import re
-from datetime import datetime, timedelta
-import streamlit as st
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
-from sib_api_v3_sdk.models import SendSmtpEmail
+import hashlib
+import itertools
+import threading
+import time
+import contextvars
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from log_buffer import LogBuffer, LogRecord
+from metrics import timed, incr
 
-# Load environment variables from .env file
-load_dotenv()
+# Heavy SDKs (azure, supabase, sib_api_v3_sdk) and the .env file are loaded on first use,
+# so importing this module stays cheap and never fails on missing credentials.
 
 # Suppress openpyxl warnings
 warnings.simplefilter(action='ignore', category=UserWarning)
 
-# Retrieve Azure and Database credentials from environment variables
-AZURE_CONNECTION_STRING = os.getenv("AZURE_CONNECTION_STRING")
-CONTAINER_NAME = os.getenv("CONTAINER_NAME", "autoloadingcontainer")
+_env_loaded = False
 
-# Supabase connection details
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
+def get_setting(name, default=None):
+    """Read a setting from the environment, loading the .env file once on first use"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+    return os.getenv(name, default)
+
+def get_container_name():
+    return get_setting("CONTAINER_NAME", "autoloadingcontainer")
+
+# ============================================================================
+# LAZY CLIENTS
+# ============================================================================
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _get_client(name, factory):
+    """Return the memoized client called name, building it with factory() exactly once"""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+def set_client(name, client):
+    """Override (or with None, forget) a memoized client, e.g. to inject an in-process fake"""
+    with _clients_lock:
+        if client is None:
+            _clients.pop(name, None)
+        else:
+            _clients[name] = client
+
+def _create_supabase_client():
+    from supabase import create_client
+    url, key = get_setting("SUPABASE_URL"), get_setting("SUPABASE_ANON_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
+    return create_client(url, key)
+
+def _create_blob_service_client():
+    from azure.storage.blob import BlobServiceClient
+    connection_string = get_setting("AZURE_CONNECTION_STRING")
+    if not connection_string:
+        raise RuntimeError("AZURE_CONNECTION_STRING must be set")
+    return BlobServiceClient.from_connection_string(connection_string)
+
+def _create_email_api():
+    import sib_api_v3_sdk
+    configuration = sib_api_v3_sdk.Configuration()
+    configuration.api_key['api-key'] = get_setting("BREVO_API_KEY")
+    return sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+
+MAIL_SENDER = {"email": "contact@medirate.net", "name": "Medirate"}
+
+def _create_mail_transport():
+    """MAIL_TRANSPORT picks the backend: brevo (default), smtp (SMTP_HOST/PORT/USER/PASSWORD/STARTTLS) or file (MAIL_SINK_DIR)"""
+    import transports
+    kind = get_setting("MAIL_TRANSPORT", "brevo").strip().lower()
+    if kind == "smtp":
+        return transports.SmtpTransport(
+            MAIL_SENDER,
+            get_setting("SMTP_HOST", "localhost"),
+            int(get_setting("SMTP_PORT", "25")),
+            username=get_setting("SMTP_USER"),
+            password=get_setting("SMTP_PASSWORD"),
+            starttls=get_setting("SMTP_STARTTLS", "").lower() in ("1", "true", "yes"),
+        )
+    if kind == "file":
+        return transports.FileSinkTransport(MAIL_SENDER, get_setting("MAIL_SINK_DIR", "mail_sink"))
+    if kind == "brevo":
+        return transports.BrevoTransport(MAIL_SENDER, get_email_api)
+    raise ValueError(f"Unknown MAIL_TRANSPORT {kind!r} (expected brevo, smtp or file)")
+
+def _create_data_access():
+    """PostgREST over httpx when SUPABASE_URL/SUPABASE_ANON_KEY are set, else threads over get_supabase()"""
+    import data_access
+    url, key = get_setting("SUPABASE_URL"), get_setting("SUPABASE_ANON_KEY")
+    if url and key:
+        return data_access.PostgrestDataAccess(url, key, max_connections=int(get_setting("DATA_ACCESS_CONNECTIONS", "10")))
+    return data_access.ThreadedDataAccess(get_supabase)
+
+def get_supabase():
+    return _get_client("supabase", _create_supabase_client)
+
+def get_data_access():
+    return _get_client("data_access", _create_data_access)
+
+def fetch_many(queries):
+    """Run independent data_access.TableQuery reads concurrently; returns their rows in order"""
+    return get_data_access().fetch_many(queries)
+
+def get_blob_service_client():
+    return _get_client("blob_service", _create_blob_service_client)
+
+def get_email_api():
+    return _get_client("email_api", _create_email_api)
+
+def get_mail_transport():
+    return _get_client("mail_transport", _create_mail_transport)
 
 # US state code <-> name mapping
 US_STATE_MAP = {
@@ -51,67 +151,59 @@ def get_full_state_name(state_val):
     else:
         return state_val.title()
 
-def normalize_state(val):
-    if not val:
-        return set()
-    val = val.strip().upper()
-    results = set()
-    # If it's a code
-    if val in US_STATE_MAP:
-        results.add(val)
-        results.add(US_STATE_MAP[val].upper())
-    # If it's a full name
-    elif val in US_STATE_MAP_REV:
-        results.add(val)
-        results.add(US_STATE_MAP_REV[val])
-    else:
-        results.add(val)
-    return results
+# Log sinks are callables sink(record) taking a log_buffer.LogRecord. A context-local sink
+# (log_to) wins over the process-wide default (set_log_sink); with neither, records go to
+# the Streamlit session, which is only imported when actually needed.
+_log_sink = contextvars.ContextVar("log_sink", default=None)
+_default_log_sink = None
 
-def log_message(message, message_type="info", phase="General"):
-    """Log message with timestamp, styling, and phase"""
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    formatted = f"[{timestamp}] {message}"
-    if 'logs_by_phase' not in st.session_state:
-        st.session_state['logs_by_phase'] = {}
-    if phase not in st.session_state['logs_by_phase']:
-        st.session_state['logs_by_phase'][phase] = []
-    st.session_state['logs_by_phase'][phase].append((formatted, message_type))
-    # Also append to flat log for backward compatibility
-    if 'processing_log' not in st.session_state:
-        st.session_state['processing_log'] = []
-    st.session_state['processing_log'].append(formatted)
-    # Optionally, print to Streamlit immediately (for dev)
-    # if message_type == "success":
-    #     st.success(formatted)
-    # elif message_type == "error":
-    #     st.error(formatted)
-    # elif message_type == "warning":
-    #     st.warning(formatted)
-    # elif message_type == "info":
-    #     st.info(formatted)
-    # else:
-    #     st.write(formatted)
-
-def log_connection_status():
-    """Log connection status for Azure Blob Storage and Supabase DB only"""
-    log_message("🔗 Attempting to connect to Azure Blob Storage...", "info", phase="Connection")
+def set_log_sink(sink):
+    """Install a process-wide default log sink, e.g. for the headless worker. Pass None to reset."""
+    global _default_log_sink
+    _default_log_sink = sink
+
+def current_log_sink():
+    """Return the sink log_message would use right now, or None for the Streamlit session"""
+    return _log_sink.get() or _default_log_sink
+
+@contextmanager
+def log_to(sink):
+    """Route log_message calls made in the current context to sink(record)"""
+    token = _log_sink.set(sink)
     try:
-        blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-        log_message("✅ Azure Blob Storage connection successful", "success", phase="Connection")
-    except Exception as e:
-        log_message(f"❌ Azure Blob Storage connection failed: {e}", "error", phase="Connection")
-        return False
+        yield sink
+    finally:
+        _log_sink.reset(token)
+
+def log_message(message, message_type="info", phase="General"):
+    """Log message with timestamp, level, and phase"""
+    record = LogRecord(datetime.now(), message_type, phase, message)
+    sink = current_log_sink()
+    if sink is not None:
+        sink(record)
+        return
+    session_log_sink(record)
+
+def session_log_sink(record):
+    """Default sink: append to the bounded LogBuffer kept in the Streamlit session"""
+    import streamlit as st
+    if 'log_buffer' not in st.session_state:
+        st.session_state['log_buffer'] = LogBuffer()
+    st.session_state['log_buffer'].append(record)
+
+def log_connection_status(blob_storage=True):
+    """Log connection status for Azure Blob Storage (unless blob_storage=False) and Supabase DB only"""
+    if blob_storage:
+        log_message("🔗 Attempting to connect to Azure Blob Storage...", "info", phase="Connection")
+        try:
+            get_blob_service_client()
+            log_message("✅ Azure Blob Storage connection successful", "success", phase="Connection")
+        except Exception as e:
+            log_message(f"❌ Azure Blob Storage connection failed: {e}", "error", phase="Connection")
+            return False
     log_message("🔗 Attempting to connect to Supabase...", "info", phase="Connection")
     try:
-        conn = psycopg2.connect(
-            host=SUPABASE_HOST,
-            database=SUPABASE_DB,
-            user=SUPABASE_USER,
-            password=SUPABASE_PASS,
-            port=5432
-        )
-        conn.close()
+        get_supabase().table("bill_track_50").select("url").limit(1).execute()
         log_message("✅ Supabase connection successful", "success", phase="Connection")
     except Exception as e:
         log_message(f"❌ Supabase connection failed: {e}", "error", phase="Connection")
@@ -130,8 +222,7 @@ def get_file_name_for_date(date):
 
 def check_file_exists(blob_name):
     try:
-        blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-        blob_client = blob_service_client.get_blob_client(CONTAINER_NAME, blob_name)
+        blob_client = get_blob_service_client().get_blob_client(get_container_name(), blob_name)
         return blob_client.exists()
     except Exception as e:
         log_message(f"Error checking if file exists: {e}", "error", phase="Download")
@@ -167,37 +258,111 @@ def get_latest_date_sheet(excel_file):
     
     return date_sheets[0]
 
+# Placeholder strings the sheets and older rows use for a missing value (str(NaN) written as
+# text). Words like 'None' or 'null' are left alone: they can be real values.
+NULL_TOKENS = ('nan', 'NaN')
+
+def _create_date_parser():
+    from dates import DateParser
+    return DateParser()
+
+def get_date_parser():
+    """The process-wide date parser (per-column formats and the raw-string memo persist across runs)"""
+    return _get_client("date_parser", _create_date_parser)
+
+def apply_ingest_schema(df, table, source=None):
+    """Convert df's columns in place to the dtypes of schema.TABLE_SCHEMAS[table].
+
+    Dates go through the shared DateParser (formats cached under '<source>.<column>');
+    unparseable values become NaT and are reported rather than failing the update.
+    """
+    from schema import apply_schema
+    parser = get_date_parser()
+    source = source or table
+    apply_schema(df, table, parse_dates=lambda values, col: parser.parse(values, key=f"{source}.{col}"))
+    for key, (count, samples) in parser.take_unparseable().items():
+        incr("unparseable_dates", count)
+        log_message(f"⚠️ {count} unparseable dates in {key} stored as NULL, e.g. {', '.join(map(repr, samples))}", "warning", phase="Excel")
+    return df
+
+@timed("normalize_ingest_frame", phase="Excel")
+def normalize_ingest_frame(df, table):
+    """Clean a parsed sheet once, column by column, before anything is written.
+
+    Text is stripped and '', whitespace-only and NULL_TOKENS values become missing; then the
+    columns get table's schema dtypes (categoricals, Arrow strings, dates). Every write then
+    sends real NULLs, so no cleanup pass over the table is needed afterwards.
+    """
+    from schema import memory_mb
+    raw_mb = memory_mb(df)
+    df = df.copy()
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object:
+            values = values.str.strip()
+            values = values.mask(values.eq('') | values.isin(NULL_TOKENS))
+        df[col] = values.astype(object).where(values.notna(), None)
+    df = apply_ingest_schema(df, table, f"{table}.sheet")
+    typed_mb = memory_mb(df)
+    log_message(f"🧮 {table} sheet: {len(df)} rows, {raw_mb:.1f} MB as read -> {typed_mb:.1f} MB typed", "info", phase="Excel")
+    return df
+
+def write_records(df):
+    """DataFrame rows as JSON-ready dicts: dates as 'YYYY-MM-DD', missing values as None"""
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime('%Y-%m-%d')
+        elif df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) in ("date", "datetime", "mixed"):
+            # date/datetime objects (e.g. assigned from a scalar) would not survive json.dumps
+            df[col] = df[col].map(lambda value: value.strftime('%Y-%m-%d') if isinstance(value, date) else value)
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+@timed("download_file", phase="Download")
 def download_file(blob_name):
     log_message(f"📥 Downloading file: {blob_name}", "info", phase="Download")
-    blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-    blob_client = blob_service_client.get_blob_client(CONTAINER_NAME, blob_name)
+    blob_client = get_blob_service_client().get_blob_client(get_container_name(), blob_name)
 
     local_filename = blob_name
     with open(local_filename, "wb") as file:
-        file.write(blob_client.download_blob().readall())
+        content = blob_client.download_blob().readall()
+        file.write(content)
+    incr("download_bytes", len(content))
     log_message(f"✅ File downloaded successfully: {local_filename}", "success", phase="Download")
     return local_filename
 
+@timed("fetch_bills_from_db", phase="Database")
 def fetch_bills_from_db():
     try:
         log_message("🗄️ Fetching data from Supabase database...", "info", phase="Database")
-        bills = supabase.table("bill_track_50").select("*").execute().data
+        bills = get_supabase().table("bill_track_50").select("*").execute().data
+        incr("db_rows_fetched", len(bills))
         log_message(f"✅ Retrieved {len(bills)} records from Supabase database", "success", phase="Database")
-        return bills
+        if not bills:
+            return pd.DataFrame({'url': pd.Series(dtype='string'), 'url_key': pd.Series(dtype='int64')})
+        from urls import add_url_key
+        db_data = apply_ingest_schema(pd.DataFrame(bills), "bill_track_50", "bill_track_50.db")
+        return add_url_key(db_data[db_data['url'].notna()].copy())
     except Exception as e:
         log_message(f"❌ Error fetching data from Supabase database: {e}", "error", phase="Database")
         return None
 
-def reset_is_new_flags():
+def reset_is_new_flags(tables=("bill_track_50", "provider_alerts")):
+    """Reset is_new to 'no'. Each pipeline passes only its own table so the two can run concurrently.
+
+    Only flagged rows are written, so the reset doesn't rewrite (and re-trigger) the whole table.
+    """
     try:
         log_message("🔄 Resetting is_new flags...", "info", phase="Update")
-        supabase.table("bill_track_50").update({"is_new": "no"}).execute()
-        supabase.table("provider_alerts").update({"is_new": "no"}).execute()
-        log_message("✅ Reset all is_new flags to 'no'", "success", phase="Update")
+        for table in tables:
+            get_supabase().table(table).update({"is_new": "no"}).neq("is_new", "no").execute()
+        log_message(f"✅ Reset is_new flags to 'no' in {', '.join(tables)}", "success", phase="Update")
     except Exception as e:
         log_message(f"❌ Error resetting is_new flags: {e}", "error", phase="Update")
 
+@timed("insert_new_entries", phase="Update")
 def insert_new_entries(excel_data, db_data):
+    """Insert sheet bills whose url key is not in the table. Returns the number inserted."""
     try:
         log_message("➕ Processing new entries...", "info", phase="Update")
         
@@ -212,20 +377,14 @@ def insert_new_entries(excel_data, db_data):
         
         excel_data.columns = [col.replace('.', '_') for col in excel_data.columns]
         
-        excel_data['action_date'] = pd.to_datetime(excel_data['action_date'], format='%m/%d/%Y', errors='coerce')
-        excel_data['created'] = pd.to_datetime(excel_data['created'], format='%m/%d/%Y', errors='coerce')
-        
-        existing_urls = set(db_data['url'])
-        
-        new_entries = excel_data[
-            ~excel_data['url'].isin(existing_urls) &
-            excel_data['url'].notna() &
-            (excel_data['url'].str.strip() != '')
-        ].copy()
+        # Membership on the int64 url keys (both frames are keyed in process_bill_track)
+        new_entries = excel_data[~excel_data['url_key'].isin(db_data['url_key'].to_numpy())]
+        # One row per key, as the unique index requires (the last one in the sheet wins)
+        new_entries = new_entries.drop_duplicates(subset='url_key', keep='last').copy()
         
         if new_entries.empty:
             log_message("ℹ️ No new entries to insert", "info", phase="Update")
-            return
+            return 0
         
         log_message(f"📝 Found {len(new_entries)} new entries to insert", "info", phase="Update")
         
@@ -237,16 +396,21 @@ def insert_new_entries(excel_data, db_data):
             log_message(f"...and {len(new_entries)-5} more new entries.", "info", phase="Update")
         
         new_entries = new_entries.drop(columns=['source_sheet'])
-        new_entries.loc[:, 'date_extracted'] = pd.Timestamp.now().date()
-        new_entries.loc[:, 'is_new'] = 'yes'
+        new_entries = new_entries.assign(date_extracted=pd.Timestamp.now().normalize(), is_new='yes')
         
-        supabase.table("bill_track_50").insert(new_entries.to_dict(orient='records')).execute()
+        # Upsert on the unique url_key index: a bill inserted by a concurrent run is updated, not duplicated
+        get_supabase().table("bill_track_50").upsert(write_records(new_entries), on_conflict="url_key").execute()
+        incr("bills_inserted", len(new_entries))
+        sync_alert_service_lines(alert_records(new_entries, "bill"))
         
         log_message(f"✅ Successfully inserted {len(new_entries)} new entries", "success", phase="Update")
+        return len(new_entries)
         
     except Exception as e:
         log_message(f"❌ Error inserting new entries: {e}", "error", phase="Update")
+        return 0
 
+@timed("update_all_columns", phase="Update")
 def update_all_columns(excel_data, db_data):
     try:
         log_message("🔄 Updating existing entries...", "info", phase="Update")
@@ -260,17 +424,17 @@ def update_all_columns(excel_data, db_data):
             'ai summary': 'ai_summary',
             'service lines impacted 2': 'service_lines_impacted_2'
         })
+        excel_data.columns = [col.replace('.', '_') for col in excel_data.columns]
         
-        excel_data['action_date'] = pd.to_datetime(excel_data['action_date'], format='%m/%d/%Y')
-        db_data['action_date'] = pd.to_datetime(db_data['action_date'], format='%Y-%m-%d')
-        
-        db_data = db_data.replace('NaN', pd.NA)
-        
+        # The sheet and the table rows share one schema (typed dates, missing values as
+        # NA), so both sides compare as they are
+        # Joined on the int64 url keys; both sides unique per key, so the merge is one-to-one
         merged_data = pd.merge(
-            excel_data,
-            db_data,
-            on='url',
-            suffixes=('_excel', '_db')
+            excel_data.drop_duplicates(subset='url_key', keep='last'),
+            db_data.drop_duplicates(subset='url_key', keep='first'),
+            on='url_key',
+            suffixes=('_excel', '_db'),
+            validate='one_to_one',
         )
         
         columns_to_compare = [
@@ -292,254 +456,524 @@ def update_all_columns(excel_data, db_data):
         
         log_message(f"📝 Found {len(needs_update)} entries that need updates", "info", phase="Update")
         
-        supabase.table("bill_track_50").update(needs_update.to_dict(orient='records')).eq("url", needs_update['url']).execute()
+        # Upsert the sheet's values of the compared columns; other columns keep their values.
+        # The stored url goes along: the insert trigger derives url_key from url before the
+        # conflict check, so without it the key would be NULL and never match the stored bill
+        updates = needs_update[['url_key', 'url_db'] + [f'{col}_excel' for col in columns_to_compare]]
+        updates = updates.rename(columns=lambda col: col.rsplit('_', 1)[0] if col.endswith(('_excel', '_db')) else col)
+        get_supabase().table("bill_track_50").upsert(write_records(updates), on_conflict="url_key").execute()
+        incr("bills_updated", len(needs_update))
+        # Alert keys follow the stored url, which may be a trivial variant of the sheet's
+        changed = excel_data[excel_data['url_key'].isin(needs_update['url_key'].to_numpy())]
+        changed = changed.assign(url=changed['url_key'].map(needs_update.set_index('url_key')['url_db']))
+        sync_alert_service_lines(alert_records(changed, "bill"))
         
         log_message(f"✅ Successfully updated {len(needs_update)} entries", "success", phase="Update")
         
     except Exception as e:
         log_message(f"❌ Error updating entries: {e}", "error", phase="Update")
 
+# Keep the most recently extracted row per url key (see urls.py), then enforce one row per
+# url and per key so writes can upsert on url_key. The same statements make up
+# dedupe_bill_track_50() in sql/bill_track_50_url_key.sql, which is used when only the
+# REST API is configured.
+DEDUPE_BILLS_SQL = """
+WITH ranked AS (
+    SELECT ctid, url_key, ROW_NUMBER() OVER (PARTITION BY url_key ORDER BY date_extracted DESC NULLS LAST) AS rn
+    FROM bill_track_50
+    WHERE url_key IS NOT NULL
+),
+deleted AS (
+    DELETE FROM bill_track_50 b
+    USING ranked r
+    WHERE b.ctid = r.ctid AND r.rn > 1
+    RETURNING b.url_key
+)
+SELECT count(*) AS deleted_rows, count(DISTINCT url_key) AS duplicate_urls FROM deleted
+"""
+# The url index was named bill_track_50_url_key before; an existing one is renamed, not duplicated
+BILL_URL_INDEX_SQL = """
+DO $$
+BEGIN
+    IF to_regclass('bill_track_50_url_key') IS NOT NULL AND to_regclass('bill_track_50_url_uniq') IS NULL THEN
+        ALTER INDEX bill_track_50_url_key RENAME TO bill_track_50_url_uniq;
+    END IF;
+END
+$$;
+CREATE UNIQUE INDEX IF NOT EXISTS bill_track_50_url_uniq ON bill_track_50 (url);
+CREATE UNIQUE INDEX IF NOT EXISTS bill_track_50_url_key_uniq ON bill_track_50 (url_key)
+"""
+
+@timed("remove_duplicates_from_db", phase="Update")
 def remove_duplicates_from_db():
+    """Delete every bill_track_50 row but the latest (by date_extracted) per url key in one statement.
+
+    Runs over DATABASE_URL when set, otherwise through the dedupe_bill_track_50() RPC; either
+    way the unique indexes on url and url_key are ensured in the same transaction. Returns (rows deleted,
+    urls that had duplicates), or None on error.
+    """
     try:
         log_message("🧹 Removing duplicate entries...", "info", phase="Update")
-        supabase.table("bill_track_50").delete().eq("ctid", supabase.table("bill_track_50").select("ctid").order("date_extracted", desc=True).limit(1).execute().data[0]['ctid']).execute()
-        log_message(f"✅ Deleted {len(deleted_count)} duplicate entries", "success", phase="Update")
+        conn = get_pg_connection()
+        if conn is not None:
+            try:
+                with conn, conn.cursor() as cursor:
+                    cursor.execute(DEDUPE_BILLS_SQL)
+                    deleted_rows, duplicate_urls = cursor.fetchone()
+                    cursor.execute(BILL_URL_INDEX_SQL)
+            finally:
+                conn.close()
+        else:
+            result = get_supabase().rpc("dedupe_bill_track_50", {}).execute().data
+            deleted_rows, duplicate_urls = result[0]["deleted_rows"], result[0]["duplicate_urls"]
+        incr("bill_duplicates_deleted", deleted_rows)
+        log_message(f"✅ Deleted {deleted_rows} duplicate entries across {duplicate_urls} urls", "success", phase="Update")
+        return deleted_rows, duplicate_urls
     except Exception as e:
         log_message(f"❌ Error removing duplicates: {e}", "error", phase="Update")
+        return None
+
+SERVICE_LINE_COLUMNS = ['service_lines_impacted', 'service_lines_impacted_1', 'service_lines_impacted_2', 'service_lines_impacted_3']
+
+EMAIL_TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "email_template.html")
+
+def alert_service_lines(alert):
+    """Non-empty service line values of a bill or provider alert row, in column order"""
+    return [str(alert[col]).strip() for col in SERVICE_LINE_COLUMNS if alert.get(col) and not pd.isna(alert[col]) and str(alert[col]).strip()]
+
+def alert_records(df, source):
+    """DataFrame rows as alert dicts (NaN -> None, 'a.1' style columns -> 'a_1') tagged with source"""
+    df = df.rename(columns=lambda col: col.replace('.', '_'))
+    return [dict(record, source=source) for record in write_records(df)]
 
-def replace_nan_with_null():
+def alert_service_line_rows(alerts):
+    """Rows of the normalized alert_service_lines projection (see sql/alert_service_lines.sql)"""
+    from preferences import canonical_state, canonical_category
+    rows = {}
+    for alert in alerts:
+        state = canonical_state(alert.get('state'))
+        if state is None:
+            continue
+        key = alert_key(alert)
+        for line in alert_service_lines(alert):
+            category = canonical_category(line)
+            rows[(key, state, category)] = {"alert_key": key, "state_code": state, "category": category, "source": alert['source']}
+    return list(rows.values())
+
+SERVICE_LINE_SYNC_BATCH = 500
+
+@timed("sync_alert_service_lines", phase="Update")
+def sync_alert_service_lines(alerts):
+    """Replace the alert_service_lines rows of the given alerts. Returns the number of rows written, or None on error."""
     try:
-        log_message("🧹 Cleaning NaN values...", "info", phase="Update")
-        supabase.table("bill_track_50").update({"ai_summary": None, "sponsor_list": None, "bill_progress": None, "last_action": None}).eq("ai_summary", 'NaN').eq("sponsor_list", 'NaN').eq("bill_progress", 'NaN').eq("last_action", 'NaN').execute()
-        log_message(f"✅ Replaced {updated_count} NaN values with NULL", "success", phase="Update")
+        keys = list({alert_key(alert) for alert in alerts})
+        rows = alert_service_line_rows(alerts)
+        table = lambda: get_supabase().table("alert_service_lines")
+        for start in range(0, len(keys), SERVICE_LINE_SYNC_BATCH):
+            table().delete().in_("alert_key", keys[start:start + SERVICE_LINE_SYNC_BATCH]).execute()
+        for start in range(0, len(rows), SERVICE_LINE_SYNC_BATCH):
+            table().insert(rows[start:start + SERVICE_LINE_SYNC_BATCH]).execute()
+        incr("service_line_rows", len(rows))
+        log_message(f"🧭 Synced {len(rows)} service line rows for {len(keys)} alerts", "info", phase="Update")
+        return len(rows)
     except Exception as e:
-        log_message(f"❌ Error replacing NaN values: {e}", "error", phase="Update")
+        log_message(f"❌ Error syncing alert_service_lines: {e}", "error", phase="Update")
+        return None
+
+def _create_preference_snapshot():
+    from preferences import PreferenceSnapshot
+    return PreferenceSnapshot()
+
+def get_preference_snapshot():
+    """The process-wide compiled preference snapshot, refreshed from user_email_preferences"""
+    return _get_client("preferences", _create_preference_snapshot).refresh(fetch_many)
 
 def get_email_recipients():
     """Fetch email recipients from user preferences table in Supabase"""
     try:
         log_message("📧 Fetching email recipients from Supabase database...", "info", phase="Notification")
-        users = supabase.table("user_email_preferences").select("user_email, preferences").eq("preferences", None).execute().data
-        recipients = [user['user_email'] for user in users]
+        recipients = get_preference_snapshot().emails()
         log_message(f"✅ Found {len(recipients)} email recipients from Supabase", "success", phase="Notification")
         return recipients
     except Exception as e:
         log_message(f"❌ Error fetching email recipients from Supabase: {e}", "error", phase="Notification")
         return []
 
-def send_email_notification(new_alerts_count):
-    """Send personalized email notifications using the HTML template and real alert data, matching user preferences."""
-    BREVO_API_KEY = os.getenv("BREVO_API_KEY")
-    configuration = sib_api_v3_sdk.Configuration()
-    configuration.api_key['api-key'] = BREVO_API_KEY
-    api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+def _iso_date(value):
+    """'MM/DD/YYYY' (older rows) or 'YYYY-MM-DD...' (as written by normalize_ingest_frame) -> 'YYYY-MM-DD'"""
+    value = str(value or '').strip()
+    match = re.fullmatch(r"(\d{1,2})/(\d{1,2})/(\d{4})", value)
+    if match:
+        month, day, year = match.groups()
+        return f"{year}-{int(month):02d}-{int(day):02d}"
+    return value[:10]
+
+def alert_key(alert):
+    """Stable identity of an alert across runs: the bill url, or the provider alert's natural_key"""
+    if alert.get('source') == 'bill':
+        return f"bill:{(alert.get('url') or '').strip()}"
+    return f"provider_alert:{provider_alert_key(alert)}"
+
+def _legacy_provider_alert_key(alert):
+    """alert_key of a provider alert before it followed natural_key (a sha1 of its content)"""
+    values = dict(alert, announcement_date=_iso_date(alert.get('announcement_date')))
+    content = "|".join(str(values.get(col) or '').strip() for col in ('state', 'links', 'announcement_date', 'subject'))
+    return f"provider_alert:{hashlib.sha1(content.encode('utf-8')).hexdigest()}"
+
+PROVIDER_ALERT_KEY_COLUMNS = ('state', 'links', 'announcement_date', 'subject')
+
+def provider_alert_key(alert):
+    """int64 natural key of a provider alert, the same value SQL provider_alert_key() computes.
+
+    The key is the first 64 bits of md5('state|links|announcement_date|md5(subject)'), each
+    value trimmed and the date as 'YYYY-MM-DD' (see sql/provider_alerts_natural_key.sql).
+    """
+    state, links, announced, subject = (str(alert.get(col) or '').strip(' \t\r\n') for col in PROVIDER_ALERT_KEY_COLUMNS)
+    subject_hash = hashlib.md5(subject.encode('utf-8')).hexdigest()
+    content = f"{state}|{links}|{_iso_date(announced)}|{subject_hash}"
+    return int.from_bytes(hashlib.md5(content.encode('utf-8')).digest()[:8], "big", signed=True)
+
+def provider_alert_keys(df):
+    """int64 Series of provider_alert_key() for the rows of df"""
+    records = write_records(df.reindex(columns=list(PROVIDER_ALERT_KEY_COLUMNS)))
+    return pd.Series([provider_alert_key(record) for record in records], index=df.index, dtype="int64")
+
+def digest_run_id(alerts, shard=None):
+    """Identify a notify run by the set of new alerts it covers, so a restart maps to the same run.
+
+    A shard (index, count) gets its own run id, so each shard's digests are queued independently.
+    """
+    digest = hashlib.sha1("\n".join(sorted(alert_key(alert) for alert in alerts)).encode('utf-8'))
+    run_id = digest.hexdigest()[:16]
+    if shard is not None:
+        run_id += _shard_run_suffix(shard)
+    return run_id
+
+def _shard_run_suffix(shard):
+    return f"-s{shard[0]}of{shard[1]}"
+
+def shard_run_pattern(shard):
+    """LIKE pattern matching the run ids of every run of shard (index, count)"""
+    return "%" + _shard_run_suffix(shard)
+
+def shard_of(email, shard_count):
+    """Stable recipient shard: first 32 bits of md5(lower(trim(email))), same as SQL recipient_shard()"""
+    return int(hashlib.md5(email.strip().lower().encode('utf-8')).hexdigest()[:8], 16) % shard_count
+
+def match_alerts_to_users(snapshot, alerts, delivered=None, shard=None):
+    """Return [(email, relevant_alerts), ...] for users whose states and categories match new alerts.
+
+    snapshot is a preferences.PreferenceSnapshot; alerts are matched once per segment of users
+    with identical preferences. delivered maps user email (lower-cased) to the alert keys
+    already mailed to that user; those are subtracted so each alert reaches each user once.
+    With shard=(index, count) only recipients in that shard are considered.
+    """
+    delivered = delivered or {}
+    # Preprocess alerts for efficient matching
+    print(f"\n🔍 Processing alerts for matching...")
+    processed_alerts = []
+    for alert in alerts:
+        state_ids, category_ids = snapshot.encode_alert(alert.get('state'), alert_service_lines(alert))
+        if state_ids and category_ids:
+            processed_alerts.append((alert_key(alert), state_ids, category_ids, alert))
+
+    # For each segment of identical preferences, filter relevant alerts once
+    print(f"\n🔍 Matching alerts to {len(snapshot.users)} users in {len(snapshot.segments)} preference segments...")
+    for email in snapshot.skipped:
+        print(f"   ⚠️ {email}: No states or categories configured, skipping")
+    matches = []
+    for segment in snapshot.segments:
+        emails = segment.emails
+        if shard is not None:
+            emails = [email for email in emails if shard_of(email, shard[1]) == shard[0]]
+            if not emails:
+                continue
+        relevant = {
+            key: alert for key, state_ids, category_ids, alert in processed_alerts
+            if not segment.state_ids.isdisjoint(state_ids) and not segment.category_ids.isdisjoint(category_ids)
+        }
+        if not relevant:
+            continue
+        for email in emails:
+            # Relevant and not yet delivered
+            undelivered = relevant.keys() - delivered.get(email.strip().lower(), set())
+            relevant_alerts = [alert for key, alert in relevant.items() if key in undelivered]
+            print(f"   👤 {email}: {len(relevant)} relevant alerts, {len(relevant_alerts)} not yet delivered")
+            if relevant_alerts:
+                matches.append((email, relevant_alerts))
+    return matches
+
+def get_pg_connection():
+    """A new direct Postgres connection (DATABASE_URL), or None when only the REST API is configured"""
+    dsn = get_setting("DATABASE_URL")
+    if not dsn:
+        return None
+    import psycopg2
+    return psycopg2.connect(dsn)
+
+MATCH_FETCH_SIZE = 5000
+
+def iter_db_matches(conn, alert_keys, shard=None):
+    """Yield (user_email, [alert_key, ...]) per user from match_alert_recipients, streamed in batches.
+
+    Uses a server-side cursor, so memory is bounded by MATCH_FETCH_SIZE pairs however many
+    users and alerts match. Rows arrive ordered by user, so each user's keys are contiguous.
+    """
+    with conn.cursor(name="match_alert_recipients") as cursor:
+        cursor.itersize = MATCH_FETCH_SIZE
+        index, count = shard if shard is not None else (0, 1)
+        cursor.execute("SELECT user_email, alert_key FROM match_alert_recipients(%s, %s, %s)", (list(alert_keys), index, count))
+        for email, pairs in itertools.groupby(cursor, key=lambda pair: pair[0]):
+            yield email, [key for _, key in pairs]
+
+def stream_db_matches(conn, alerts, delivered=None, shard=None):
+    """Database-side counterpart of match_alerts_to_users: yields (email, relevant_alerts) per user"""
+    delivered = delivered or {}
+    by_key = {alert_key(alert): alert for alert in alerts}
+    for email, keys in iter_db_matches(conn, by_key, shard):
+        # Relevant and not yet delivered
+        undelivered = set(keys) - delivered.get(email.strip().lower(), set())
+        if undelivered:
+            yield email, [by_key[key] for key in keys if key in undelivered]
 
+def create_payload_builder():
+    """A digest builder for one run: cards rendered once per alert, summaries truncated to
+    EMAIL_SUMMARY_CHARS and each message kept under EMAIL_MAX_BYTES (0 disables either)"""
+    from payload import PayloadBuilder
+    with open(EMAIL_TEMPLATE_PATH, "r", encoding="utf-8") as f:
+        html_template = f.read()
+    return PayloadBuilder(
+        html_template,
+        summary_chars=int(get_setting("EMAIL_SUMMARY_CHARS", "400")),
+        max_bytes=int(get_setting("EMAIL_MAX_BYTES", "90000")),
+    )
+
+def render_digest(relevant_alerts, builder):
+    """Return (subject, html_content, alerts shown, alerts behind the 'more' link) of one user's digest"""
+    return builder.digest(relevant_alerts)
+
+OUTBOX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "email_outbox.sqlite3")
+
+def _create_outbox():
+    from outbox import EmailOutbox, PgEmailOutbox
+    path = get_setting("OUTBOX_PATH", OUTBOX_PATH)
+    dsn = get_setting("DATABASE_URL")
+    if dsn:
+        # One ledger for every host and container; a local SQLite outbox is imported once
+        return PgEmailOutbox(dsn, import_path=path)
+    return EmailOutbox(path)
+
+def get_outbox():
+    """The process-wide durable email outbox: in Postgres when DATABASE_URL is set, else the SQLite file at OUTBOX_PATH"""
+    return _get_client("outbox", _create_outbox)
+
+def _optional_number(name, cast=int):
+    value = get_setting(name)
+    return cast(value) if value not in (None, "") else None
+
+def _create_send_scheduler():
+    from scheduler import SendScheduler, parse_window
+    return SendScheduler(
+        per_second=_optional_number("SEND_RATE_PER_SECOND", float),
+        per_hour=_optional_number("SEND_RATE_PER_HOUR"),
+        per_day=_optional_number("SEND_RATE_PER_DAY"),
+        window=parse_window(get_setting("SEND_WINDOW")),
+        outbox=get_outbox(),
+    )
+
+def get_send_scheduler():
+    """The process-wide send scheduler (unlimited unless SEND_RATE_* / SEND_WINDOW are set)"""
+    return _get_client("send_scheduler", _create_send_scheduler)
+
+def delivery_status(outbox=None):
+    """Queue depth of the outbox and when the scheduler expects to have sent it all"""
+    outbox = outbox or get_outbox()
+    queue_depth = outbox.pending_count()
+    return {"queue_depth": queue_depth, "projected_completion": get_send_scheduler().project_completion(queue_depth)}
+
+def deliver_outbox(outbox, run_id=None, run_pattern=None):
+    """Send pending outbox messages one claim at a time, paced by the send scheduler.
+
+    Only messages of run_id, or of the runs matching run_pattern, when given.
+
+    Waits of up to SEND_MAX_WAIT_SECONDS (default 60) are slept through; a longer wait (hourly
+    or daily budget used up, outside the send window) ends delivery and leaves the rest
+    pending for the next run. Returns the recipients mailed.
+    """
+    from transports import DeliveryUncertain
+    transport = get_mail_transport()
+    scheduler = get_send_scheduler()
+    max_wait = float(get_setting("SEND_MAX_WAIT_SECONDS", "60"))
+    sent_emails = []
+    while True:
+        wait = scheduler.wait_time()
+        if wait > max_wait:
+            deferred = outbox.pending_count(run_id, run_pattern)
+            if deferred:
+                resume_at = datetime.now() + timedelta(seconds=wait)
+                incr("emails_deferred", deferred)
+                log_message(f"⏸️ Send budget or window reached; {deferred} messages stay queued (next send possible at {resume_at:%Y-%m-%d %H:%M})", "warning", phase="Notification")
+            break
+        if wait > 0:
+            time.sleep(wait)
+        claimed = outbox.claim(limit=1, run_id=run_id, run_pattern=run_pattern)
+        if not claimed:
+            break
+        message = claimed[0]
+        scheduler.take()
+        try:
+            with timed(f"send_email_{transport.name}", phase="Notification"):
+                provider_message_id = transport.send(message.recipient, message.subject, message.html)
+        except DeliveryUncertain as e:
+            # Its alerts count as delivered from here on, so no later run mails them again
+            incr("email_errors")
+            outbox.mark_unknown(message.id, e)
+            log_message(f"⚠️ Email to {message.recipient} may have been delivered ({e}); marked 'unknown', not resent", "warning", phase="Notification")
+            continue
+        except Exception as e:
+            print(f"      ❌ Error sending to {message.recipient} (attempt {message.attempts}): {e}")
+            incr("email_errors")
+            outbox.mark_failed(message.id, e)
+            log_message(f"❌ Error sending email notification to {message.recipient}: {e}", "error", phase="Notification")
+            continue
+        outbox.mark_sent(message.id, provider_message_id)
+        incr("emails_sent")
+        print(f"      ✅ Email sent successfully to {message.recipient}")
+        log_message(f"✅ Email notification sent to {message.recipient} with {message.alert_count} alerts", "success", phase="Notification")
+        sent_emails.append(message.recipient)
+    return sent_emails
+
+@timed("send_email_notification", phase="Notification")
+def send_email_notification(new_alerts_count, shard=None):
+    """Send personalized email notifications using the HTML template and real alert data, matching user preferences.
+
+    Rendered digests go through the durable outbox: pending messages left by an interrupted
+    run are delivered first, and a run whose digests are already in the outbox is not
+    matched or rendered again. With shard=(index, count) only recipients in that shard are
+    matched, rendered and sent (see pipeline.run_sharded_notify). Returns the number of
+    emails sent by this call; errors are logged and counted as notify_errors in the run metrics.
+    """
     sent_emails = []
     try:
         print("\n" + "="*80)
         print("🔍 EMAIL NOTIFICATION DEBUG - STARTING PROCESS")
         print("="*80)
-        
-        # Fetch all users and their preferences
-        users = supabase.table("user_email_preferences").select("user_email, preferences").eq("preferences", None).execute().data
-        
-        if not users:
-            print("❌ No recipients found in user_email_preferences table")
-            log_message("❌ No recipients to send email to", "error", phase="Notification")
-            return 0
-            
-        print(f"📧 Found {len(users)} recipients with preferences:")
-        for user in users:
-            email = user['user_email']
-            preferences = user['preferences']
-            states = preferences.get('states', []) if preferences else []
-            categories = preferences.get('categories', []) if preferences else []
-            print(f"   • {email}: States={states}, Categories={categories}")
-        
-        log_message(f"📧 Preparing personalized email notifications for {len(users)} recipients...", "info", phase="Notification")
-
-        # Fetch all new alerts
-        print(f"\n🔍 Fetching new alerts (is_new = 'yes')...")
-        alerts = fetch_new_alerts()
+
+        outbox = get_outbox()
+        if not outbox.alert_keys_current():
+            migrate_provider_alert_keys(outbox)
+        transport = get_mail_transport()
+        from transports import TransportStats
+        transport.stats = TransportStats()
+        unknown = outbox.expire_leases()
+        if unknown:
+            log_message(f"⚠️ {unknown} messages were mid-send when a previous run stopped; marked 'unknown' and not resent", "warning", phase="Notification")
+        # A shard resumes only its own earlier runs; other shards' messages belong to their workers
+        run_pattern = shard_run_pattern(shard) if shard is not None else None
+        leftover = outbox.pending_count(run_pattern=run_pattern)
+        if leftover:
+            log_message(f"♻️ Resuming {leftover} pending messages from an earlier run", "info", phase="Notification")
+            sent_emails += deliver_outbox(outbox, run_pattern=run_pattern)
+
+        # Fetch all candidate alerts
+        since = notify_since(outbox)
+        print(f"\n🔍 Fetching new alerts (is_new = 'yes'{f' or dated since {since}' if since else ''})...")
+        # Without a database connection users are matched from the preference snapshot, whose
+        # refresh goes out in the same batch as the alert reads
+        snapshot = None if get_setting("DATABASE_URL") else _get_client("preferences", _create_preference_snapshot)
+        alerts, snapshot = fetch_notify_inputs(since, snapshot)
         if not alerts:
-            print("❌ No new alerts found (is_new = 'yes')")
+            print("❌ No new alerts found")
             log_message("No new alerts to send emails for.", "info", phase="Notification")
-            return 0
+            return len(sent_emails)
 
+        incr("candidate_alerts", len(alerts))
         print(f"✅ Found {len(alerts)} new alerts:")
         for i, alert in enumerate(alerts[:5]):  # Show first 5 alerts
-            source = alert[0]
-            state = get_full_state_name(alert[2])
-            service_lines = []
-            for idx in [4,5,6,7]:
-                val = alert[idx]
-                if val and str(val).strip():
-                    service_lines.append(str(val).strip())
+            source = alert.get('source')
+            state = get_full_state_name(alert.get('state'))
+            service_lines = alert_service_lines(alert)
             print(f"   {i+1}. [{source}] {state}: {', '.join(service_lines) if service_lines else 'No service lines'}")
         if len(alerts) > 5:
             print(f"   ... and {len(alerts)-5} more alerts")
 
-        # Preprocess alerts for efficient matching
-        print(f"\n🔍 Processing alerts for matching...")
-        processed_alerts = []
-        for alert in alerts:
-            state = (alert[2] or "").strip().upper()
-            state_norm = normalize_state(state)
-            service_lines = set()
-            for idx in [4,5,6,7]:
-                val = alert[idx]
-                if val and str(val).strip():
-                    service_lines.add(str(val).strip().upper())
-            processed_alerts.append({
-                'alert': alert,
-                'state': state,
-                'state_norm': state_norm,
-                'service_lines': service_lines
-            })
-
-        # For each user, filter relevant alerts and send personalized email
-        print(f"\n🔍 Matching alerts to user preferences...")
-        users_with_alerts = 0
-        total_alerts_sent = 0
-        
-        for user in users:
-            email = user['user_email']
-            preferences = user['preferences']
-            if not preferences:
-                print(f"   ⚠️ {email}: No preferences found, skipping")
-                continue
-                
-            user_states_raw = [s for s in preferences.get('states', []) if s and str(s).strip()]
-            user_states = set()
-            for s in user_states_raw:
-                user_states.update(normalize_state(s))
-            user_categories = set([c.strip().upper() for c in preferences.get('categories', []) if c.strip()])
-            
-            print(f"\n   👤 {email}:")
-            print(f"      States: {list(user_states)}")
-            print(f"      Categories: {list(user_categories)}")
-            
-            if not user_states or not user_categories:
-                print(f"      ❌ No states or categories configured, skipping")
-                continue
+        run_id = digest_run_id(alerts, shard)
+        if outbox.has_run(run_id):
+            log_message(f"ℹ️ Digests for run {run_id} are already in the outbox; not rebuilding", "info", phase="Notification")
+        else:
+            # Fetch all users and their preferences
+            delivered = outbox.delivered_alerts(alert_key(alert) for alert in alerts)
+            log_message(f"📒 Ledger: {sum(len(keys) for keys in delivered.values())} of these alerts already delivered to {len(delivered)} users", "info", phase="Notification")
+
+            conn = get_pg_connection()
+            if conn is not None:
+                # Match in Postgres over alert_service_lines and stream (user, alerts) pairs
+                log_message("📧 Matching alerts to user preferences in the database...", "info", phase="Notification")
+                matches = stream_db_matches(conn, alerts, delivered, shard)
+            else:
+                # Compiled user preferences (only users changed since the last run are recompiled)
+                if snapshot is None:
+                    snapshot = get_preference_snapshot()
                 
-            relevant_alerts = []
-            for pa in processed_alerts:
-                if pa['state_norm'] & user_states and pa['service_lines'] & user_categories:
-                    relevant_alerts.append(pa['alert'])
+                if not snapshot.users and not snapshot.skipped:
+                    print("❌ No recipients found in user_email_preferences table")
+                    log_message("❌ No recipients to send email to", "error", phase="Notification")
+                    return len(sent_emails)
                     
-            print(f"      📊 Found {len(relevant_alerts)} relevant alerts")
-            
-            if not relevant_alerts:
-                print(f"      ❌ No relevant alerts for this user")
-                continue
+                print(f"📧 Found {len(snapshot.users)} recipients with preferences:")
+                for user in snapshot.users.values():
+                    print(f"   • {user.email}: States={sorted(user.states)}, Categories={sorted(user.categories)}")
+                
+                log_message(
+                    f"📧 Preparing personalized email notifications for {len(snapshot.users)} recipients "
+                    f"({len(snapshot.segments)} preference segments, {snapshot.last_recompiled} recompiled)...",
+                    "info", phase="Notification",
+                )
+                matches = match_alerts_to_users(snapshot, alerts, delivered, shard)
 
-            users_with_alerts += 1
-            total_alerts_sent += len(relevant_alerts)
-            
-            # Show which alerts matched
-            for alert in relevant_alerts:
-                state = get_full_state_name(alert[2])
-                service_line = alert[4] or alert[5] or alert[6] or alert[7] or "N/A"
-                print(f"         ✅ {state}: {service_line}")
-
-            # Build alert cards HTML for this user
-            alert_cards = []
-            for alert in relevant_alerts:
-                source = alert[0]
-                url = alert[1] or "#"
-                state = get_full_state_name(alert[2])
-                service_lines = ', '.join([str(alert[i]) for i in [4,5,6,7] if alert[i] and str(alert[i]).strip()]) or "N/A"
-                card_html = ''
-                if source == 'bill':
-                    title = alert[8] or alert[3] or "No Title"
-                    summary = alert[9] or "No summary available."
-                    status = alert[10]
-                    committee = alert[11]
-                    introduction_date = alert[12]
-                    last_action_date = alert[13]
-                    sponsors = alert[14]
-                    details = []
-                    if status: details.append(f'<b>Status:</b> {status}')
-                    if committee: details.append(f'<b>Committee:</b> {committee}')
-                    if introduction_date: details.append(f'<b>Introduction Date:</b> {introduction_date}')
-                    if last_action_date: details.append(f'<b>Last Action Date:</b> {last_action_date}')
-                    if sponsors: details.append(f'<b>Sponsors:</b> {sponsors}')
-                    card_html = f'''
-                    <div class="alert-card" style="background:#f8fafc; border-radius:0; box-shadow:none; border-top:1px solid #e2e8f0; border-bottom:1px solid #e2e8f0; padding:32px 40px; font-family:Arial,sans-serif; color:#0F3557; box-sizing:border-box; margin:32px 48px;">
-                      <div style="font-size:16px; font-weight:bold; margin-bottom:8px; color:#0F3557;">
-                        {state}: {title}
-                      </div>
-                      <div style="font-size:14px; margin-bottom:4px;">
-                        <span style="font-weight:600; color:#1e293b;">Service Lines:</span>
-                        <span style="color:#334155;">{service_lines}</span>
-                      </div>
-                      <div style="font-size:14px; margin-bottom:12px;">
-                        <span style="font-weight:600; color:#1e293b;">Summary:</span>
-                        <span style="color:#334155;">{summary}</span>
-                      </div>
-                      {('<div style="font-size:13px; margin-bottom:8px;">' + '<br>'.join(details) + '</div>') if details else ''}
-                      <a href="{url}" style="display:inline-block; background:#0F3557; color:#fff; text-decoration:none; padding:10px 20px; border-radius:6px; font-weight:bold; font-size:14px; margin-top:8px;">
-                        View Details
-                      </a>
-                    </div>
-                    '''
-                elif source == 'provider_alert':
-                    subject = alert[16] or "No Title"
-                    summary = alert[9] or ""
-                    announcement_date = alert[17]
-                    details = []
-                    if announcement_date: details.append(f'<b>Announcement Date:</b> {announcement_date}')
-                    card_html = f'''
-                    <div class="alert-card" style="background:#f8fafc; border-radius:0; box-shadow:none; border-top:1px solid #e2e8f0; border-bottom:1px solid #e2e8f0; padding:32px 40px; font-family:Arial,sans-serif; color:#0F3557; box-sizing:border-box; margin:32px 48px;">
-                      <div style="font-size:16px; font-weight:bold; margin-bottom:8px; color:#0F3557;">
-                        {state}: {subject}
-                      </div>
-                      <div style="font-size:14px; margin-bottom:4px;">
-                        <span style="font-weight:600; color:#1e293b;">Service Lines:</span>
-                        <span style="color:#334155;">{service_lines}</span>
-                      </div>
-                      {f'<div style="font-size:14px; margin-bottom:12px;"><span style="font-weight:600; color:#1e293b;">Summary:</span> <span style="color:#334155;">{summary}</span></div>' if summary else ''}
-                      {('<div style="font-size:13px; margin-bottom:8px;">' + '<br>'.join(details) + '</div>') if details else ''}
-                      <a href="{url}" style="display:inline-block; background:#0F3557; color:#fff; text-decoration:none; padding:10px 20px; border-radius:6px; font-weight:bold; font-size:14px; margin-top:8px;">
-                        View Details
-                      </a>
-                    </div>
-                    '''
-                alert_cards.append(card_html)
-            alert_cards_html = "\n".join(alert_cards)
-
-            # Read the HTML template
-            with open("email_template.html", "r", encoding="utf-8") as f:
-                html_template = f.read()
-            html_content = html_template.replace("{{ALERTS}}", alert_cards_html)
-
-            subject = f"New Medicaid Alerts Relevant to You - {len(relevant_alerts)} Updates"
-            email_data = SendSmtpEmail(
-                to=[{"email": email}],
-                sender={"email": "contact@medirate.net", "name": "Medirate"},
-                subject=subject,
-                html_content=html_content
-            )
+            # Read the HTML template once for the whole run; each alert card is rendered once
+            builder = create_payload_builder()
+            queued_alerts = 0
+            payload_sizes = []
+            overflowed = 0
+            def messages():
+                nonlocal queued_alerts, overflowed
+                for email, relevant_alerts in matches:
+                    subject, html_content, _, overflow = render_digest(relevant_alerts, builder)
+                    size = len(html_content.encode("utf-8"))
+                    payload_sizes.append(size)
+                    queued_alerts += len(relevant_alerts)
+                    if overflow:
+                        overflowed += 1
+                        print(f"      ✂️ {email}: {overflow} of {len(relevant_alerts)} alerts moved behind the Medirate link")
+                    print(f"      📦 {email}: {len(relevant_alerts)} alerts, {size / 1024:.1f} KB")
+                    # Alerts behind the link count as delivered: the digest told the user about them
+                    yield email, subject, html_content, [alert_key(alert) for alert in relevant_alerts]
             try:
-                response = api_instance.send_transac_email(email_data)
-                print(f"      ✅ Email sent successfully to {email}")
-                log_message(f"✅ Email notification sent to {email} with {len(relevant_alerts)} alerts", "success", phase="Notification")
-                sent_emails.append(email)
-            except ApiException as e:
-                print(f"      ❌ API Error sending to {email}: {e}")
-                log_message(f"❌ Error sending email notification to {email}: {e}", "error", phase="Notification")
-            except Exception as e:
-                print(f"      ❌ General Error sending to {email}: {e}")
-                log_message(f"❌ Error sending email notification to {email}: {e}", "error", phase="Notification")
+                queued = outbox.enqueue(run_id, messages())
+            finally:
+                if conn is not None:
+                    conn.close()
+            log_message(f"📬 Queued {queued} digests for run {run_id} ({queued_alerts} alerts)", "info", phase="Notification")
+            if payload_sizes:
+                incr("email_payload_bytes", sum(payload_sizes))
+                incr("email_payload_overflowed", overflowed)
+                log_message(
+                    f"📦 Payload: {sum(payload_sizes) / len(payload_sizes) / 1024:.1f} KB average, "
+                    f"{max(payload_sizes) / 1024:.1f} KB max per message ({builder.card_count} distinct cards, "
+                    f"{overflowed} digests over {builder.max_bytes // 1024 if builder.max_bytes else '∞'} KB linked the rest)",
+                    "info", phase="Notification",
+                )
+
+        sent_emails += deliver_outbox(outbox, run_id=run_id)
+        run_stats = outbox.stats(run_id)
         
         # Print and log summary
         print(f"\n" + "="*80)
         print("📊 EMAIL NOTIFICATION SUMMARY")
         print("="*80)
-        print(f"Total recipients: {len(users)}")
-        print(f"Users with relevant alerts: {users_with_alerts}")
-        print(f"Total alerts sent: {total_alerts_sent}")
+        print(f"Run: {run_id}")
+        print(f"Outbox status: {run_stats}")
         print(f"Emails actually sent: {len(sent_emails)}")
         
         if sent_emails:
@@ -547,24 +981,45 @@ def send_email_notification(new_alerts_count):
             print(f"✅ {summary}")
             log_message(summary, "success", phase="Notification")
         else:
-            print("❌ No emails sent (no relevant alerts for any user)")
-            log_message("No emails sent (no relevant alerts for any user).", "info", phase="Notification")
+            print("❌ No emails sent (no undelivered relevant alerts for any user)")
+            log_message("No emails sent (no undelivered relevant alerts for any user).", "info", phase="Notification")
+        if run_stats.get('failed') or run_stats.get('pending'):
+            log_message(f"⚠️ Run {run_id} has {run_stats.get('pending', 0)} pending and {run_stats.get('failed', 0)} failed messages", "warning", phase="Notification")
+        transport_stats = transport.stats.summary()
+        if transport_stats['messages'] or transport_stats['errors']:
+            log_message(
+                f"📨 {transport.name} transport: {transport_stats['messages']} sent, {transport_stats['errors']} failed, "
+                f"{transport_stats['messages_per_second']} msg/s, latency avg {transport_stats['latency_avg_ms']} ms, "
+                f"p95 {transport_stats['latency_p95_ms']} ms, max {transport_stats['latency_max_ms']} ms",
+                "info", phase="Notification",
+            )
+        status = delivery_status(outbox)
+        if status['queue_depth']:
+            projected = status['projected_completion']
+            projected = f"{projected:%Y-%m-%d %H:%M}" if projected else "not within a year at the current budgets"
+            log_message(f"📮 Outbox queue depth {status['queue_depth']}; projected completion {projected}", "info", phase="Notification")
             
         print("="*80)
         return len(sent_emails)
         
     except Exception as e:
         print(f"❌ CRITICAL ERROR in send_email_notification: {e}")
+        incr("notify_errors")
         log_message(f"❌ Error in send_email_notification: {e}", "error", phase="Notification")
-        return 0
+        return len(sent_emails)
 
-def process_bill_track():
-    """Main function to process Bill Track data"""
+def process_bill_track(notify=True):
+    """Main function to process Bill Track data.
+
+    Returns True when the sheet was processed without errors. With notify=False the email
+    step is left to the caller (see pipeline.run_update_pipeline).
+    """
+    succeeded = False
     try:
         log_message("🚀 Starting Bill Track Processing", "info", phase="Processing")
         
         # Reset is_new flags
-        reset_is_new_flags()
+        reset_is_new_flags(tables=("bill_track_50",))
         
         # Get the available file name
         EXCEL_FILE_NAME = get_available_file_name()
@@ -575,47 +1030,48 @@ def process_bill_track():
         # Get the latest date sheet
         latest_sheet = get_latest_date_sheet(local_excel_filename)
         
+        # Remove duplicates before reading the table, so the diff sees one row per url
+        remove_duplicates_from_db()
+        
         # Get Database data
         db_data = fetch_bills_from_db()
         if db_data is None:
             log_message("❌ Failed to fetch database data", "error", phase="Processing")
-            return
+            return False
         
         try:
+            from urls import add_url_key, url_key_collisions
+            
             # Read the sheet
-            excel_data = pd.read_excel(local_excel_filename, sheet_name=latest_sheet, dtype=str)
+            with timed("parse_bill_sheet", phase="Excel"):
+                excel_data = pd.read_excel(local_excel_filename, sheet_name=latest_sheet, dtype=str)
+            incr("bill_rows_parsed", len(excel_data))
             excel_data.columns = [col.strip().lower() for col in excel_data.columns]
+            excel_data = normalize_ingest_frame(excel_data, "bill_track_50")
             excel_data['source_sheet'] = latest_sheet
             
             # Remove rows where the url column contains "** Data provided by www.BillTrack50.com **"
             excel_data = excel_data[excel_data['url'].str.contains(r'\*\* Data provided by www\.BillTrack50\.com \*\*', case=False, na=False) == False]
+            # Rows without a url can't be matched or stored; key the rest once for every join
+            excel_data = add_url_key(excel_data[excel_data['url'].notna()].copy())
+            collisions = url_key_collisions(excel_data, db_data)
+            if collisions:
+                incr("url_key_collisions", len(collisions))
+                raise ValueError(f"url key collision between different urls: {list(collisions.values())[:3]}")
             
             log_message(f"📊 Processing {len(excel_data)} entries from sheet: {latest_sheet}", "info", phase="Processing")
             
-            # Remove duplicates
-            remove_duplicates_from_db()
-            
             # Insert new entries
-            insert_new_entries(excel_data, db_data)
+            new_entries_count = insert_new_entries(excel_data, db_data)
             
             # Update all columns
             update_all_columns(excel_data, db_data)
             
-            # Replace NaN/nan values with NULL
-            replace_nan_with_null()
-            
-            # Count new entries before processing
-            existing_urls = set(db_data['url'])
-            new_entries_count = len(excel_data[
-                ~excel_data['url'].isin(existing_urls) &
-                excel_data['url'].notna() &
-                (excel_data['url'].str.strip() != '')
-            ])
-            
             # Send email notification if there are new entries
-            if new_entries_count > 0:
+            if notify and new_entries_count > 0:
                 send_email_notification(new_entries_count)
             
+            succeeded = True
         except Exception as e:
             log_message(f"❌ Error processing sheet {latest_sheet}: {e}", "error", phase="Processing")
         
@@ -627,125 +1083,105 @@ def process_bill_track():
         
     except Exception as e:
         log_message(f"❌ Error in Bill Track processing: {e}", "error", phase="Processing")
+        succeeded = False
+    return succeeded
 
 # ============================================================================
 # PROVIDER ALERTS PROCESSING FUNCTIONS
 # ============================================================================
 
-def clear_database():
-    try:
-        log_message("🗑️ Clearing provider_alerts table...", "info", phase="Update")
-        supabase.table("provider_alerts").delete().execute()
-        log_message("✅ Successfully cleared provider_alerts table and reset id sequence", "success", phase="Update")
-    except Exception as e:
-        log_message(f"❌ Error clearing database: {e}", "error", phase="Update")
-
-def format_date(date_str):
-    if pd.isna(date_str) or date_str is None:
-        return None
-    try:
-        date = pd.to_datetime(date_str)
-        return date.strftime('%m/%d/%Y')
-    except:
-        return None
-
-def clean_dataframe(df):
-    df = df.replace(['NaN', 'nan', ''], None)
-    df = df.where(pd.notna(df), None)
-    
-    if 'announcement_date' in df.columns:
-        df['announcement_date'] = df['announcement_date'].apply(format_date)
-    
-    return df
-
 def get_existing_records():
     try:
         log_message("🗄️ Fetching existing provider alerts...", "info", phase="Database")
-        alerts = supabase.table("provider_alerts").select("*").execute().data
+        alerts = get_supabase().table("provider_alerts").select("*").execute().data
         log_message(f"✅ Retrieved {len(alerts)} existing provider alerts", "success", phase="Database")
-        return alerts
+        return apply_ingest_schema(pd.DataFrame(alerts), "provider_alerts", "provider_alerts.db")
     except Exception as e:
         log_message(f"❌ Error fetching existing records: {e}", "error", phase="Database")
-        return pd.DataFrame()
+        return None
 
-def reset_sequence():
-    try:
-        log_message("🔄 Resetting auto-increment sequence...", "info", phase="Update")
-        supabase.table("provider_alerts").update({"id": None}).execute()
-        log_message(f"✅ Reset sequence to start from ID: 1", "success", phase="Update")
-    except Exception as e:
-        log_message(f"❌ Error resetting sequence: {e}", "error", phase="Update")
+def _changed_values(left, right):
+    """Per row, whether two aligned columns differ (missing equals missing, text compared stripped)"""
+    left_na, right_na = left.isna().to_numpy(), right.isna().to_numpy()
+    differs = left.astype(str).str.strip().to_numpy() != right.astype(str).str.strip().to_numpy()
+    return (left_na != right_na) | (~left_na & ~right_na & differs)
 
+@timed("update_or_insert_provider_data", phase="Update")
 def update_or_insert_provider_data(excel_data):
+    """Upsert the sheet's provider alerts on their natural key, writing only new and changed rows.
+
+    Rows are matched on provider_alert_keys(), not on the sheet's id column; the table's own
+    ids are never written. New alerts are flagged is_new. Both writes upsert on the unique
+    natural_key index, so a row a concurrent run inserted is updated rather than duplicated.
+    """
     try:
         log_message("🔄 Starting provider alerts update/insert process...", "info", phase="Update")
         
         # Reset is_new flags
-        reset_is_new_flags()
-        
-        # Reset the sequence first to avoid ID conflicts
-        reset_sequence()
+        reset_is_new_flags(tables=("provider_alerts",))
         
         existing_data = get_existing_records()
+        if existing_data is None:
+            return False
         
-        updated_count = 0
-        inserted_count = 0
-        skipped_count = 0
+        sheet = excel_data.drop(columns=['id', 'is_new', 'natural_key'], errors='ignore')
+        sheet = sheet.assign(natural_key=provider_alert_keys(sheet))
+        # One row per key, as the unique index requires (the last one in the sheet wins)
+        duplicate_count = int(sheet['natural_key'].duplicated(keep='last').sum())
+        sheet = sheet.drop_duplicates(subset='natural_key', keep='last')
         
-        # Count new entries
-        new_entries_count = 0
-        new_alerts_preview = []
+        if existing_data.empty:
+            existing_data = pd.DataFrame({'natural_key': pd.Series(dtype='int64')})
+        else:
+            existing_data = existing_data.assign(natural_key=provider_alert_keys(existing_data))
+        existing_data = existing_data.drop_duplicates(subset='natural_key', keep='first')
         
-        for idx, row in excel_data.iterrows():
-            row_id = row.get('id')
-            
-            # If row has an ID and it exists in database, update it
-            if row_id and not pd.isna(row_id) and not existing_data.empty and str(row_id) in existing_data['id'].astype(str).values:
-                existing_row = existing_data[existing_data['id'].astype(str) == str(row_id)].iloc[0]
-                changed_columns = []
-                changed_values = []
-                
-                for col in row.index:
-                    if col != 'id':
-                        excel_val = row[col]
-                        db_val = existing_row[col]
-                        if (pd.isna(excel_val) and pd.isna(db_val)) or (excel_val == db_val):
-                            continue
-                        changed_columns.append(col)
-                        changed_values.append(excel_val)
-                
-                if changed_columns:
-                    supabase.table("provider_alerts").update({"id": row_id}).eq("id", row_id).execute()
-                    updated_count += 1
-                else:
-                    skipped_count += 1
-            # If row has no ID or ID doesn't exist in database, insert as new record
-            else:
-                new_entries_count += 1
-                insert_columns = [col for col in row.index if col != 'id']
-                insert_values = [row[col] for col in insert_columns]
-                insert_columns.append('is_new')
-                insert_values.append('yes')
-                supabase.table("provider_alerts").insert(dict(zip(insert_columns, insert_values))).execute()
-                inserted_count += 1
-                if len(new_alerts_preview) < 5:
-                    new_alerts_preview.append(row)
+        is_existing = sheet['natural_key'].isin(existing_data['natural_key'].to_numpy())
+        new_entries = sheet[~is_existing].copy()
+        
+        # Compare the sheet's columns with the stored row of the same key
+        merged = sheet[is_existing].merge(existing_data, on='natural_key', how='left', suffixes=('', '_db'), validate='one_to_one')
+        changed = np.zeros(len(merged), dtype=bool)
+        for col in sheet.columns:
+            if col != 'natural_key' and f'{col}_db' in merged.columns:
+                changed |= _changed_values(merged[col], merged[f'{col}_db'])
+            elif col != 'natural_key':
+                changed |= merged[col].notna().to_numpy()
+        updates = merged.loc[changed, list(sheet.columns)]
+        
+        if not updates.empty:
+            get_supabase().table("provider_alerts").upsert(write_records(updates), on_conflict="natural_key").execute()
+        if not new_entries.empty:
+            new_entries['is_new'] = 'yes'
+            get_supabase().table("provider_alerts").upsert(write_records(new_entries), on_conflict="natural_key").execute()
         
+        updated_count, inserted_count = len(updates), len(new_entries)
+        skipped_count = len(merged) - updated_count
+        incr("provider_alerts_updated", updated_count)
+        incr("provider_alerts_inserted", inserted_count)
+        written = pd.concat([updates, new_entries.drop(columns=['is_new'])], ignore_index=True)
+        if not written.empty:
+            sync_alert_service_lines(alert_records(written, "provider_alert"))
+        if duplicate_count:
+            log_message(f"ℹ️ Skipped {duplicate_count} sheet rows repeating an earlier alert", "info", phase="Update")
         log_message(f"✅ Update complete - Updated: {updated_count}, Inserted: {inserted_count}, Skipped: {skipped_count}", "success", phase="Update")
         
         # Log details of new provider alerts (up to 5)
-        if new_entries_count > 0:
-            log_message(f"📝 Found {new_entries_count} new provider alerts to insert", "info", phase="Update")
-            for row in new_alerts_preview:
+        if inserted_count > 0:
+            log_message(f"📝 Found {inserted_count} new provider alerts to insert", "info", phase="Update")
+            for idx, row in new_entries.head(5).iterrows():
                 log_message(f"🆕 NEW ALERT: {row.get('subject', '')} | {row.get('state', '')} | {row.get('links', '')}", "success", phase="Update")
-            if new_entries_count > 5:
-                log_message(f"...and {new_entries_count-5} more new provider alerts.", "info", phase="Update")
+            if inserted_count > 5:
+                log_message(f"...and {inserted_count-5} more new provider alerts.", "info", phase="Update")
+        return True
             
     except Exception as e:
         log_message(f"❌ Error updating/inserting provider data: {e}", "error", phase="Update")
+        return False
 
 def process_provider_alerts():
-    """Main function to process Provider Alerts data"""
+    """Main function to process Provider Alerts data. Returns True when processed without errors."""
+    succeeded = False
     try:
         log_message("🚀 Starting Provider Alerts Processing", "info", phase="Processing")
         
@@ -755,11 +1191,14 @@ def process_provider_alerts():
         
         try:
             log_message(f"📊 Reading Excel file: {local_excel_filename}", "info", phase="Excel")
-            excel_data = pd.read_excel(local_excel_filename, sheet_name='provideralerts_data', dtype=str)
+            with timed("parse_provider_alerts_sheet", phase="Excel"):
+                excel_data = pd.read_excel(local_excel_filename, sheet_name='provideralerts_data', dtype=str)
+            incr("provider_alert_rows_parsed", len(excel_data))
             excel_data.columns = [col.strip().lower().replace(' ', '_') for col in excel_data.columns]
+            excel_data = normalize_ingest_frame(excel_data, "provider_alerts")
             log_message(f"📊 Read {len(excel_data)} rows from Excel", "success", phase="Excel")
             
-            update_or_insert_provider_data(excel_data)
+            succeeded = update_or_insert_provider_data(excel_data)
             
         except Exception as e:
             log_message(f"❌ Error processing provider alerts: {e}", "error", phase="Processing")
@@ -771,28 +1210,125 @@ def process_provider_alerts():
         
     except Exception as e:
         log_message(f"❌ Error in Provider Alerts processing: {e}", "error", phase="Processing")
+        succeeded = False
+    return succeeded
+
+# (table, source, date column used for the notify lookback window)
+ALERT_SOURCES = (
+    ("bill_track_50", "bill", "date_extracted"),
+    ("provider_alerts", "provider_alert", "announcement_date"),
+)
+
+def alert_queries(since=None):
+    """The data_access.TableQuery reads behind fetch_new_alerts, as [(source, query)]"""
+    from data_access import table_query
+    queries = []
+    for table, source, date_column in ALERT_SOURCES:
+        queries.append((source, table_query(table, "*", ("ilike", "is_new", "yes"))))
+        if since is not None:
+            queries.append((source, table_query(table, "*", ("gte", date_column, since.isoformat()))))
+    return queries
 
-def fetch_new_alerts():
-    """Fetch all new alerts (is_new = 'yes', case-insensitive) from both bills and provider alerts tables."""
+def collect_alerts(sources, results, since=None):
+    """Merge the rows of alert_queries() into unique alerts tagged with their source"""
+    alerts = {}
+    for source, rows in zip(sources, results):
+        for row in rows:
+            alert = dict(row, source=source)
+            alerts.setdefault(alert_key(alert), alert)
+    alerts = list(alerts.values())
+    window = f" or dated since {since}" if since is not None else ""
+    log_message(f"✅ Fetched {len(alerts)} candidate alerts (is_new = 'yes'{window})", "success", phase="Database")
+    return alerts
+
+def fetch_new_alerts(since=None):
+    """Fetch candidate alerts from both bills and provider alerts tables.
+
+    Candidates are rows flagged is_new = 'yes' (case-insensitive) plus, when since is given,
+    rows whose extraction/announcement date is on or after it, so alerts ingested by an update
+    that ran without notify are not lost when the flags are reset. Each row is a dict of its
+    table's columns plus 'source' ('bill' or 'provider_alert'). All the reads run concurrently.
+    """
     try:
-        alerts = supabase.table("bill_track_50").select("*").eq("LOWER(TRIM(is_new))", "yes").execute().data
-        alerts += supabase.table("provider_alerts").select("*").eq("LOWER(TRIM(is_new))", "yes").execute().data
-        log_message(f"✅ Fetched {len(alerts)} new alerts (is_new = 'yes')", "success", phase="Database")
-        return alerts
+        sources, queries = zip(*alert_queries(since))
+        return collect_alerts(sources, fetch_many(queries), since)
     except Exception as e:
         log_message(f"❌ Error fetching new alerts from Supabase DB: {e}", "error", phase="Database")
         return []
 
-# Replace the old fetch_bills_and_alerts call in your main process with fetch_new_alerts
-# Example main process update:
-if __name__ == "__main__":
-    print("\n✅ Fetching user preferences...")
-    users = fetch_user_preferences()
+@timed("fetch_notify_inputs", phase="Database")
+def fetch_notify_inputs(since=None, snapshot=None):
+    """Candidate alerts and, when given, the preference snapshot refreshed, in one concurrent batch.
+
+    Returns (alerts, snapshot). If the batch fails (e.g. user_email_preferences has no
+    updated_at column yet) both are read again on their own.
+    """
+    sources, queries = zip(*alert_queries(since))
+    preference_queries = snapshot.queries() if snapshot is not None else []
+    try:
+        results = fetch_many(list(queries) + preference_queries)
+    except Exception as e:
+        log_message(f"⚠️ Concurrent alert and preference fetch failed ({e}); reading them separately", "warning", phase="Database")
+        return fetch_new_alerts(since), (snapshot.refresh(fetch_many) if snapshot is not None else None)
+    alerts = collect_alerts(sources, results[:len(queries)], since)
+    if snapshot is not None:
+        snapshot.apply(results[len(queries):])
+    return alerts, snapshot
 
-    print("\n✅ Fetching new alerts from database...")
-    alerts = fetch_new_alerts()
+def backfill_alert_service_lines(sources=None):
+    """Rebuild alert_service_lines for every bill and provider alert (or only the given sources).
 
-    if alerts:
-        match_alerts_to_users(users, alerts)
-    else:
-        print(f"\n🚫 No new alerts found (is_new = 'yes')") 
\ No newline at end of file
+    The source's rows are deleted first, so rows under keys that no longer exist go too.
+    Returns the rows written, or None on error.
+    """
+    written = 0
+    for table, source, _ in ALERT_SOURCES:
+        if sources is not None and source not in sources:
+            continue
+        try:
+            rows = get_supabase().table(table).select("*").execute().data
+            get_supabase().table("alert_service_lines").delete().eq("source", source).execute()
+        except Exception as e:
+            log_message(f"❌ Error reading {table} for alert_service_lines: {e}", "error", phase="Update")
+            return None
+        synced = sync_alert_service_lines([dict(row, source=source) for row in rows])
+        if synced is None:
+            return None
+        written += synced
+    return written
+
+def migrate_provider_alert_keys(outbox):
+    """Move the ledger, queued messages and alert_service_lines to natural_key provider alert keys.
+
+    Runs once, from the first notify after the upgrade: the old sha1 keys of every provider
+    alert are mapped to alert_key() in the outbox, and the provider alert rows of
+    alert_service_lines are rebuilt. Raises on error, so notify stops rather than mailing
+    alerts again under their new keys.
+    """
+    rows = get_supabase().table("provider_alerts").select(", ".join(PROVIDER_ALERT_KEY_COLUMNS)).execute().data
+    mapping = {_legacy_provider_alert_key(row): alert_key(dict(row, source="provider_alert")) for row in rows}
+    rekeyed = outbox.rekey_alerts(mapping)
+    if rekeyed is None:
+        return
+    ledger_rows, messages = rekeyed
+    log_message(f"🔑 Rekeyed {ledger_rows} ledger rows and {messages} outbox messages to provider alert natural keys", "info", phase="Notification")
+    # Without DATABASE_URL matching does not read alert_service_lines, so a failed rebuild can wait
+    if backfill_alert_service_lines(sources=("provider_alert",)) is None and get_setting("DATABASE_URL"):
+        raise RuntimeError("alert_service_lines could not be rebuilt; run `python worker.py sync-service-lines`")
+
+def notify_since(outbox):
+    """Start of the notify lookback window (NOTIFY_LOOKBACK_DAYS, default 7; 0 disables it).
+
+    Never earlier than when the ledger started, since older alerts may have been mailed
+    before delivery was tracked.
+    """
+    days = int(get_setting("NOTIFY_LOOKBACK_DAYS", "7"))
+    if days <= 0:
+        return None
+    return max(datetime.now() - timedelta(days=days), outbox.ledger_started_at()).date()
+
+if __name__ == "__main__":
+    # Headless runs live in worker.py; keep this entry point working for old cron lines
+    import sys
+    from worker import main
+    sys.exit(main(["notify"] + sys.argv[1:]))
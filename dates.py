@@ -0,0 +1,105 @@
+import pandas as pd
+
+# ============================================================================
+# DATE NORMALIZATION
+# ============================================================================
+
+# Formats seen in the sheets and the tables, most common first
+DATE_FORMATS = ('%m/%d/%Y', '%Y-%m-%d', 'ISO8601', '%m/%d/%y', '%m-%d-%Y', '%Y/%m/%d', '%B %d, %Y', '%b %d, %Y')
+
+# Distinct values sampled to detect a column's format
+SAMPLE_SIZE = 200
+# Raw strings remembered from columns that don't follow one format
+MEMO_SIZE = 10000
+# Unparseable values kept per column for the report
+REPORT_SAMPLES = 5
+
+
+def _naive(parsed):
+    """Drop the time zone (converting to UTC) so every result is tz-naive datetime64"""
+    if isinstance(parsed, pd.Series):
+        return parsed.dt.tz_convert(None) if getattr(parsed.dt, 'tz', None) is not None else parsed
+    return parsed.tz_convert(None) if parsed is not pd.NaT and parsed.tzinfo is not None else parsed
+
+
+def _to_datetime(values, fmt):
+    """pd.to_datetime under fmt, tz-naive in UTC; unparseable -> NaT.
+
+    Parsed with utc=True: values with different UTC offsets would otherwise come back as an
+    object Series of Timestamps rather than datetime64. Values without an offset are kept as is.
+    """
+    return _naive(pd.to_datetime(values, format=fmt, errors='coerce', utc=True))
+
+
+class DateParser:
+    """Parses whole date columns at once into datetime64 dates.
+
+    Each column's format is detected once, from a sample of its distinct values, and cached
+    under the column's key, so later columns with that key are parsed in one vectorized call.
+    Values the cached format doesn't fit (messy, mixed columns) are tried against every
+    format one distinct string at a time, through a bounded memo. Values no format parses
+    become NaT and are recorded for take_unparseable() instead of raising.
+    """
+
+    def __init__(self, formats=DATE_FORMATS, memo_size=MEMO_SIZE):
+        self.formats = formats
+        self.memo_size = memo_size
+        self.column_formats = {}
+        self._memo = {}
+        self._unparseable = {}
+
+    def detect_format(self, text):
+        """The format that parses most of a sample of text's distinct values, or None"""
+        sample = text.dropna().drop_duplicates().head(SAMPLE_SIZE)
+        best, best_hits = None, 0
+        for fmt in self.formats:
+            hits = int(_to_datetime(sample, fmt).notna().sum())
+            if hits > best_hits:
+                best, best_hits = fmt, hits
+            if hits == len(sample):
+                break
+        return best
+
+    def parse_one(self, raw):
+        """Timestamp of one raw string under the first format that fits, else NaT (memoized)"""
+        if raw in self._memo:
+            return self._memo[raw]
+        parsed = pd.NaT
+        for fmt in self.formats:
+            parsed = _to_datetime(raw, fmt)
+            if parsed is not pd.NaT:
+                break
+        if len(self._memo) < self.memo_size:
+            self._memo[raw] = parsed
+        return parsed
+
+    def parse(self, values, key=None):
+        """values -> datetime64[ns] Series of dates (time of day dropped); missing or unparseable -> NaT"""
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return _naive(values).dt.normalize()
+        key = values.name if key is None else key
+        text = values.astype('string').str.strip().replace('', pd.NA)
+        present = text.notna()
+        fmt = self.column_formats.get(key)
+        if fmt is None and present.any():
+            fmt = self.column_formats[key] = self.detect_format(text)
+        if fmt is not None:
+            parsed = _to_datetime(text, fmt).copy()  # own data: leftovers are filled in below
+        else:
+            parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+        leftover = present & parsed.isna()
+        if leftover.any():
+            raw = text[leftover]
+            lookup = {value: self.parse_one(value) for value in raw.unique()}
+            parsed[leftover] = pd.to_datetime(raw.map(lookup))
+            failed = raw[parsed[leftover].isna()]
+            if len(failed):
+                count, samples = self._unparseable.get(key, (0, []))
+                samples = (samples + [value for value in failed.unique()[:REPORT_SAMPLES] if value not in samples])[:REPORT_SAMPLES]
+                self._unparseable[key] = (count + len(failed), samples)
+        return parsed.dt.normalize()
+
+    def take_unparseable(self):
+        """{key: (count, sample values)} of values that could not be parsed since the last call"""
+        report, self._unparseable = self._unparseable, {}
+        return report
@@ -0,0 +1,136 @@
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from data_processor import log_to, log_message
+from log_buffer import LogBuffer
+
+# ============================================================================
+# BACKGROUND JOB RUNNER
+# ============================================================================
+
+class Job:
+    """A named unit of background work made of ordered steps, with progress and captured logs"""
+
+    def __init__(self, name, steps):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.steps = steps
+        self.status = "pending"
+        self.current_step = None
+        self.completed_steps = 0
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.logs = LogBuffer()
+        self._lock = threading.Lock()
+
+    @property
+    def is_active(self):
+        return self.status in ("pending", "running")
+
+    @property
+    def progress(self):
+        if not self.steps:
+            return 1.0
+        return self.completed_steps / len(self.steps)
+
+    def log(self, record):
+        """Log sink used while the job runs"""
+        self.logs.append(record)
+
+    def run(self):
+        with self._lock:
+            self.status = "running"
+            self.started_at = datetime.now()
+        with log_to(self.log):
+            try:
+                for label, func in self.steps:
+                    with self._lock:
+                        self.current_step = label
+                    func()
+                    with self._lock:
+                        self.completed_steps += 1
+                status = "succeeded"
+            except Exception as e:
+                self.error = f"{e}"
+                log_message(f"❌ Job {self.name} failed during '{self.current_step}': {e}", "error", phase="Processing")
+                print(traceback.format_exc())
+                status = "failed"
+        with self._lock:
+            self.status = status
+            self.current_step = None
+            self.finished_at = datetime.now()
+
+    def snapshot(self):
+        """Return a consistent, copy-on-read view of the job for rendering"""
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "name": self.name,
+                "status": self.status,
+                "progress": self.progress,
+                "current_step": self.current_step,
+                "completed_steps": self.completed_steps,
+                "total_steps": len(self.steps),
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "logs": self.logs,
+            }
+
+
+class JobRunner:
+    """Runs jobs on a small thread pool with single-flight semantics per job name.
+
+    One runner is shared by every Streamlit session (see get_job_runner in app.py), so a
+    second admin clicking the same button attaches to the in-flight job instead of
+    starting another one.
+    """
+
+    def __init__(self, max_workers=2, history=20):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="medirate-job")
+        self._lock = threading.Lock()
+        self._history = history
+        self._jobs = {}
+        self._latest = {}
+
+    def submit(self, name, steps):
+        """Start a job unless one with the same name is already active.
+
+        Returns (job, started) where started is False when an in-flight job was reused.
+        """
+        with self._lock:
+            current = self._jobs.get(self._latest.get(name))
+            if current is not None and current.is_active:
+                return current, False
+            job = Job(name, steps)
+            self._prune()
+            self._jobs[job.job_id] = job
+            self._latest[name] = job.job_id
+            self._executor.submit(job.run)
+            return job, True
+
+    def _prune(self):
+        # Keep only the most recent finished jobs; dicts preserve insertion order
+        latest = set(self._latest.values())
+        finished = [job_id for job_id, job in self._jobs.items() if not job.is_active and job_id not in latest]
+        for job_id in finished[:max(0, len(finished) - self._history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self, name):
+        """Most recent job submitted under name, finished or not"""
+        with self._lock:
+            return self._jobs.get(self._latest.get(name))
+
+    def is_running(self, name):
+        job = self.latest(name)
+        return job is not None and job.is_active
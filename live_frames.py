@@ -0,0 +1,205 @@
+import json
+import select
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# ============================================================================
+# LIVE DASHBOARD FRAMES
+# ============================================================================
+
+# Channel the sql/change_notify.sql triggers notify on
+CHANNEL = "medirate_table_changes"
+
+# Watched tables -> (key column their notifications carry, parser of the text keys).
+# service_category_list comes first so the alert tables can be typed with its categories.
+TABLE_KEYS = {
+    "service_category_list": ("categories", str),
+    "bill_track_50": ("url_key", int),
+    "provider_alerts": ("id", int),
+}
+
+TRIGGERED_TABLES_SQL = """
+SELECT DISTINCT c.relname
+FROM pg_trigger t
+JOIN pg_class c ON c.oid = t.tgrelid
+JOIN pg_proc p ON p.oid = t.tgfoid
+WHERE p.proname = 'notify_changed_keys' AND NOT t.tgisinternal
+"""
+
+
+def _align_categories(frame, rows):
+    """Give rows' categorical columns frame's categories, widened when rows bring new values"""
+    for col in frame.columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype) and col in rows.columns:
+            extra = [value for value in rows[col].dropna().unique() if value not in frame[col].cat.categories]
+            if extra:
+                frame[col] = frame[col].cat.add_categories(extra)
+            rows[col] = rows[col].astype(object).where(rows[col].notna(), None).astype(frame[col].dtype)
+    return frame, rows
+
+
+def patch_frame(frame, rows, key_column, keys):
+    """A new frame with the rows of frame under keys replaced by rows.
+
+    Updated rows keep their position, new ones are appended and keys rows doesn't have
+    (deleted) are dropped. frame itself is left untouched.
+    """
+    rows = rows.drop_duplicates(key_column, keep="last").reset_index(drop=True)
+    touched = np.flatnonzero(frame[key_column].isin(keys).to_numpy())
+    touched_keys = pd.Index(frame[key_column].array[touched])
+    replacement = pd.Index(rows[key_column].array).get_indexer(touched_keys)
+    replacement[touched_keys.duplicated()] = -1
+    # One take over frame + rows: row i of frame, its replacement, or nothing if deleted
+    order = np.arange(len(frame))
+    order[touched] = np.where(replacement >= 0, len(frame) + replacement, -1)
+    appended = np.setdiff1d(np.arange(len(rows)), replacement[replacement >= 0])
+    order = np.concatenate([order[order >= 0], len(frame) + appended])
+    frame, rows = _align_categories(frame.copy(deep=False), rows.copy())
+    return pd.concat([frame, rows], ignore_index=True).take(order).reset_index(drop=True)
+
+
+class LiveFrames:
+    """Shared in-memory copies of the dashboard tables, kept current by LISTEN/NOTIFY.
+
+    start() LISTENs on CHANNEL, loads every table (concurrently) and hands the connection
+    to a daemon thread. The thread collects notifications for `debounce` seconds, then
+    re-reads only the rows whose keys changed and patches them into the frames. Frames are
+    replaced, never modified, so get() hands them out without copying. When the
+    connection drops, the thread reconnects and reloads everything, since notifications
+    sent in between are lost.
+
+    read(sql, params) returns a DataFrame; listen_connect() opens a new psycopg2
+    connection for LISTEN. transform(df, table, frames) types freshly read rows; frames
+    holds the tables already loaded, in TABLE_KEYS order.
+    """
+
+    def __init__(self, read, listen_connect, transform=None, tables=TABLE_KEYS, debounce=0.5, retry_seconds=5.0):
+        self.read = read
+        self.listen_connect = listen_connect
+        self.transform = transform
+        self.tables = tables
+        self.debounce = debounce
+        self.retry_seconds = retry_seconds
+        self.frames = {}
+        self.versions = {table: 0 for table in tables}
+        self.notifying = set()
+        self.listening = False
+        self.last_change_at = None
+        self.last_error = None
+        self.rows_patched = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _typed(self, df, table, frames=None):
+        if self.transform is None:
+            return df
+        return self.transform(df, table, self.frames if frames is None else frames)
+
+    def _connect(self):
+        conn = self.listen_connect()
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f"LISTEN {CHANNEL}")
+        cursor.execute(TRIGGERED_TABLES_SQL)
+        self.notifying = {name for (name,) in cursor.fetchall()} & set(self.tables)
+        return conn
+
+    def load_all(self):
+        """Read every table in full (all at once) and replace the frames"""
+        with ThreadPoolExecutor(max_workers=len(self.tables)) as executor:
+            futures = {table: executor.submit(self.read, f"SELECT * FROM {table}") for table in self.tables}
+            raw = {table: future.result() for table, future in futures.items()}
+        frames = {}
+        for table in self.tables:
+            frames[table] = self._typed(raw[table], table, frames)
+        with self._lock:
+            self.frames.update(frames)
+            for table in self.tables:
+                self.versions[table] += 1
+
+    def reload(self, table):
+        """Read one table in full"""
+        df = self._typed(self.read(f"SELECT * FROM {table}"), table)
+        with self._lock:
+            self.frames[table] = df
+            self.versions[table] += 1
+
+    def patch(self, table, keys):
+        """Re-read the rows of table under keys (text or parsed) and patch them into its frame"""
+        key_column, parse = self.tables[table]
+        keys = sorted({parse(key) for key in keys})
+        if not keys:
+            return
+        rows = self._typed(self.read(f"SELECT * FROM {table} WHERE {key_column} = ANY(%s)", (keys,)), table)
+        with self._lock:
+            self.frames[table] = patch_frame(self.frames[table], rows, key_column, keys)
+            self.versions[table] += 1
+            self.rows_patched += len(keys)
+            self.last_change_at = datetime.now()
+
+    def get(self, table):
+        """(frame, version) of table; the frame must be treated as read-only"""
+        with self._lock:
+            return self.frames[table], self.versions[table]
+
+    def start(self):
+        """Listen, load the tables and start the listener thread; raises if the first load fails"""
+        conn = self._connect()
+        try:
+            self.load_all()
+        except Exception:
+            conn.close()
+            raise
+        self._thread = threading.Thread(target=self._run, args=(conn,), name="live-frames", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, conn):
+        while not self._stop.is_set():
+            try:
+                if conn is None:
+                    # LISTEN before reloading, so changes made during the reload are not missed
+                    conn = self._connect()
+                    self.load_all()
+                self.listening = True
+                self.last_error = None
+                self._listen(conn)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"[LIVE][ERROR] {e}; reconnecting in {self.retry_seconds:.0f}s")
+                self._stop.wait(self.retry_seconds)
+            finally:
+                self.listening = False
+                if conn is not None:
+                    conn.close()
+                    conn = None
+
+    def _listen(self, conn):
+        pending = {}
+        deadline = None
+        while not self._stop.is_set():
+            timeout = 1.0 if deadline is None else max(deadline - time.monotonic(), 0)
+            if select.select([conn], [], [], timeout)[0]:
+                conn.poll()
+                while conn.notifies:
+                    change = json.loads(conn.notifies.pop(0).payload)
+                    if change.get("table") in self.tables:
+                        pending.setdefault(change["table"], set()).update(change.get("keys") or ())
+                        if deadline is None:
+                            deadline = time.monotonic() + self.debounce
+            if deadline is not None and time.monotonic() >= deadline:
+                for table, keys in pending.items():
+                    self.patch(table, keys)
+                    print(f"[LIVE] Patched {len(keys)} changed rows into {table}")
+                pending, deadline = {}, None
@@ -0,0 +1,105 @@
+import html
+import threading
+from collections import deque, namedtuple
+
+# ============================================================================
+# BOUNDED STRUCTURED LOG BUFFER
+# ============================================================================
+
+# Phases in the order the dashboard renders them; unknown phases are rendered last
+PHASE_ORDER = ["Connection", "Download", "Excel", "Database", "Update", "Processing", "Notification", "General"]
+
+# Most recent records kept per phase; older ones are dropped but still counted
+DEFAULT_MAX_PER_PHASE = 500
+
+LEVEL_COLORS = {
+    "success": "#22c55e",
+    "error": "#ef4444",
+    "warning": "#eab308",
+    "info": "#60a5fa",
+}
+
+
+class LogRecord(namedtuple("LogRecord", "timestamp level phase message")):
+    """One log_message call: a datetime, a level (info/success/warning/error), a phase and the text"""
+    __slots__ = ()
+
+    @property
+    def formatted(self):
+        return f"[{self.timestamp:%H:%M:%S}] {self.message}"
+
+
+class LogBuffer:
+    """Thread-safe ring buffer of LogRecords, bounded per phase.
+
+    Appends are O(1) and memory is capped at max_per_phase records per phase however long
+    the run is; total() and dropped() still report how many records were emitted.
+    """
+
+    def __init__(self, max_per_phase=DEFAULT_MAX_PER_PHASE):
+        self.max_per_phase = max_per_phase
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._totals = {}
+        self._recent = deque(maxlen=max_per_phase)
+
+    def __len__(self):
+        with self._lock:
+            return sum(self._totals.values())
+
+    def append(self, record):
+        with self._lock:
+            records = self._phases.get(record.phase)
+            if records is None:
+                records = self._phases[record.phase] = deque(maxlen=self.max_per_phase)
+            records.append(record)
+            self._totals[record.phase] = self._totals.get(record.phase, 0) + 1
+            self._recent.append(record)
+
+    def copy(self):
+        """Independent copy, e.g. to hand a finished job's logs to one session"""
+        clone = LogBuffer(self.max_per_phase)
+        with self._lock:
+            clone._phases = {phase: deque(records, maxlen=self.max_per_phase) for phase, records in self._phases.items()}
+            clone._totals = dict(self._totals)
+            clone._recent = deque(self._recent, maxlen=self.max_per_phase)
+        return clone
+
+    def phases(self):
+        """Phases that have records, in PHASE_ORDER first and then first-seen order"""
+        with self._lock:
+            seen = list(self._phases)
+        return [phase for phase in PHASE_ORDER if phase in seen] + [phase for phase in seen if phase not in PHASE_ORDER]
+
+    def records(self, phase=None):
+        """Retained records of one phase, or the most recent records across all phases when phase is None"""
+        with self._lock:
+            if phase is None:
+                return list(self._recent)
+            return list(self._phases.get(phase, ()))
+
+    def tail(self, n):
+        with self._lock:
+            return list(self._recent)[-n:]
+
+    def total(self, phase):
+        with self._lock:
+            return self._totals.get(phase, 0)
+
+    def dropped(self, phase):
+        with self._lock:
+            return self._totals.get(phase, 0) - len(self._phases.get(phase, ()))
+
+
+def render_phase_html(buffer, phase, indent=True):
+    """Render every retained record of a phase as a single HTML block (one st.markdown call)"""
+    pad = "&nbsp;&nbsp;&nbsp;" if indent and phase != "General" else ""
+    lines = []
+    dropped = buffer.dropped(phase)
+    if dropped:
+        lines.append(f'{pad}<span style="color: #eab308;">… {dropped} earlier messages not shown</span>')
+    for record in buffer.records(phase):
+        color = LEVEL_COLORS.get(record.level, LEVEL_COLORS["info"])
+        weight = "" if record.level == "info" else " font-weight: bold;"
+        lines.append(f'{pad}<span style="color: {color};{weight}">{html.escape(record.formatted)}</span>')
+    return "<br>\n".join(lines)
@@ -0,0 +1,216 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import profiling
+
+# ============================================================================
+# PIPELINE METRICS
+# ============================================================================
+
+class RunMetrics:
+    """Timers and counters collected during one pipeline run.
+
+    Timers are keyed by (phase, step) and record calls, total, max seconds and errors;
+    counters are keyed by name (rows, bytes, emails, ...). All methods are thread-safe
+    because the update pipelines run concurrently.
+    """
+
+    def __init__(self, run_name):
+        self.run_name = run_name
+        self.started_at = datetime.now()
+        self.finished_at = None
+        self._started = time.perf_counter()
+        self.wall_seconds = None
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+
+    def observe(self, step, phase, seconds, failed=False):
+        with self._lock:
+            timer = self._timers.get((phase, step))
+            if timer is None:
+                timer = self._timers[(phase, step)] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "errors": 0}
+            timer["calls"] += 1
+            timer["seconds"] += seconds
+            timer["max_seconds"] = max(timer["max_seconds"], seconds)
+            if failed:
+                timer["errors"] += 1
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def merge(self, data):
+        """Fold another run's to_dict() output (e.g. from a worker process) into this run"""
+        with self._lock:
+            for key, values in data["timers"].items():
+                phase, step = key.split("/", 1)
+                timer = self._timers.get((phase, step))
+                if timer is None:
+                    timer = self._timers[(phase, step)] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "errors": 0}
+                timer["calls"] += values["calls"]
+                timer["seconds"] += values["seconds"]
+                timer["max_seconds"] = max(timer["max_seconds"], values["max_seconds"])
+                timer["errors"] += values["errors"]
+            for name, value in data["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def finish(self):
+        self.finished_at = datetime.now()
+        self.wall_seconds = time.perf_counter() - self._started
+
+    def to_dict(self):
+        with self._lock:
+            timers = {f"{phase}/{step}": dict(values) for (phase, step), values in sorted(self._timers.items())}
+            counters = dict(sorted(self._counters.items()))
+            phases = {}
+            for (phase, _), values in self._timers.items():
+                phases[phase] = phases.get(phase, 0.0) + values["seconds"]
+        return {
+            "run": self.run_name,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": self.finished_at.isoformat(timespec="seconds") if self.finished_at else None,
+            "wall_seconds": round(self.wall_seconds, 3) if self.wall_seconds is not None else None,
+            "phase_seconds": {phase: round(seconds, 3) for phase, seconds in sorted(phases.items())},
+            "timers": timers,
+            "counters": counters,
+        }
+
+    def to_prometheus(self):
+        """Render in the Prometheus text exposition format (node_exporter textfile collector)"""
+        data = self.to_dict()
+        run = data["run"]
+        lines = [
+            "# HELP medirate_step_seconds_total Time spent in an instrumented step.",
+            "# TYPE medirate_step_seconds_total counter",
+        ]
+        for key, timer in data["timers"].items():
+            phase, step = key.split("/", 1)
+            lines.append(f'medirate_step_seconds_total{{run="{run}",phase="{phase}",step="{step}"}} {timer["seconds"]:.6f}')
+        lines += ["# HELP medirate_step_calls_total Calls of an instrumented step.", "# TYPE medirate_step_calls_total counter"]
+        for key, timer in data["timers"].items():
+            phase, step = key.split("/", 1)
+            lines.append(f'medirate_step_calls_total{{run="{run}",phase="{phase}",step="{step}"}} {timer["calls"]}')
+        lines += ["# HELP medirate_step_errors_total Failed calls of an instrumented step.", "# TYPE medirate_step_errors_total counter"]
+        for key, timer in data["timers"].items():
+            phase, step = key.split("/", 1)
+            lines.append(f'medirate_step_errors_total{{run="{run}",phase="{phase}",step="{step}"}} {timer["errors"]}')
+        lines += ["# HELP medirate_items_total Rows, bytes and messages processed.", "# TYPE medirate_items_total counter"]
+        for name, value in data["counters"].items():
+            lines.append(f'medirate_items_total{{run="{run}",item="{name}"}} {value}')
+        lines += ["# HELP medirate_run_seconds Wall time of the last run.", "# TYPE medirate_run_seconds gauge"]
+        lines.append(f'medirate_run_seconds{{run="{run}"}} {data["wall_seconds"] or 0:.6f}')
+        lines += ["# HELP medirate_run_finished_timestamp_seconds When the last run finished.", "# TYPE medirate_run_finished_timestamp_seconds gauge"]
+        finished = self.finished_at.timestamp() if self.finished_at else 0
+        lines.append(f'medirate_run_finished_timestamp_seconds{{run="{run}"}} {finished:.0f}')
+        return "\n".join(lines) + "\n"
+
+    def summary_lines(self):
+        """Human readable per-run summary, slowest phase first"""
+        data = self.to_dict()
+        lines = [f"📈 Run '{data['run']}' took {data['wall_seconds'] or 0:.1f}s"]
+        for phase, seconds in sorted(data["phase_seconds"].items(), key=lambda item: -item[1]):
+            lines.append(f"⏱️ {phase}: {seconds:.2f}s")
+        for key, timer in data["timers"].items():
+            errors = f", {timer['errors']} errors" if timer["errors"] else ""
+            lines.append(f"   {key}: {timer['calls']} calls, {timer['seconds']:.2f}s total, max {timer['max_seconds']:.2f}s{errors}")
+        for name, value in data["counters"].items():
+            lines.append(f"🔢 {name}: {value}")
+        return lines
+
+    def write(self, directory):
+        """Write <run>.json and <run>.prom into directory, atomically replacing older files"""
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for suffix, content in ((".json", json.dumps(self.to_dict(), indent=2)), (".prom", self.to_prometheus())):
+            path = os.path.join(directory, f"{self.run_name}{suffix}")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            paths.append(path)
+        return paths
+
+
+# Active run of the current context, like the log sinks in data_processor. A background
+# job and a synchronous Streamlit run each get their own; pipeline.run_update_pipeline copies
+# the context into its worker threads so the concurrent pipelines report into the same run.
+_active_run = contextvars.ContextVar("metrics_run", default=None)
+
+
+def current_run():
+    return _active_run.get()
+
+
+@contextmanager
+def metrics_run(run_name):
+    """Collect metrics for the duration of the block; nested runs reuse the outer one"""
+    outer = _active_run.get()
+    if outer is not None:
+        yield outer
+        return
+    run = RunMetrics(run_name)
+    token = _active_run.set(run)
+    try:
+        yield run
+    finally:
+        run.finish()
+        _active_run.reset(token)
+
+
+def incr(name, value=1):
+    """Add to a counter of the active run; a no-op when no run is active"""
+    run = _active_run.get()
+    if run is not None:
+        run.incr(name, value)
+
+
+class timed:
+    """Time a step of a phase, as a context manager or a decorator.
+
+        with timed("parse_sheet", phase="Excel"): ...
+
+        @timed("download_file", phase="Download")
+        def download_file(...): ...
+
+    When a profiling.profile_run() session is active the step is profiled as well.
+    """
+
+    _session = None
+
+    def __init__(self, step, phase="General"):
+        self.step = step
+        self.phase = phase
+        self._started = None
+
+    def __enter__(self):
+        session = profiling.current_session()
+        if session is not None:
+            self._session = session
+            self._profile = session.enter(self.step, self.phase)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._started
+        if self._session is not None:
+            self._session.exit(self._profile)
+        run = _active_run.get()
+        if run is not None:
+            run.observe(self.step, self.phase, seconds, failed=exc_type is not None)
+        return False
+
+    def __call__(self, func):
+        step, phase = self.step, self.phase
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(step, phase):
+                return func(*args, **kwargs)
+        return wrapper
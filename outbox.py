@@ -0,0 +1,532 @@
+import os
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# ============================================================================
+# DURABLE EMAIL OUTBOX
+# ============================================================================
+
+# Message lifecycle:
+#   pending -> sending -> sent
+#                      -> pending (retryable error, attempts < max_attempts)
+#                      -> failed  (attempts exhausted)
+#   sending (lease expired, e.g. the process died mid-send) -> unknown
+# "unknown" messages may or may not have reached the provider, so they are never resent
+# automatically; requeue_unknown() puts them back once someone has checked.
+PENDING, SENDING, SENT, FAILED, UNKNOWN = "pending", "sending", "sent", "failed", "unknown"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    subject TEXT NOT NULL,
+    html TEXT NOT NULL,
+    alert_count INTEGER NOT NULL DEFAULT 0,
+    alert_keys TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    provider_message_id TEXT,
+    created_at TEXT NOT NULL,
+    claimed_at TEXT,
+    sent_at TEXT
+);
+CREATE INDEX IF NOT EXISTS email_outbox_status_idx ON email_outbox (status, id);
+CREATE INDEX IF NOT EXISTS email_outbox_run_idx ON email_outbox (run_id, status);
+CREATE INDEX IF NOT EXISTS email_outbox_sent_at_idx ON email_outbox (sent_at);
+
+-- Delivery ledger: which alerts each user has already been mailed
+CREATE TABLE IF NOT EXISTS sent_alerts (
+    user_email TEXT NOT NULL,
+    alert_key TEXT NOT NULL,
+    sent_at TEXT NOT NULL,
+    PRIMARY KEY (user_email, alert_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sent_alerts_key_idx ON sent_alerts (alert_key);
+CREATE INDEX IF NOT EXISTS sent_alerts_sent_at_idx ON sent_alerts (sent_at);
+
+CREATE TABLE IF NOT EXISTS outbox_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Statuses whose alerts count as delivered for matching: already sent, or queued/in flight
+OUTSTANDING = (PENDING, SENDING, UNKNOWN)
+
+# SQLite limits bound parameters per statement; IN lists are chunked below this
+_IN_CHUNK = 500
+
+# Format of the alert keys in the ledger and in queued messages (see data_processor.alert_key).
+# Version 2 keys provider alerts by their natural_key instead of a sha1 of their content.
+ALERT_KEY_VERSION = "2"
+
+
+def idempotency_key(recipient, run_id):
+    return f"{recipient.strip().lower()}|{run_id}"
+
+
+class OutboxMessage:
+    __slots__ = ("id", "run_id", "recipient", "subject", "html", "alert_count", "alert_keys", "attempts")
+
+    def __init__(self, id, run_id, recipient, subject, html, alert_count, alert_keys, attempts):
+        self.id = id
+        self.run_id = run_id
+        self.recipient = recipient
+        self.subject = subject
+        self.html = html
+        self.alert_count = alert_count
+        self.alert_keys = alert_keys.split("\n") if alert_keys else []
+        self.attempts = attempts
+
+
+def _chunks(items, size=_IN_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class EmailOutbox:
+    """Rendered digests persisted in SQLite so an interrupted notify run can resume.
+
+    Each message is unique per (recipient, run), so enqueuing the same run twice is a
+    no-op, and claim() hands a message to exactly one sender at a time. Marking a
+    message sent also records its alerts in the sent_alerts ledger, in the same
+    transaction, so "already delivered" never disagrees with the outbox.
+    """
+
+    def __init__(self, path, max_attempts=3, lease_seconds=600):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._init_schema()
+        self._init_ledger()
+
+    def _init_schema(self):
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 30000")
+        # In WAL mode NORMAL still survives process crashes; it only skips an fsync per commit
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        """This thread's connection, opened once and kept (closing the last one checkpoints the WAL)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        yield conn
+
+    @contextmanager
+    def _transaction(self):
+        """This thread's connection inside BEGIN IMMEDIATE; committed on success, rolled back on error.
+
+        Without the rollback a failed block would leave the connection mid-transaction (every
+        later BEGIN fails) and keep the database write lock from other processes.
+        """
+        with self._connection() as conn:
+            self._begin(conn)
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    @staticmethod
+    def _begin(conn):
+        conn.execute("BEGIN IMMEDIATE")
+
+    @staticmethod
+    def _now():
+        return datetime.now().isoformat(timespec="seconds")
+
+    def _init_ledger(self):
+        """Stamp when the ledger started and backfill it from messages already sent"""
+        with self._transaction() as conn:
+            started = conn.execute("SELECT value FROM outbox_meta WHERE key = 'ledger_started_at'").fetchone()
+            if started is None:
+                conn.execute("INSERT INTO outbox_meta (key, value) VALUES ('ledger_started_at', ?)", (self._now(),))
+                for recipient, alert_keys, sent_at in conn.execute(
+                    "SELECT recipient, alert_keys, sent_at FROM email_outbox WHERE status = ?", (SENT,)
+                ).fetchall():
+                    self._record_delivery(conn, recipient, alert_keys.split("\n") if alert_keys else [], sent_at)
+
+    @staticmethod
+    def _record_delivery(conn, recipient, alert_keys, sent_at):
+        conn.executemany(
+            "INSERT INTO sent_alerts (user_email, alert_key, sent_at) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+            [(recipient.strip().lower(), key, sent_at) for key in alert_keys],
+        )
+
+    def enqueue(self, run_id, messages):
+        """Persist messages (recipient, subject, html, alert_keys) in one transaction; returns how many were new.
+
+        messages may be a generator: rows are written as they are produced, so a whole run
+        never has to be held in memory, and a crash mid-way leaves nothing half-queued.
+        """
+        now = self._now()
+        rows = (
+            (run_id, recipient, idempotency_key(recipient, run_id), subject, html, len(alert_keys), "\n".join(alert_keys), now)
+            for recipient, subject, html, alert_keys in messages
+        )
+        with self._transaction() as conn:
+            return conn.executemany(
+                "INSERT INTO email_outbox "
+                "(run_id, recipient, idempotency_key, subject, html, alert_count, alert_keys, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+                rows,
+            ).rowcount
+
+    def has_run(self, run_id):
+        with self._connection() as conn:
+            return conn.execute("SELECT 1 FROM email_outbox WHERE run_id = ? LIMIT 1", (run_id,)).fetchone() is not None
+
+    def expire_leases(self):
+        """Mark messages stuck in 'sending' past the lease as 'unknown'; returns how many"""
+        cutoff = (datetime.now() - timedelta(seconds=self.lease_seconds)).isoformat(timespec="seconds")
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "UPDATE email_outbox SET status = ?, last_error = 'lease expired while sending' "
+                "WHERE status = ? AND claimed_at < ?",
+                (UNKNOWN, SENDING, cutoff),
+            )
+            return cursor.rowcount
+
+    @staticmethod
+    def _run_filter(query, params, run_id=None, run_pattern=None):
+        """Add conditions on run_id (exact) and run_pattern (a LIKE pattern over run ids)"""
+        if run_id is not None:
+            query += " AND run_id = ?"
+            params.append(run_id)
+        if run_pattern is not None:
+            query += " AND run_id LIKE ?"
+            params.append(run_pattern)
+        return query, params
+
+    def claim(self, limit=50, run_id=None, run_pattern=None):
+        """Atomically move up to limit pending messages to 'sending' and return them"""
+        query, params = self._run_filter("SELECT id FROM email_outbox WHERE status = ?", [PENDING], run_id, run_pattern)
+        with self._lock, self._transaction() as conn:
+            ids = [row[0] for row in conn.execute(query + " ORDER BY id LIMIT ?", [*params, limit])]
+            if not ids:
+                return []
+            placeholders = ",".join("?" * len(ids))
+            conn.execute(
+                f"UPDATE email_outbox SET status = ?, claimed_at = ?, attempts = attempts + 1 WHERE id IN ({placeholders})",
+                [SENDING, self._now(), *ids],
+            )
+            rows = conn.execute(
+                "SELECT id, run_id, recipient, subject, html, alert_count, alert_keys, attempts "
+                f"FROM email_outbox WHERE id IN ({placeholders}) ORDER BY id",
+                ids,
+            ).fetchall()
+        return [OutboxMessage(*row) for row in rows]
+
+    def mark_sent(self, message_id, provider_message_id=None):
+        """Mark a message sent and add its alerts to the sent_alerts ledger"""
+        now = self._now()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE email_outbox SET status = ?, sent_at = ?, provider_message_id = ?, last_error = NULL WHERE id = ?",
+                (SENT, now, provider_message_id, message_id),
+            )
+            row = conn.execute("SELECT recipient, alert_keys FROM email_outbox WHERE id = ?", (message_id,)).fetchone()
+            if row is not None:
+                recipient, alert_keys = row
+                self._record_delivery(conn, recipient, alert_keys.split("\n") if alert_keys else [], now)
+
+    def mark_failed(self, message_id, error):
+        """Record a send error; the message is retried until max_attempts is reached"""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE email_outbox SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, last_error = ? WHERE id = ?",
+                (self.max_attempts, FAILED, PENDING, str(error)[:2000], message_id),
+            )
+
+    def mark_unknown(self, message_id, error):
+        """Record a send that may have reached the provider; the message is never resent automatically"""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE email_outbox SET status = ?, last_error = ? WHERE id = ?",
+                (UNKNOWN, str(error)[:2000], message_id),
+            )
+
+    def release(self, message_id):
+        """Return a claimed message to 'pending' without counting the attempt (e.g. deferred)"""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE email_outbox SET status = ?, attempts = CASE WHEN attempts > 0 THEN attempts - 1 ELSE 0 END "
+                "WHERE id = ? AND status = ?",
+                (PENDING, message_id, SENDING),
+            )
+
+    def requeue_unknown(self, run_id=None):
+        query = "UPDATE email_outbox SET status = ? WHERE status = ?"
+        params = [PENDING, UNKNOWN]
+        if run_id is not None:
+            query += " AND run_id = ?"
+            params.append(run_id)
+        with self._connection() as conn:
+            return conn.execute(query, params).rowcount
+
+    def pending_count(self, run_id=None, run_pattern=None):
+        query, params = self._run_filter("SELECT COUNT(*) FROM email_outbox WHERE status = ?", [PENDING], run_id, run_pattern)
+        with self._connection() as conn:
+            return conn.execute(query, params).fetchone()[0]
+
+    def sent_since(self, since):
+        """Messages sent at or after the datetime since (what the send budgets count against)"""
+        with self._connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM email_outbox WHERE sent_at >= ? AND status = ?",
+                (since.isoformat(timespec="seconds"), SENT),
+            ).fetchone()[0]
+
+    def stats(self, run_id=None):
+        """Message counts by status, optionally for one run"""
+        query = "SELECT status, COUNT(*) FROM email_outbox"
+        params = []
+        if run_id is not None:
+            query += " WHERE run_id = ?"
+            params.append(run_id)
+        with self._connection() as conn:
+            return dict(conn.execute(query + " GROUP BY status", params).fetchall())
+
+    # ------------------------------------------------------------------------
+    # Sent-alert ledger
+    # ------------------------------------------------------------------------
+
+    def ledger_started_at(self):
+        """When delivery tracking began; alerts older than this were handled before the ledger existed"""
+        with self._connection() as conn:
+            return datetime.fromisoformat(
+                conn.execute("SELECT value FROM outbox_meta WHERE key = 'ledger_started_at'").fetchone()[0]
+            )
+
+    def delivered_alerts(self, alert_keys, include_outstanding=True):
+        """Return {user_email: {alert_key, ...}} among alert_keys already delivered to each user.
+
+        With include_outstanding, alerts sitting in pending/sending/unknown messages count too,
+        so a message that is queued or in doubt is never duplicated by a later run.
+        """
+        delivered = {}
+        alert_keys = set(alert_keys)
+        with self._connection() as conn:
+            for chunk in _chunks(alert_keys):
+                placeholders = ",".join("?" * len(chunk))
+                for user_email, key in conn.execute(
+                    f"SELECT user_email, alert_key FROM sent_alerts WHERE alert_key IN ({placeholders})", chunk
+                ):
+                    delivered.setdefault(user_email, set()).add(key)
+            if include_outstanding:
+                placeholders = ",".join("?" * len(OUTSTANDING))
+                for recipient, keys in conn.execute(
+                    f"SELECT recipient, alert_keys FROM email_outbox WHERE status IN ({placeholders})", OUTSTANDING
+                ):
+                    queued = alert_keys.intersection(keys.split("\n")) if keys else set()
+                    if queued:
+                        delivered.setdefault(recipient.strip().lower(), set()).update(queued)
+        return delivered
+
+    def alert_keys_current(self):
+        """True when the ledger and queued messages hold ALERT_KEY_VERSION keys.
+
+        An outbox with no messages and no ledger rows has nothing to rekey and is stamped
+        current right away; otherwise rekey_alerts() has to run first.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM outbox_meta WHERE key = 'alert_key_version'").fetchone()
+            if row is not None and row[0] == ALERT_KEY_VERSION:
+                return True
+            if conn.execute("SELECT EXISTS (SELECT 1 FROM sent_alerts) OR EXISTS (SELECT 1 FROM email_outbox)").fetchone()[0]:
+                return False
+            self._stamp_alert_key_version(conn)
+            return True
+
+    @staticmethod
+    def _stamp_alert_key_version(conn):
+        conn.execute(
+            "INSERT INTO outbox_meta (key, value) VALUES ('alert_key_version', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (ALERT_KEY_VERSION,),
+        )
+
+    def rekey_alerts(self, mapping):
+        """Rename alert keys {old: new} in the ledger and every message, then stamp ALERT_KEY_VERSION.
+
+        Runs in one transaction. Returns (ledger rows, messages) rekeyed, or None when another
+        process already did it. A user who was mailed an alert under both keys keeps one ledger row.
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM outbox_meta WHERE key = 'alert_key_version'").fetchone()
+            if row is not None and row[0] == ALERT_KEY_VERSION:
+                return None
+            pairs = [(new, old) for old, new in mapping.items() if old != new]
+            conn.executemany(
+                "INSERT INTO sent_alerts (user_email, alert_key, sent_at) "
+                "SELECT user_email, ?, sent_at FROM sent_alerts WHERE alert_key = ? ON CONFLICT DO NOTHING",
+                pairs,
+            )
+            ledger_rows = conn.executemany("DELETE FROM sent_alerts WHERE alert_key = ?", [(old,) for _, old in pairs]).rowcount
+            messages = []
+            for message_id, keys in conn.execute("SELECT id, alert_keys FROM email_outbox WHERE alert_keys != ''").fetchall():
+                rekeyed = "\n".join(mapping.get(key, key) for key in keys.split("\n"))
+                if rekeyed != keys:
+                    messages.append((rekeyed, message_id))
+            conn.executemany("UPDATE email_outbox SET alert_keys = ? WHERE id = ?", messages)
+            self._stamp_alert_key_version(conn)
+        return max(ledger_rows, 0), len(messages)
+
+    def compact_ledger(self, older_than_days):
+        """Delete ledger rows older than older_than_days, and finished outbox messages past the same age.
+
+        Only compact beyond the notify lookback window: an alert whose ledger row is gone
+        counts as undelivered again if it is still a candidate.
+        """
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat(timespec="seconds")
+        with self._transaction() as conn:
+            ledger_rows = conn.execute("DELETE FROM sent_alerts WHERE sent_at < ?", (cutoff,)).rowcount
+            messages = conn.execute(
+                "DELETE FROM email_outbox WHERE status IN (?, ?) AND created_at < ?", (SENT, FAILED, cutoff)
+            ).rowcount
+        return ledger_rows, messages
+
+
+# ============================================================================
+# POSTGRES OUTBOX
+# ============================================================================
+
+PG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    subject TEXT NOT NULL,
+    html TEXT NOT NULL,
+    alert_count INTEGER NOT NULL DEFAULT 0,
+    alert_keys TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    provider_message_id TEXT,
+    created_at TEXT NOT NULL,
+    claimed_at TEXT,
+    sent_at TEXT
+);
+CREATE INDEX IF NOT EXISTS email_outbox_status_idx ON email_outbox (status, id);
+CREATE INDEX IF NOT EXISTS email_outbox_run_idx ON email_outbox (run_id, status);
+CREATE INDEX IF NOT EXISTS email_outbox_sent_at_idx ON email_outbox (sent_at);
+
+CREATE TABLE IF NOT EXISTS sent_alerts (
+    user_email TEXT NOT NULL,
+    alert_key TEXT NOT NULL,
+    sent_at TEXT NOT NULL,
+    PRIMARY KEY (user_email, alert_key)
+);
+CREATE INDEX IF NOT EXISTS sent_alerts_key_idx ON sent_alerts (alert_key);
+CREATE INDEX IF NOT EXISTS sent_alerts_sent_at_idx ON sent_alerts (sent_at);
+
+CREATE TABLE IF NOT EXISTS outbox_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+-- Recipients and rendered mail are for the worker's direct connection only, not the REST API
+ALTER TABLE email_outbox ENABLE ROW LEVEL SECURITY;
+ALTER TABLE sent_alerts ENABLE ROW LEVEL SECURITY;
+ALTER TABLE outbox_meta ENABLE ROW LEVEL SECURITY;
+"""
+
+# Transaction-level advisory lock that serializes outbox writes, as BEGIN IMMEDIATE does in SQLite
+OUTBOX_LOCK = zlib.crc32(b"medirate-email-outbox") & 0x7FFFFFFF
+
+_OUTBOX_COLUMNS = (
+    "run_id", "recipient", "idempotency_key", "subject", "html", "alert_count", "alert_keys", "status",
+    "attempts", "last_error", "provider_message_id", "created_at", "claimed_at", "sent_at",
+)
+
+
+class _PgConnection:
+    """A psycopg2 connection in autocommit mode behind the sqlite3 calls EmailOutbox makes:
+    qmark parameters, and execute()/executemany() returning the cursor"""
+
+    def __init__(self, conn):
+        conn.autocommit = True
+        self._conn = conn
+
+    def execute(self, sql, params=()):
+        cursor = self._conn.cursor()
+        cursor.execute(sql.replace("?", "%s"), params or None)
+        return cursor
+
+    def executemany(self, sql, rows):
+        cursor = self._conn.cursor()
+        cursor.executemany(sql.replace("?", "%s"), rows)
+        return cursor
+
+
+class PgEmailOutbox(EmailOutbox):
+    """The outbox and sent_alerts ledger in Postgres (DATABASE_URL), shared by every host.
+
+    Same behaviour as EmailOutbox. Hosts that shard a notify run, and workers in ephemeral
+    containers, then all see one ledger. With import_path, a new ledger starts from the
+    SQLite outbox at that path (when the file exists), so switching over re-sends nothing.
+    """
+
+    def __init__(self, dsn, import_path=None, max_attempts=3, lease_seconds=600):
+        self.dsn = dsn
+        self.import_path = import_path
+        super().__init__(None, max_attempts, lease_seconds)
+
+    def _connect(self):
+        import psycopg2
+        return _PgConnection(psycopg2.connect(self.dsn))
+
+    @staticmethod
+    def _begin(conn):
+        conn.execute("BEGIN")
+        conn.execute("SELECT pg_advisory_xact_lock(?, 0)", (OUTBOX_LOCK,))
+
+    def _init_schema(self):
+        with self._transaction() as conn:
+            conn.execute(PG_SCHEMA)
+            started = conn.execute("SELECT 1 FROM outbox_meta WHERE key = 'ledger_started_at'").fetchone()
+            if started is None and self.import_path and os.path.exists(self.import_path):
+                self._import_sqlite(conn, self.import_path)
+
+    @staticmethod
+    def _import_sqlite(conn, path):
+        """Copy the messages, ledger and meta of the SQLite outbox at path"""
+        EmailOutbox(path)  # brings an older file's schema and ledger up to date
+        source = sqlite3.connect(path)
+        try:
+            conn.executemany(
+                f"INSERT INTO email_outbox ({', '.join(_OUTBOX_COLUMNS)}) VALUES ({', '.join('?' * len(_OUTBOX_COLUMNS))}) "
+                "ON CONFLICT DO NOTHING",
+                source.execute(f"SELECT {', '.join(_OUTBOX_COLUMNS)} FROM email_outbox ORDER BY id"),
+            )
+            conn.executemany(
+                "INSERT INTO sent_alerts (user_email, alert_key, sent_at) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+                source.execute("SELECT user_email, alert_key, sent_at FROM sent_alerts"),
+            )
+            conn.executemany(
+                "INSERT INTO outbox_meta (key, value) VALUES (?, ?) ON CONFLICT DO NOTHING",
+                source.execute("SELECT key, value FROM outbox_meta"),
+            )
+        finally:
+            source.close()
@@ -0,0 +1,125 @@
+import html
+import re
+
+from data_processor import alert_key, alert_service_lines, get_full_state_name
+
+# ============================================================================
+# COMPACT EMAIL PAYLOADS
+# ============================================================================
+
+MORE_ALERTS_URL = "https://medirate-developement.vercel.app/rate-developments"
+
+_INLINE_BLOCK = re.compile(r"\s*<!--[^>]*-->\s*<style data-inline>(.*?)</style>|\s*<style data-inline>(.*?)</style>", re.DOTALL)
+_RULE = re.compile(r"\.([\w-]+)\s*\{([^}]*)\}")
+_CLASS_ATTR = re.compile(r'class="([\w-]+)"')
+
+
+def parse_inline_rules(css):
+    """{class name: 'prop:value; ...'} for simple single-class rules"""
+    return {name: " ".join(body.split()).strip() for name, body in _RULE.findall(css)}
+
+
+def inline_css(fragment, rules):
+    """Add style="..." to elements whose single class has a rule in rules"""
+    def replace(match):
+        style = rules.get(match.group(1))
+        return f'{match.group(0)} style="{style}"' if style else match.group(0)
+    return _CLASS_ATTR.sub(replace, fragment)
+
+
+def truncate(text, limit):
+    """Shorten text to at most limit characters at a word boundary, ending with an ellipsis"""
+    text = " ".join(str(text).split())
+    if not limit or len(text) <= limit:
+        return text
+    cut = text[:limit - 1].rsplit(" ", 1)[0] or text[:limit - 1]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+class PayloadBuilder:
+    """Renders digests from email_template.html with compact, cached alert cards.
+
+    Card styles are the single-class rules of the template's <style data-inline> block.
+    They are inlined into each card once, when the card is first rendered, and that block
+    is not sent, so cards look the same in clients that strip <style>. The remaining
+    <style> block only holds the responsive overrides. Summaries are truncated to
+    summary_chars, and a digest stops adding cards before max_bytes, linking to Medirate
+    for the rest.
+    """
+
+    def __init__(self, template, summary_chars=400, max_bytes=90000, more_url=MORE_ALERTS_URL):
+        inline_css_text = "".join(a or b for a, b in _INLINE_BLOCK.findall(template))
+        self.inline_rules = parse_inline_rules(inline_css_text)
+        template = _INLINE_BLOCK.sub("", template)
+        self.head, self.tail = template.split("{{ALERTS}}", 1)
+        self.base_bytes = len(self.head.encode("utf-8")) + len(self.tail.encode("utf-8"))
+        self.summary_chars = summary_chars
+        self.max_bytes = max_bytes
+        self.more_url = more_url
+        self._cards = {}
+
+    @property
+    def card_count(self):
+        """Distinct alert cards rendered so far"""
+        return len(self._cards)
+
+    def card(self, alert):
+        """(html, utf-8 size) of an alert's card, rendered and inlined once per alert"""
+        key = alert_key(alert)
+        cached = self._cards.get(key)
+        if cached is None:
+            fragment = inline_css(self._render_card(alert), self.inline_rules)
+            cached = self._cards[key] = (fragment, len(fragment.encode("utf-8")))
+        return cached
+
+    def _render_card(self, alert):
+        source = alert.get('source')
+        url = (alert.get('url') if source == 'bill' else alert.get('links')) or "#"
+        state = get_full_state_name(alert.get('state'))
+        service_lines = ', '.join(alert_service_lines(alert)) or "N/A"
+        details = []
+        if source == 'bill':
+            title = alert.get('name') or alert.get('bill_number') or "No Title"
+            summary = alert.get('ai_summary') or "No summary available."
+            for label, column in (("Status", 'bill_progress'), ("Committee", 'committee'), ("Introduction Date", 'created'),
+                                  ("Last Action Date", 'action_date'), ("Sponsors", 'sponsor_list')):
+                if alert.get(column):
+                    details.append(f"<b>{label}:</b> {html.escape(str(alert[column]))}")
+        else:
+            title = alert.get('subject') or "No Title"
+            summary = alert.get('summary') or ""
+            if alert.get('announcement_date'):
+                details.append(f"<b>Announcement Date:</b> {html.escape(str(alert['announcement_date']))}")
+        parts = [
+            f'<div class="ac"><div class="at">{html.escape(state)}: {html.escape(str(title))}</div>',
+            f'<div class="al"><b class="lb">Service Lines:</b> {html.escape(service_lines)}</div>',
+        ]
+        if summary:
+            parts.append(f'<div class="as"><b class="lb">Summary:</b> {html.escape(truncate(summary, self.summary_chars))}</div>')
+        if details:
+            parts.append(f'<div class="ad">{"<br>".join(details)}</div>')
+        parts.append(f'<a class="ab" href="{html.escape(str(url), quote=True)}">View Details</a></div>')
+        return "".join(parts)
+
+    def _more_link(self, count):
+        return inline_css(
+            f'<div class="ac"><a class="ab" href="{self.more_url}">View {count} more alert{"s" if count != 1 else ""} on Medirate</a></div>',
+            self.inline_rules,
+        )
+
+    def digest(self, alerts):
+        """Return (subject, html, cards included, alerts overflowed) for one user's digest"""
+        # Room for the overflow link is kept back so it always fits
+        budget = self.max_bytes - self.base_bytes - len(self._more_link(len(alerts)).encode("utf-8"))
+        cards, used = [], 0
+        for alert in alerts:
+            fragment, size = self.card(alert)
+            if self.max_bytes and cards and used + size + 1 > budget:
+                break
+            cards.append(fragment)
+            used += size + 1
+        overflow = len(alerts) - len(cards)
+        if overflow:
+            cards.append(self._more_link(overflow))
+        subject = f"New Medicaid Alerts Relevant to You - {len(alerts)} Updates"
+        return subject, self.head + "\n".join(cards) + self.tail, len(alerts) - overflow, overflow
@@ -0,0 +1,322 @@
+import contextvars
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from log_buffer import LogBuffer
+from metrics import current_run, metrics_run
+from profiling import profile_run
+
+from data_processor import (
+    log_message, log_to, current_log_sink, session_log_sink, get_setting, log_connection_status, process_bill_track, process_provider_alerts,
+    send_email_notification, get_pg_connection, get_outbox, delivery_status,
+)
+
+# ============================================================================
+# UPDATE PIPELINE ORCHESTRATOR
+# ============================================================================
+
+# bill_track and provider_alerts touch different blobs and tables, so they can overlap
+PIPELINES = [
+    ("Bill Track", lambda: process_bill_track(notify=False)),
+    ("Provider Alerts", process_provider_alerts),
+]
+
+
+class PipelineLog:
+    """Thread-safe collector for logs emitted by concurrently running pipelines.
+
+    Every record is tagged with the pipeline that produced it. Records are stored in one
+    bounded LogBuffer, so the interleaved output is already merged per phase in the order
+    it happened. If the caller already had a log sink (e.g. a background Job), records
+    are forwarded to it live as well.
+    """
+
+    def __init__(self, parent_sink=None):
+        self._parent_sink = parent_sink
+        self.buffer = LogBuffer()
+
+    def sink_for(self, pipeline):
+        def sink(record):
+            tagged = record._replace(message=f"[{pipeline}] {record.message}")
+            self.buffer.append(tagged)
+            if self._parent_sink is not None:
+                self._parent_sink(tagged)
+        return sink
+
+
+def _run_pipeline(name, func, pipeline_log):
+    """Run one pipeline with its own log sink and return (name, succeeded, seconds)"""
+    started = time.perf_counter()
+    with log_to(pipeline_log.sink_for(name)):
+        try:
+            succeeded = bool(func())
+        except Exception as e:
+            log_message(f"❌ Unhandled error in {name} pipeline: {e}", "error", phase="Processing")
+            succeeded = False
+    return name, succeeded, time.perf_counter() - started
+
+
+def _finish_metrics(run):
+    """Log the per-run metrics summary and write it to METRICS_DIR as JSON and Prometheus text"""
+    for line in run.summary_lines():
+        log_message(line, "info", phase="Processing")
+    try:
+        paths = run.write(get_setting("METRICS_DIR", "metrics"))
+        log_message(f"📈 Metrics written to {', '.join(paths)}", "info", phase="Processing")
+    except Exception as e:
+        log_message(f"⚠️ Could not write metrics file: {e}", "warning", phase="Processing")
+
+
+def _profiling(run_name, profile=None):
+    """profile_run() for a pipeline run; profile=None follows the PROFILE_RUNS setting.
+
+    PROFILE_RUNS=1 profiles with cProfile, stack samples and tracemalloc;
+    PROFILE_RUNS=sample leaves cProfile out, for runs where its overhead would skew the picture.
+    """
+    mode = get_setting("PROFILE_RUNS", "").strip().lower()
+    if profile is None:
+        profile = mode in ("1", "true", "yes", "sample")
+    return profile_run(
+        run_name, enabled=profile, directory=get_setting("PROFILE_DIR", "profiles"),
+        sample_interval=float(get_setting("PROFILE_SAMPLE_MS", "5")) / 1000,
+        deterministic=mode != "sample",
+    )
+
+
+def _finish_profile(session):
+    """Write the profile artifacts and return their directory, or None"""
+    if session is None:
+        return None
+    try:
+        session.write()
+        for phase, data in session.to_dict()["phases"].items():
+            log_message(
+                f"🔬 {phase}: {data['seconds']:.2f}s profiled over {data['steps']} steps, "
+                f"{data['samples']} stack samples, {data['allocated_bytes'] / 1024:.0f} KiB allocated",
+                "info", phase="Processing",
+            )
+        log_message(f"🔬 Profile written to {session.directory}", "info", phase="Processing")
+        return session.directory
+    except Exception as e:
+        log_message(f"⚠️ Could not write profile: {e}", "warning", phase="Processing")
+        return None
+
+
+def run_update_pipeline(notify=False, max_workers=2, profile=None):
+    """Check connections, run both ingest pipelines concurrently, then optionally notify.
+
+    The email step only runs once every pipeline has finished successfully. Returns a
+    summary dict with per-pipeline results, timings, the critical path, the merged logs,
+    the run metrics and the profile directory (see _profiling()).
+    """
+    with _profiling("update", profile) as session:
+        with metrics_run("update") as run:
+            result = _run_update_pipeline(notify, max_workers)
+    result["metrics"] = run.to_dict()
+    _finish_metrics(run)
+    result["profile"] = _finish_profile(session)
+    return result
+
+
+def notify_succeeded(metrics):
+    """A notify run (metrics as in RunMetrics.to_dict) failed if it hit an error or a send failed"""
+    counters = metrics["counters"]
+    return not counters.get("notify_errors") and not counters.get("email_errors")
+
+
+def run_notify(profile=None):
+    """Email users the new alerts they have not received yet.
+
+    Returns a summary dict; `connected` is False when Supabase could not be reached (nothing
+    is sent) and `succeeded` is False when the run logged an error or a message failed.
+    """
+    with _profiling("notify", profile) as session:
+        with metrics_run("notify") as run:
+            connected = log_connection_status(blob_storage=False)
+            emails_sent = send_email_notification(0) if connected else 0
+    metrics = run.to_dict()
+    result = {
+        "new_alerts": metrics["counters"].get("candidate_alerts", 0), "emails_sent": emails_sent, "metrics": metrics,
+        "connected": connected, "succeeded": connected and notify_succeeded(metrics),
+    }
+    result.update(delivery_status())
+    _finish_metrics(run)
+    result["profile"] = _finish_profile(session)
+    return result
+
+
+def shard_locks():
+    """Advisory locks when DATABASE_URL is set (multi-host), else flock files next to the SQLite outbox"""
+    from shards import AdvisoryShardLocks, FileShardLocks
+    conn = get_pg_connection()
+    if conn is not None:
+        return AdvisoryShardLocks(conn)
+    return FileShardLocks(get_outbox().path + ".shards")
+
+
+def notify_shards(shard_count, log_records=None):
+    """Claim free shards one at a time and notify the recipients in each.
+
+    Runs in every worker process (or node). A shard that another worker holds is skipped;
+    one that was already finished is cheap to revisit because its run is in the outbox.
+    Returns a list of per-shard result dicts, each with `succeeded` (see notify_succeeded);
+    log records are appended to log_records.
+    """
+    if log_records is not None:
+        sink = log_records.append
+    else:
+        sink = current_log_sink()
+    results = []
+    locks = shard_locks()
+    try:
+        with log_to(sink):
+            for shard in range(shard_count):
+                if not locks.try_acquire(shard):
+                    continue
+                try:
+                    started = time.perf_counter()
+                    with metrics_run(f"notify-shard-{shard}") as run:
+                        emails_sent = send_email_notification(0, shard=(shard, shard_count))
+                    metrics = run.to_dict()
+                    results.append({
+                        "shard": shard, "pid": os.getpid(), "emails_sent": emails_sent,
+                        "seconds": round(time.perf_counter() - started, 3), "metrics": metrics,
+                        "succeeded": notify_succeeded(metrics),
+                    })
+                finally:
+                    locks.release(shard)
+    finally:
+        locks.close()
+    return results
+
+
+def _notify_shards_process(shard_count):
+    """Process pool entry point: returns (shard results, log records) for the parent to merge"""
+    log_records = []
+    results = notify_shards(shard_count, log_records)
+    return results, log_records
+
+
+def run_sharded_notify(shard_count=4, processes=4, initializer=None, initargs=()):
+    """Notify with recipients split into shard_count shards, processed by local worker processes.
+
+    Each process claims shards (see notify_shards) until none are left; the per-shard results
+    and metrics are merged into one run summary, one result per shard. Other hosts can join
+    the same run with `worker.py notify-shard` when DATABASE_URL is set (shard locks, outbox
+    and ledger are then all in Postgres). initializer runs in each process
+    before any work, e.g. to install benchmark fakes. `connected` and `succeeded` are set
+    as in run_notify; a shard that failed fails the run.
+    """
+    if not log_connection_status(blob_storage=False):
+        return {"new_alerts": 0, "emails_sent": 0, "shards": [], "connected": False, "succeeded": False}
+    with metrics_run("notify") as run:
+        log_message(f"🧩 Notifying in {shard_count} shards with {processes} worker processes", "info", phase="Notification")
+        with ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer, initargs=initargs,
+        ) as pool:
+            futures = [pool.submit(_notify_shards_process, shard_count) for _ in range(processes)]
+            outcomes = [future.result() for future in futures]
+
+        sink = current_log_sink() or session_log_sink
+        visits = []
+        for results, log_records in outcomes:
+            for record in log_records:
+                sink(record)
+            visits += results
+        # A worker may revisit a shard another one finished (a no-op, its run is in the
+        # outbox); report one result per shard with the visits added up
+        by_shard = {}
+        for result in visits:
+            metrics = result.pop("metrics")
+            # Every shard sees the same candidate alerts; count them once
+            result["new_alerts"] = metrics["counters"].pop("candidate_alerts", 0)
+            run.merge(metrics)
+            pid = result.pop("pid")
+            merged = by_shard.setdefault(result["shard"], dict(result, emails_sent=0, seconds=0.0, pids=[], visits=0, succeeded=True))
+            merged["pids"].append(pid)
+            merged["emails_sent"] += result["emails_sent"]
+            merged["seconds"] = round(merged["seconds"] + result["seconds"], 3)
+            merged["visits"] += 1
+            merged["new_alerts"] = max(merged["new_alerts"], result["new_alerts"])
+            merged["succeeded"] = merged["succeeded"] and result["succeeded"]
+        shards = [by_shard[shard] for shard in sorted(by_shard)]
+        for result in shards:
+            log_message(
+                f"🧩 Shard {result['shard']}: {result['emails_sent']} emails in {result['seconds']:.1f}s "
+                f"({result['visits']} visits, pids {', '.join(map(str, result['pids']))})",
+                "info", phase="Notification",
+            )
+        missing = sorted(set(range(shard_count)) - {result["shard"] for result in shards})
+        if missing:
+            log_message(f"⚠️ Shards {missing} were held by another worker and not processed here", "warning", phase="Notification")
+        new_alerts = max((result["new_alerts"] for result in shards), default=0)
+        run.incr("candidate_alerts", new_alerts)
+    result = {
+        "new_alerts": new_alerts, "emails_sent": sum(result["emails_sent"] for result in shards),
+        "shards": shards, "metrics": run.to_dict(), "connected": True,
+        "succeeded": all(result["succeeded"] for result in shards),
+    }
+    result.update(delivery_status())
+    _finish_metrics(run)
+    return result
+
+
+def _run_update_pipeline(notify, max_workers):
+    wall_started = time.perf_counter()
+    result = {
+        "connected": False, "pipelines": {}, "logs": None, "critical_path": None,
+        "emails_sent": 0, "succeeded": False,
+    }
+
+    if not log_connection_status():
+        log_message("❌ Connection check failed; skipping update", "error", phase="Processing")
+        return result
+    result["connected"] = True
+
+    parent_sink = current_log_sink()
+    pipeline_log = PipelineLog(parent_sink)
+    log_message(f"🚀 Running {len(PIPELINES)} pipelines concurrently (max_workers={max_workers})", "info", phase="Processing")
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="medirate-pipeline") as executor:
+        # Each pipeline runs in its own copy of this context, which carries the metrics run and profile session
+        futures = [
+            executor.submit(contextvars.copy_context().run, _run_pipeline, name, func, pipeline_log)
+            for name, func in PIPELINES
+        ]
+        outcomes = [future.result() for future in futures]
+
+    result["logs"] = pipeline_log.buffer
+
+    # Without a parent sink (synchronous Streamlit call) the worker threads could not write
+    # to session_state, so replay the merged logs here on the calling thread.
+    if parent_sink is None:
+        for phase in pipeline_log.buffer.phases():
+            for record in pipeline_log.buffer.records(phase):
+                session_log_sink(record)
+
+    for name, succeeded, seconds in outcomes:
+        result["pipelines"][name] = {"succeeded": succeeded, "seconds": round(seconds, 3)}
+        status = "✅" if succeeded else "❌"
+        log_message(f"{status} {name} finished in {seconds:.1f}s", "success" if succeeded else "error", phase="Processing")
+
+    critical_name, _, critical_seconds = max(outcomes, key=lambda outcome: outcome[2])
+    sequential_seconds = sum(outcome[2] for outcome in outcomes)
+    result["critical_path"] = {"pipeline": critical_name, "seconds": round(critical_seconds, 3)}
+    log_message(
+        f"⏱️ Critical path: {critical_name} ({critical_seconds:.1f}s); "
+        f"sequential would have taken {sequential_seconds:.1f}s",
+        "info", phase="Processing",
+    )
+
+    if not all(succeeded for _, succeeded, _ in outcomes):
+        log_message("⚠️ Not all pipelines succeeded; skipping email notifications", "warning", phase="Notification")
+    else:
+        result["succeeded"] = True
+        if notify:
+            # The ledger decides what is new for each user, so this is safe to run every time
+            result["emails_sent"] = send_email_notification(0)
+            result["succeeded"] = notify_succeeded(current_run().to_dict())
+
+    result["wall_seconds"] = round(time.perf_counter() - wall_started, 3)
+    return result
@@ -0,0 +1,168 @@
+import threading
+from collections import namedtuple
+
+from data_processor import US_STATE_MAP, US_STATE_MAP_REV
+
+# ============================================================================
+# USER PREFERENCE SNAPSHOT
+# ============================================================================
+
+# One user's compiled match sets. states holds canonical state codes and categories
+# upper-cased names; the *_ids sets are the same values as Vocabulary ids, which is
+# what matching intersects.
+CompiledPreference = namedtuple(
+    "CompiledPreference", ["email", "states", "categories", "state_ids", "category_ids", "updated_at"]
+)
+
+# Users with identical compiled preferences share one segment and are matched once
+Segment = namedtuple("Segment", ["state_ids", "category_ids", "emails"])
+
+
+def canonical_state(value):
+    """Map a state code or full name to its upper-case code; anything else is just upper-cased"""
+    value = str(value or "").strip().upper()
+    if not value:
+        return None
+    if value in US_STATE_MAP:
+        return value
+    return US_STATE_MAP_REV.get(value, value)
+
+
+def canonical_category(value):
+    value = str(value or "").strip().upper()
+    return value or None
+
+
+class Vocabulary:
+    """Append-only string <-> int interning; ids stay stable for the life of the process"""
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def intern(self, value):
+        try:
+            return self._ids[value]
+        except KeyError:
+            with self._lock:
+                return self._ids.setdefault(value, len(self._ids))
+
+    def encode(self, values):
+        """ids of the values already known; unknown values cannot match anything"""
+        return frozenset(self._ids[value] for value in values if value in self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class PreferenceSnapshot:
+    """Compiled, immutable match sets for every user in user_email_preferences.
+
+    refresh() only recompiles users whose updated_at is newer than the watermark of the
+    previous load (rows without updated_at, or a table without the column, are recompiled
+    every time), drops users that were deleted, and regroups users with identical
+    preferences into segments. queries() and apply() split a refresh in two so its reads
+    can be issued together with other reads.
+    """
+
+    def __init__(self):
+        self.states = Vocabulary()
+        self.categories = Vocabulary()
+        self.users = {}
+        self.skipped = {}
+        self.segments = ()
+        self.watermark = None
+        self.tracks_updates = True
+        self.last_recompiled = 0
+        self._lock = threading.Lock()
+
+    def compile(self, email, preferences, updated_at=None):
+        """Return a CompiledPreference, or None if the user has no states or no categories"""
+        preferences = preferences or {}
+        states = frozenset(filter(None, map(canonical_state, preferences.get('states') or [])))
+        categories = frozenset(filter(None, map(canonical_category, preferences.get('categories') or [])))
+        if not states or not categories:
+            return None
+        return CompiledPreference(
+            email, states, categories,
+            frozenset(self.states.intern(state) for state in states),
+            frozenset(self.categories.intern(category) for category in categories),
+            updated_at,
+        )
+
+    def queries(self, table="user_email_preferences"):
+        """The data_access.TableQuery reads the next refresh needs, for fetching alongside other reads"""
+        from data_access import table_query
+        if not self.tracks_updates:
+            return [table_query(table, "user_email, preferences")]
+        if self.watermark is None:
+            return [table_query(table, "user_email, preferences, updated_at")]
+        return [
+            table_query(table, "user_email, preferences, updated_at", ("gte", "updated_at", self.watermark)),
+            # Rows without a timestamp can't be tracked by the watermark
+            table_query(table, "user_email, preferences, updated_at", ("is", "updated_at", "null")),
+            table_query(table, "user_email"),
+        ]
+
+    def refresh(self, fetch_many, table="user_email_preferences"):
+        """Bring the snapshot up to date with the table, reading through fetch_many(queries); returns self"""
+        with self._lock:
+            try:
+                results = fetch_many(self.queries(table))
+            except Exception:
+                if not self.tracks_updates or self.watermark is not None:
+                    raise
+                # No updated_at column: fall back to recompiling everyone on each refresh
+                self.tracks_updates = False
+                results = fetch_many(self.queries(table))
+            return self._apply(results)
+
+    def apply(self, results):
+        """Apply the rows fetched for queries() (in the same order); returns self"""
+        with self._lock:
+            return self._apply(results)
+
+    def _apply(self, results):
+        if len(results) == 3:
+            rows = results[0] + results[1]
+            present = {row['user_email'] for row in results[2]}
+        else:
+            rows = results[0]
+            present = {row['user_email'] for row in rows}
+        users = dict(self.users)
+        skipped = dict(self.skipped)
+        for email in set(users) - present:
+            del users[email]
+        for email in set(skipped) - present:
+            del skipped[email]
+        for row in rows:
+            email = row['user_email']
+            compiled = self.compile(email, row.get('preferences'), row.get('updated_at'))
+            users.pop(email, None)
+            skipped.pop(email, None)
+            if compiled is None:
+                skipped[email] = row.get('preferences')
+            else:
+                users[email] = compiled
+            if row.get('updated_at') and (self.watermark is None or row['updated_at'] > self.watermark):
+                self.watermark = row['updated_at']
+
+        segments = {}
+        for compiled in users.values():
+            segments.setdefault((compiled.state_ids, compiled.category_ids), []).append(compiled.email)
+        self.users = users
+        self.skipped = skipped
+        self.segments = tuple(Segment(states, categories, tuple(emails)) for (states, categories), emails in segments.items())
+        self.last_recompiled = len(rows)
+        return self
+
+    def emails(self):
+        return list(self.users) + list(self.skipped)
+
+    def encode_alert(self, state, service_lines):
+        """(state ids, category ids) of an alert in this snapshot's vocabulary"""
+        canonical = canonical_state(state)
+        return (
+            self.states.encode([canonical] if canonical else []),
+            self.categories.encode(filter(None, map(canonical_category, service_lines))),
+        )
@@ -0,0 +1,221 @@
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# ============================================================================
+# PROFILING MODE
+# ============================================================================
+
+# Allocations made by the profiler itself are left out of the tracemalloc reports
+_OWN_FILES = {tracemalloc.__file__, __file__, cProfile.__file__, pstats.__file__}
+
+# Active session of the current context, like metrics._active_run; pipeline threads run in
+# a copy of the context that started the run.
+_session = contextvars.ContextVar("profile_session", default=None)
+
+
+def current_session():
+    return _session.get()
+
+
+def _file_name(phase):
+    return re.sub(r"[^a-z0-9]+", "_", phase.lower()).strip("_") or "phase"
+
+
+class ProfileSession:
+    """cProfile stats, stack samples and tracemalloc allocations of one run, per phase.
+
+    metrics.timed() hands every step to enter()/exit(). A thread's outermost step is
+    profiled under its phase (nested steps are part of it): a cProfile.Profile runs for the
+    step, and a tracemalloc snapshot before and after gives the lines whose memory grew.
+    tracemalloc is process-wide, so steps that overlap on other threads share their
+    allocations. Where sys._current_frames is available a sampler thread also records the
+    stacks of threads inside a step every sample_interval seconds, as collapsed stacks.
+    Enabled, a run is several times slower: tracemalloc roughly triples allocation-heavy
+    steps and cProfile adds as much again to call-heavy code (openpyxl, row-wise pandas).
+    deterministic=False leaves cProfile out; the stack samples still show where time goes.
+    """
+
+    def __init__(self, run_name, directory, sample_interval=0.005, top=25, deterministic=True):
+        self.run_name = run_name
+        self.started_at = datetime.now()
+        self.directory = os.path.join(directory, f"{run_name}-{self.started_at:%Y%m%d-%H%M%S}")
+        self.sample_interval = sample_interval
+        self.top = top
+        self.deterministic = deterministic
+        self.stats = {}
+        self.samples = {}
+        self.allocations = {}
+        self.seconds = Counter()
+        self.steps = Counter()
+        self._threads = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._owns_tracemalloc = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        if hasattr(sys, "_current_frames"):
+            self._sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+            self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+    def enter(self, step, phase):
+        """Start profiling the calling thread; returns a token for exit(), or None inside another step"""
+        if getattr(self._local, "active", False):
+            return None
+        self._local.active = True
+        before = tracemalloc.take_snapshot()
+        with self._lock:
+            self._threads[threading.get_ident()] = phase
+        profiler = cProfile.Profile() if self.deterministic else None
+        started = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        return phase, profiler, before, started
+
+    def exit(self, token):
+        if token is None:
+            return
+        phase, profiler, before, started = token
+        if profiler is not None:
+            profiler.disable()
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self._threads.pop(threading.get_ident(), None)
+        # Snapshot.filter_traces is far slower than grouping, so own lines are skipped below
+        grown = tracemalloc.take_snapshot().compare_to(before, "lineno")
+        with self._lock:
+            self.seconds[phase] += seconds
+            self.steps[phase] += 1
+            if profiler is not None and phase in self.stats:
+                self.stats[phase].add(profiler)
+            elif profiler is not None:
+                self.stats[phase] = pstats.Stats(profiler)
+            allocations = self.allocations.setdefault(phase, Counter())
+            for diff in grown:
+                if diff.size_diff > 0 and diff.traceback[0].filename not in _OWN_FILES:
+                    allocations[str(diff.traceback[0])] += diff.size_diff
+        self._local.active = False
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            with self._lock:
+                threads = dict(self._threads)
+            if not threads:
+                continue
+            frames = sys._current_frames()
+            stacks = []
+            for ident, phase in threads.items():
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if stack:
+                    stacks.append((phase, ";".join(reversed(stack))))
+            del frames
+            with self._lock:
+                for phase, stack in stacks:
+                    self.samples.setdefault(phase, Counter())[stack] += 1
+
+    def to_dict(self):
+        phases = {}
+        for phase in sorted(self.steps):
+            allocations = self.allocations.get(phase, Counter())
+            phases[phase] = {
+                "steps": self.steps[phase],
+                "seconds": round(self.seconds[phase], 6),
+                "samples": sum(self.samples.get(phase, Counter()).values()),
+                "allocated_bytes": sum(allocations.values()),
+                "top_allocations": [{"line": line, "bytes": size} for line, size in allocations.most_common(self.top)],
+            }
+        return {"run": self.run_name, "started_at": self.started_at.isoformat(timespec="seconds"), "phases": phases}
+
+    def write(self):
+        """Write <phase>.pstats, <phase>.folded, allocations.txt and summary.json into self.directory"""
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        for phase, stats in self.stats.items():
+            path = os.path.join(self.directory, f"{_file_name(phase)}.pstats")
+            stats.dump_stats(path)
+            paths.append(path)
+        for phase, samples in self.samples.items():
+            path = os.path.join(self.directory, f"{_file_name(phase)}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            paths.append(path)
+        summary = self.to_dict()
+        path = os.path.join(self.directory, "allocations.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            for phase, data in summary["phases"].items():
+                f.write(f"== {phase}: {data['allocated_bytes'] / 1024:.1f} KiB grew over {data['steps']} steps\n")
+                for allocation in data["top_allocations"]:
+                    f.write(f"{allocation['bytes'] / 1024:>12.1f} KiB  {allocation['line']}\n")
+                f.write("\n")
+        paths.append(path)
+        path = os.path.join(self.directory, "summary.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        paths.append(path)
+        return paths
+
+
+@contextmanager
+def profile_run(run_name, enabled=False, directory="profiles", sample_interval=0.005, deterministic=True):
+    """Profile the timed() steps of the block when enabled; yields the session, or None.
+
+    A run inside an active one reuses it, so `update` with notify profiles both. When
+    disabled nothing is started and timed() only checks that no session is active.
+    """
+    if not enabled:
+        yield None
+        return
+    outer = _session.get()
+    if outer is not None:
+        yield outer
+        return
+    session = ProfileSession(run_name, directory, sample_interval, deterministic=deterministic).start()
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+        session.stop()
+
+
+def list_profiles(directory="profiles", limit=20):
+    """[(run directory name, modified datetime, [file paths])] of saved profiles, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    runs = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, file) for file in os.listdir(path))
+            runs.append((name, datetime.fromtimestamp(os.path.getmtime(path)), files))
+    runs.sort(key=lambda run: run[1], reverse=True)
+    return runs[:limit]
@@ -0,0 +1,149 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+# ============================================================================
+# SEND SCHEDULER
+# ============================================================================
+
+HOUR = 3600
+DAY = 86400
+
+
+class TokenBucket:
+    """capacity tokens, refilled continuously at capacity / period per second"""
+
+    def __init__(self, capacity, period, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self):
+        """Seconds until one token is available"""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def cap(self, tokens):
+        """Lower the level to at most tokens (reconciling with usage seen elsewhere)"""
+        self._refill()
+        self.tokens = min(self.tokens, float(tokens))
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+def parse_window(value):
+    """'08:00-18:00' -> (time(8), time(18)); None or '' -> None. The window may wrap midnight."""
+    if not value:
+        return None
+    start, end = (datetime.strptime(part.strip(), "%H:%M").time() for part in value.split("-"))
+    return start, end
+
+
+class SendScheduler:
+    """Token-bucket pacing for outgoing mail: per-second, per-hour and per-day budgets plus an
+    optional daily send window.
+
+    The hour and day buckets are reconciled with the outbox's own record of what was sent
+    in the last hour/day before every send, so budgets hold across restarts and across the
+    processes of a sharded run (which may overshoot by at most one message per process).
+    Each budget is optional; None means unlimited.
+    """
+
+    def __init__(self, per_second=None, per_hour=None, per_day=None, window=None, outbox=None,
+                 clock=time.monotonic, now=datetime.now):
+        self.per_second, self.per_hour, self.per_day = per_second, per_hour, per_day
+        self.window = window
+        self.outbox = outbox
+        self._now = now
+        self._lock = threading.Lock()
+        self._buckets = {}
+        for name, budget, period in (("second", per_second, 1), ("hour", per_hour, HOUR), ("day", per_day, DAY)):
+            if budget:
+                self._buckets[name] = TokenBucket(budget, period, clock)
+
+    def _reconcile(self):
+        if self.outbox is None:
+            return
+        now = self._now()
+        for name, budget, period in (("hour", self.per_hour, HOUR), ("day", self.per_day, DAY)):
+            if name in self._buckets:
+                sent = self.outbox.sent_since(now - timedelta(seconds=period))
+                self._buckets[name].cap(budget - sent)
+
+    def seconds_until_window(self, now=None):
+        """0 inside the send window (or without one), else seconds until it next opens"""
+        if self.window is None:
+            return 0.0
+        now = now or self._now()
+        start, end = self.window
+        current = now.time()
+        inside = start <= current < end if start <= end else (current >= start or current < end)
+        if inside:
+            return 0.0
+        opens = datetime.combine(now.date(), start)
+        if opens <= now:
+            opens += timedelta(days=1)
+        return (opens - now).total_seconds()
+
+    def wait_time(self):
+        """Seconds until the next message may be sent"""
+        with self._lock:
+            self._reconcile()
+            waits = [bucket.wait_time() for bucket in self._buckets.values()]
+        return max([self.seconds_until_window(), *waits])
+
+    def take(self):
+        """Consume one token from every bucket for a message that is being sent"""
+        with self._lock:
+            for bucket in self._buckets.values():
+                bucket.take()
+
+    def project_completion(self, queue_depth, now=None):
+        """Estimated datetime when queue_depth messages will have been sent under these budgets"""
+        now = now or self._now()
+        if queue_depth <= 0:
+            return now
+        with self._lock:
+            self._reconcile()
+            hour_left = self._buckets["hour"].tokens if "hour" in self._buckets else None
+            day_left = self._buckets["day"].tokens if "day" in self._buckets else None
+        # Walk forward one hour at a time; within an hour the per-second rate is the limit
+        remaining = queue_depth
+        cursor = now
+        while remaining > 0:
+            if (cursor - now).days > 366:
+                return None
+            wait = self.seconds_until_window(cursor)
+            if wait:
+                cursor += timedelta(seconds=wait)
+                continue
+            slot_end = cursor.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            if self.window is not None and self.window[0] <= self.window[1]:
+                slot_end = min(slot_end, datetime.combine(cursor.date(), self.window[1]))
+            capacity = remaining
+            if self.per_second:
+                capacity = min(capacity, int(self.per_second * (slot_end - cursor).total_seconds()))
+            if hour_left is not None:
+                capacity = min(capacity, max(int(hour_left), 0))
+            if day_left is not None:
+                capacity = min(capacity, max(int(day_left), 0))
+            if capacity >= remaining:
+                seconds = remaining / self.per_second if self.per_second else 0
+                return cursor + timedelta(seconds=seconds)
+            remaining -= capacity
+            if hour_left is not None:
+                hour_left = hour_left - capacity + self.per_hour  # refilled by the next slot
+                hour_left = min(hour_left, self.per_hour)
+            if day_left is not None:
+                day_left = min(day_left - capacity + self.per_day / 24, self.per_day)
+            cursor = slot_end
+        return cursor
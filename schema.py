@@ -0,0 +1,73 @@
+import pandas as pd
+
+from data_processor import SERVICE_LINE_COLUMNS
+
+# ============================================================================
+# INGEST SCHEMA
+# ============================================================================
+
+# Column dtypes of the alert tables. Names are the table's; sheet headers are matched after
+# lower-casing and mapping spaces and dots to underscores ('action date' -> 'action_date',
+# 'service_lines_impacted.1' -> 'service_lines_impacted_1'). Low-cardinality fields are
+# categoricals, free text is Arrow-backed strings and dates are datetime64 dates.
+CATEGORY = "category"
+TEXT = "string[pyarrow]"
+DATE = "date"
+
+TABLE_SCHEMAS = {
+    "bill_track_50": {
+        "url": TEXT, "bill_number": TEXT, "name": TEXT, "last_action": TEXT, "sponsor_list": TEXT,
+        "ai_summary": TEXT, "committee": TEXT,
+        "state": CATEGORY, "bill_progress": CATEGORY, "is_new": CATEGORY, "source_sheet": CATEGORY,
+        **{col: CATEGORY for col in SERVICE_LINE_COLUMNS},
+        "action_date": DATE, "created": DATE, "date_extracted": DATE,
+    },
+    "provider_alerts": {
+        "subject": TEXT, "summary": TEXT, "links": TEXT,
+        "state": CATEGORY, "is_new": CATEGORY,
+        **{col: CATEGORY for col in SERVICE_LINE_COLUMNS},
+        "announcement_date": DATE,
+    },
+}
+
+
+def schema_name(column):
+    """Table column name a sheet header maps to"""
+    return str(column).strip().lower().replace(' ', '_').replace('.', '_')
+
+
+def schema_dtypes(df, table):
+    """{column of df: dtype} for the columns of df that table's schema covers"""
+    schema = TABLE_SCHEMAS[table]
+    return {col: schema[schema_name(col)] for col in df.columns if schema_name(col) in schema}
+
+
+def apply_schema(df, table, parse_dates=None, categories=None):
+    """Convert df's columns to table's schema dtypes in place and return df.
+
+    Date columns are converted with parse_dates(series, column) when given (e.g. a
+    dates.DateParser), else pd.to_datetime. categories maps columns to extra values their
+    categorical must allow, such as the options of a dashboard selectbox.
+    """
+    categories = categories or {}
+    for col, dtype in schema_dtypes(df, table).items():
+        values = df[col]
+        if dtype == DATE:
+            if parse_dates is not None:
+                values = parse_dates(values, col)
+            elif not pd.api.types.is_datetime64_any_dtype(values):
+                values = pd.to_datetime(values, errors='coerce')
+        elif dtype == CATEGORY:
+            values = values.astype(object).where(values.notna(), None).astype(CATEGORY)
+            extra = [value for value in categories.get(col, ()) if value not in values.cat.categories]
+            if extra:
+                values = values.cat.add_categories(extra)
+        else:
+            values = values.astype(object).where(values.notna(), None).astype(dtype)
+        df[col] = values
+    return df
+
+
+def memory_mb(df):
+    """Deep memory use of df in MB (counts the Python string objects of object columns)"""
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
@@ -0,0 +1,68 @@
+import fcntl
+import os
+import zlib
+
+# ============================================================================
+# NOTIFICATION SHARD CLAIMS
+# ============================================================================
+
+# Advisory lock keys are (namespace, shard); the namespace keeps them clear of other users
+# of pg_advisory_lock on the same database.
+LOCK_NAMESPACE = zlib.crc32(b"medirate-notify-shard") & 0x7FFFFFFF
+
+
+class AdvisoryShardLocks:
+    """Shard claims held as Postgres session advisory locks on one connection.
+
+    Works across processes and hosts that share the database. Locks are released
+    explicitly, or by Postgres when the connection closes (e.g. the worker dies).
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.autocommit = True
+
+    def try_acquire(self, shard):
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", (LOCK_NAMESPACE, shard))
+            return cursor.fetchone()[0]
+
+    def release(self, shard):
+        with self.conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s, %s)", (LOCK_NAMESPACE, shard))
+
+    def close(self):
+        self.conn.close()
+
+
+class FileShardLocks:
+    """Shard claims held as flock() locks on files in a directory, for single-host runs.
+
+    The kernel drops the locks when the process exits, so a crashed worker never leaves
+    a shard claimed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._held = {}
+
+    def try_acquire(self, shard):
+        handle = open(os.path.join(self.directory, f"shard-{shard}.lock"), "a+")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._held[shard] = handle
+        return True
+
+    def release(self, shard):
+        handle = self._held.pop(shard, None)
+        if handle is not None:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+            handle.close()
+
+    def close(self):
+        for shard in list(self._held):
+            self.release(shard)
@@ -0,0 +1,143 @@
+-- Full-text search over bills and provider alerts. Apply after bill_track_50_url_key.sql.
+--
+-- alert_search holds one weighted tsvector per alert: a bill's bill_number and name (A),
+-- ai_summary (B), last_action (C) and sponsor_list (D), and a provider alert's subject (A)
+-- and summary (B).
+-- It is a side table, like alert_service_lines, so the `select *` reads of the alert
+-- tables (ingest diff, notify, dashboard) don't carry the vectors. Statement-level
+-- triggers keep it current on every insert, upsert, update and delete, so ingest needs no
+-- extra step; updates that leave the text alone (e.g. is_new resets) don't re-index.
+-- key is bill_track_50.url_key or provider_alerts.id.
+--
+-- search_alerts(query, max_rows, max_candidates) ranks matches of a web-search style query
+-- ("quoted phrases", or, -excluded) with ts_rank_cd, found through the GIN index. Ranking
+-- reads every match's document, so a term that matches nearly everything ("medicaid")
+-- only ranks the first max_candidates matches; latency stays bounded and narrower
+-- queries are ranked exactly.
+
+CREATE TABLE IF NOT EXISTS alert_search (
+    source   text     NOT NULL,
+    key      bigint   NOT NULL,
+    document tsvector NOT NULL,
+    PRIMARY KEY (source, key)
+);
+
+CREATE INDEX IF NOT EXISTS alert_search_document_idx ON alert_search USING GIN (document);
+
+CREATE OR REPLACE FUNCTION bill_search_document(bill_number text, name text, ai_summary text, last_action text, sponsor_list text)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('english', coalesce(bill_number, '') || ' ' || coalesce(name, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(ai_summary, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(last_action, '')), 'C')
+        || setweight(to_tsvector('english', coalesce(sponsor_list, '')), 'D')
+$$;
+
+CREATE OR REPLACE FUNCTION provider_alert_search_document(subject text, summary text)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('english', coalesce(subject, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(summary, '')), 'B')
+$$;
+
+-- TG_ARGV[0] is the source, 'bill' or 'provider_alert'. Rows come from the transition
+-- tables: new_rows on insert and update, old_rows on update and delete.
+CREATE OR REPLACE FUNCTION index_alert_search()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    source text := TG_ARGV[0];
+    key_column text := CASE TG_ARGV[0] WHEN 'bill' THEN 'url_key' ELSE 'id' END;
+    text_columns text[] := CASE TG_ARGV[0]
+        WHEN 'bill' THEN ARRAY['bill_number', 'name', 'ai_summary', 'last_action', 'sponsor_list']
+        ELSE ARRAY['subject', 'summary'] END;
+    changed text := '';
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        -- Keys that are gone (deleted, or changed by an update)
+        EXECUTE format(
+            'DELETE FROM alert_search s USING old_rows o WHERE s.source = %L AND s.key = o.%I %s',
+            source, key_column,
+            CASE WHEN TG_OP = 'UPDATE' THEN format('AND o.%1$I NOT IN (SELECT %1$I FROM new_rows WHERE %1$I IS NOT NULL)', key_column) ELSE '' END);
+    END IF;
+    IF TG_OP = 'UPDATE' THEN
+        -- Only rows whose key is new or whose text changed
+        changed := format(
+            'LEFT JOIN old_rows o ON o.%1$I = n.%1$I WHERE o.%1$I IS NULL OR ROW(%2$s) IS DISTINCT FROM ROW(%3$s)',
+            key_column,
+            (SELECT string_agg(format('n.%I', col), ', ') FROM unnest(text_columns) col),
+            (SELECT string_agg(format('o.%I', col), ', ') FROM unnest(text_columns) col));
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        EXECUTE format(
+            'INSERT INTO alert_search (source, key, document)
+             SELECT DISTINCT ON (n.%2$I) %1$L, n.%2$I, %1$s_search_document(%3$s)
+             FROM new_rows n %4$s
+             ON CONFLICT (source, key) DO UPDATE SET document = EXCLUDED.document
+             WHERE alert_search.document IS DISTINCT FROM EXCLUDED.document',
+            source, key_column,
+            (SELECT string_agg(format('n.%I', col), ', ') FROM unnest(text_columns) col),
+            changed);
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+DO $$
+DECLARE
+    indexed record;
+BEGIN
+    FOR indexed IN SELECT * FROM (VALUES ('bill_track_50', 'bill'), ('provider_alerts', 'provider_alert')) AS t (tbl, source)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', indexed.tbl || '_search_insert', indexed.tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', indexed.tbl || '_search_update', indexed.tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', indexed.tbl || '_search_delete', indexed.tbl);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION index_alert_search(%L)',
+            indexed.tbl || '_search_insert', indexed.tbl, indexed.source);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION index_alert_search(%L)',
+            indexed.tbl || '_search_update', indexed.tbl, indexed.source);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION index_alert_search(%L)',
+            indexed.tbl || '_search_delete', indexed.tbl, indexed.source);
+    END LOOP;
+END
+$$;
+
+-- Backfill (and repair) from the current rows
+INSERT INTO alert_search (source, key, document)
+SELECT DISTINCT ON (url_key) 'bill', url_key, bill_search_document(bill_number, name, ai_summary, last_action, sponsor_list)
+FROM bill_track_50 WHERE url_key IS NOT NULL
+ON CONFLICT (source, key) DO UPDATE SET document = EXCLUDED.document;
+
+INSERT INTO alert_search (source, key, document)
+SELECT 'provider_alert', id, provider_alert_search_document(subject, summary)
+FROM provider_alerts
+ON CONFLICT (source, key) DO UPDATE SET document = EXCLUDED.document;
+
+DELETE FROM alert_search s
+WHERE (s.source = 'bill' AND NOT EXISTS (SELECT 1 FROM bill_track_50 b WHERE b.url_key = s.key))
+   OR (s.source = 'provider_alert' AND NOT EXISTS (SELECT 1 FROM provider_alerts a WHERE a.id = s.key));
+
+-- The best max_rows matches over both sources, highest rank first
+CREATE OR REPLACE FUNCTION search_alerts(query text, max_rows integer DEFAULT 200, max_candidates integer DEFAULT 5000)
+RETURNS TABLE (source text, key bigint, rank real)
+LANGUAGE sql STABLE AS $$
+    WITH q AS (
+        SELECT websearch_to_tsquery('english', query) AS tsq
+    ),
+    candidates AS (
+        SELECT s.source, s.key, s.document
+        FROM alert_search s, q
+        WHERE s.document @@ q.tsq
+        LIMIT max_candidates
+    )
+    SELECT c.source, c.key, ts_rank_cd(c.document, q.tsq) AS rank
+    FROM candidates c, q
+    ORDER BY rank DESC, c.source, c.key
+    LIMIT max_rows
+$$;
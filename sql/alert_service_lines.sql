@@ -0,0 +1,81 @@
+-- Normalized projection of the four service_lines_impacted columns, one row per
+-- (alert, state, category). data_processor.sync_alert_service_lines keeps it current
+-- on ingest; `python worker.py sync-service-lines` backfills it from existing rows.
+--
+-- alert_key matches data_processor.alert_key: 'bill:<url>' or 'provider_alert:<natural_key>'.
+-- state_code is the two-letter code (or the upper-cased value when it is not a US state)
+-- and category the upper-cased service line, the same canonical forms preferences.py uses.
+
+CREATE TABLE IF NOT EXISTS alert_service_lines (
+    alert_key  text NOT NULL,
+    state_code text NOT NULL,
+    category   text NOT NULL,
+    source     text NOT NULL,
+    PRIMARY KEY (alert_key, state_code, category)
+);
+
+-- Matching probes by (state, category); the trailing alert_key makes it index-only
+CREATE INDEX IF NOT EXISTS alert_service_lines_state_category_idx
+    ON alert_service_lines (state_code, category, alert_key);
+CREATE INDEX IF NOT EXISTS alert_service_lines_category_state_idx
+    ON alert_service_lines (category, state_code);
+
+-- Users store states as codes or full names
+CREATE TABLE IF NOT EXISTS us_states (
+    code text PRIMARY KEY,
+    name text NOT NULL UNIQUE
+);
+INSERT INTO us_states (code, name) VALUES
+    ('AL', 'ALABAMA'), ('AK', 'ALASKA'), ('AZ', 'ARIZONA'), ('AR', 'ARKANSAS'), ('CA', 'CALIFORNIA'),
+    ('CO', 'COLORADO'), ('CT', 'CONNECTICUT'), ('DE', 'DELAWARE'), ('FL', 'FLORIDA'), ('GA', 'GEORGIA'),
+    ('HI', 'HAWAII'), ('ID', 'IDAHO'), ('IL', 'ILLINOIS'), ('IN', 'INDIANA'), ('IA', 'IOWA'),
+    ('KS', 'KANSAS'), ('KY', 'KENTUCKY'), ('LA', 'LOUISIANA'), ('ME', 'MAINE'), ('MD', 'MARYLAND'),
+    ('MA', 'MASSACHUSETTS'), ('MI', 'MICHIGAN'), ('MN', 'MINNESOTA'), ('MS', 'MISSISSIPPI'), ('MO', 'MISSOURI'),
+    ('MT', 'MONTANA'), ('NE', 'NEBRASKA'), ('NV', 'NEVADA'), ('NH', 'NEW HAMPSHIRE'), ('NJ', 'NEW JERSEY'),
+    ('NM', 'NEW MEXICO'), ('NY', 'NEW YORK'), ('NC', 'NORTH CAROLINA'), ('ND', 'NORTH DAKOTA'), ('OH', 'OHIO'),
+    ('OK', 'OKLAHOMA'), ('OR', 'OREGON'), ('PA', 'PENNSYLVANIA'), ('RI', 'RHODE ISLAND'), ('SC', 'SOUTH CAROLINA'),
+    ('SD', 'SOUTH DAKOTA'), ('TN', 'TENNESSEE'), ('TX', 'TEXAS'), ('UT', 'UTAH'), ('VT', 'VERMONT'),
+    ('VA', 'VIRGINIA'), ('WA', 'WASHINGTON'), ('WV', 'WEST VIRGINIA'), ('WI', 'WISCONSIN'), ('WY', 'WYOMING')
+ON CONFLICT (code) DO NOTHING;
+
+-- Stable recipient shard, identical to data_processor.shard_of: the first 32 bits of
+-- md5(lower(trim(email))) modulo the shard count.
+CREATE OR REPLACE FUNCTION recipient_shard(email text, shard_count int)
+RETURNS int
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT (('x' || substr(md5(lower(trim(email))), 1, 8))::bit(32)::bigint % shard_count)::int
+$$;
+
+-- (user_email, alert_key) pairs for the given candidate alerts, ordered by user so callers
+-- can stream one user's alerts at a time. With shard_count > 1 only recipients in the given
+-- shard are returned. Also callable as supabase.rpc('match_alert_recipients').
+CREATE OR REPLACE FUNCTION match_alert_recipients(alert_keys text[], shard int DEFAULT 0, shard_count int DEFAULT 1)
+RETURNS TABLE (user_email text, alert_key text)
+LANGUAGE sql STABLE AS $$
+    WITH recipients AS (
+        SELECT p.user_email, p.preferences
+        FROM user_email_preferences p
+        WHERE shard_count <= 1 OR recipient_shard(p.user_email, shard_count) = shard
+    ),
+    user_states AS (
+        SELECT p.user_email, COALESCE(s.code, upper(trim(st.value))) AS state_code
+        FROM recipients p
+        CROSS JOIN LATERAL jsonb_array_elements_text(COALESCE(p.preferences::jsonb -> 'states', '[]'::jsonb)) AS st(value)
+        LEFT JOIN us_states s ON upper(trim(st.value)) IN (s.code, s.name)
+        WHERE trim(st.value) <> ''
+    ),
+    user_categories AS (
+        SELECT p.user_email, upper(trim(c.value)) AS category
+        FROM recipients p
+        CROSS JOIN LATERAL jsonb_array_elements_text(COALESCE(p.preferences::jsonb -> 'categories', '[]'::jsonb)) AS c(value)
+        WHERE trim(c.value) <> ''
+    )
+    SELECT DISTINCT us.user_email, asl.alert_key
+    FROM user_states us
+    JOIN user_categories uc ON uc.user_email = us.user_email
+    JOIN alert_service_lines asl
+      ON asl.state_code = us.state_code
+     AND asl.category = uc.category
+    WHERE asl.alert_key = ANY(alert_keys)
+    ORDER BY us.user_email, asl.alert_key
+$$;
@@ -0,0 +1,35 @@
+-- One bill_track_50 row per url. Apply once; it removes the duplicates already in the
+-- table and installs the unique index that lets ingest upsert on url
+-- (on_conflict='url'). data_processor.remove_duplicates_from_db runs the same
+-- statements on every bill ingest, directly over DATABASE_URL or through
+-- supabase.rpc('dedupe_bill_track_50').
+
+-- Deletes all but the most recently extracted row per url in one set-based statement
+-- and returns how many rows went and how many urls had duplicates.
+CREATE OR REPLACE FUNCTION dedupe_bill_track_50()
+RETURNS TABLE (deleted_rows bigint, duplicate_urls bigint)
+LANGUAGE plpgsql AS $$
+BEGIN
+    RETURN QUERY
+    WITH ranked AS (
+        SELECT b.ctid, b.url, ROW_NUMBER() OVER (PARTITION BY b.url ORDER BY b.date_extracted DESC NULLS LAST) AS rn
+        FROM bill_track_50 b
+        WHERE b.url IS NOT NULL
+    ),
+    deleted AS (
+        DELETE FROM bill_track_50 b
+        USING ranked r
+        WHERE b.ctid = r.ctid AND r.rn > 1
+        RETURNING b.url
+    )
+    SELECT count(*), count(DISTINCT d.url) FROM deleted d;
+
+    -- Deployments before the rename carry the url index as bill_track_50_url_key
+    IF to_regclass('bill_track_50_url_key') IS NOT NULL AND to_regclass('bill_track_50_url_uniq') IS NULL THEN
+        ALTER INDEX bill_track_50_url_key RENAME TO bill_track_50_url_uniq;
+    END IF;
+    CREATE UNIQUE INDEX IF NOT EXISTS bill_track_50_url_uniq ON bill_track_50 (url);
+END
+$$;
+
+SELECT * FROM dedupe_bill_track_50();
@@ -0,0 +1,67 @@
+-- Canonical 64-bit url key for bill_track_50. Apply after bill_track_50_dedup.sql.
+--
+-- canonical_bill_url and bill_url_key match urls.canonical_urls and urls.url_key: the url
+-- trimmed, lower-cased, without #fragment or trailing slashes, and the first 64 bits of its
+-- md5 as a signed bigint. A trigger keeps url_key current; ingest also sends it and
+-- upserts on it (on_conflict='url_key'), so trivial url variants update the same bill.
+
+CREATE OR REPLACE FUNCTION canonical_bill_url(url text)
+RETURNS text
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT rtrim(regexp_replace(lower(btrim(url, E' \t\r\n')), '#.*$', ''), '/')
+$$;
+
+CREATE OR REPLACE FUNCTION bill_url_key(url text)
+RETURNS bigint
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT ('x' || substr(md5(canonical_bill_url(url)), 1, 16))::bit(64)::bigint
+$$;
+
+ALTER TABLE bill_track_50 ADD COLUMN IF NOT EXISTS url_key bigint;
+
+CREATE OR REPLACE FUNCTION set_bill_url_key()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.url_key := bill_url_key(NEW.url);
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS bill_track_50_url_key ON bill_track_50;
+CREATE TRIGGER bill_track_50_url_key
+    BEFORE INSERT OR UPDATE OF url ON bill_track_50
+    FOR EACH ROW EXECUTE FUNCTION set_bill_url_key();
+
+UPDATE bill_track_50 SET url_key = bill_url_key(url) WHERE url_key IS DISTINCT FROM bill_url_key(url);
+
+-- Duplicates are now rows sharing a url_key (which covers exact url duplicates), and the
+-- key gets its own unique index next to the one on url.
+CREATE OR REPLACE FUNCTION dedupe_bill_track_50()
+RETURNS TABLE (deleted_rows bigint, duplicate_urls bigint)
+LANGUAGE plpgsql AS $$
+BEGIN
+    RETURN QUERY
+    WITH ranked AS (
+        SELECT b.ctid, b.url_key, ROW_NUMBER() OVER (PARTITION BY b.url_key ORDER BY b.date_extracted DESC NULLS LAST) AS rn
+        FROM bill_track_50 b
+        WHERE b.url_key IS NOT NULL
+    ),
+    deleted AS (
+        DELETE FROM bill_track_50 b
+        USING ranked r
+        WHERE b.ctid = r.ctid AND r.rn > 1
+        RETURNING b.url_key
+    )
+    SELECT count(*), count(DISTINCT d.url_key) FROM deleted d;
+
+    -- Deployments before the rename carry the url index as bill_track_50_url_key
+    IF to_regclass('bill_track_50_url_key') IS NOT NULL AND to_regclass('bill_track_50_url_uniq') IS NULL THEN
+        ALTER INDEX bill_track_50_url_key RENAME TO bill_track_50_url_uniq;
+    END IF;
+    CREATE UNIQUE INDEX IF NOT EXISTS bill_track_50_url_uniq ON bill_track_50 (url);
+    CREATE UNIQUE INDEX IF NOT EXISTS bill_track_50_url_key_uniq ON bill_track_50 (url_key);
+END
+$$;
+
+SELECT * FROM dedupe_bill_track_50();
@@ -0,0 +1,64 @@
+-- Change notification for the dashboard's live frames (live_frames.py). Apply after
+-- bill_track_50_url_key.sql.
+--
+-- Statement-level triggers on bill_track_50, provider_alerts and service_category_list
+-- send the keys of the rows each statement inserted, updated or deleted on the channel
+-- 'medirate_table_changes' as {"table": ..., "op": ..., "keys": [...]}. Keys are
+-- bill_track_50.url_key, provider_alerts.id and service_category_list.categories, as text;
+-- updates send old and new keys, so a row whose key changed is dropped under the old one.
+-- A statement's keys are split into payloads below NOTIFY's 8000-byte limit. Listeners
+-- receive them on commit, and a bulk ingest costs a handful of notifications, not one per row.
+
+CREATE OR REPLACE FUNCTION notify_changed_keys()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    key_column text := TG_ARGV[0];
+    changed_keys text;
+    payload text;
+BEGIN
+    changed_keys := format('SELECT (%1$I)::text AS k FROM changed_rows WHERE %1$I IS NOT NULL', key_column);
+    IF TG_OP = 'UPDATE' THEN
+        changed_keys := changed_keys || format(' UNION SELECT (%1$I)::text FROM old_rows WHERE %1$I IS NOT NULL', key_column);
+    END IF;
+    FOR payload IN EXECUTE format(
+        'SELECT json_build_object(''table'', %L, ''op'', %L, ''keys'', json_agg(k ORDER BY k))::text
+         FROM (SELECT k, sum(octet_length(k) + 4) OVER (ORDER BY k) / 7000 AS part
+               FROM (SELECT DISTINCT k FROM (%s) changed) keys) parts
+         GROUP BY part',
+        TG_TABLE_NAME, TG_OP, changed_keys)
+    LOOP
+        PERFORM pg_notify('medirate_table_changes', payload);
+    END LOOP;
+    RETURN NULL;
+END
+$$;
+
+DO $$
+DECLARE
+    watched record;
+BEGIN
+    FOR watched IN SELECT * FROM (VALUES
+        ('bill_track_50', 'url_key'),
+        ('provider_alerts', 'id'),
+        ('service_category_list', 'categories')
+    ) AS t (tbl, key_column)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', watched.tbl || '_notify_insert', watched.tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', watched.tbl || '_notify_update', watched.tbl);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', watched.tbl || '_notify_delete', watched.tbl);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS changed_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_changed_keys(%L)',
+            watched.tbl || '_notify_insert', watched.tbl, watched.key_column);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS changed_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_changed_keys(%L)',
+            watched.tbl || '_notify_update', watched.tbl, watched.key_column);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS changed_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_changed_keys(%L)',
+            watched.tbl || '_notify_delete', watched.tbl, watched.key_column);
+    END LOOP;
+END
+$$;
@@ -0,0 +1,56 @@
+-- Content-derived natural key for provider_alerts.
+--
+-- provider_alert_key matches data_processor.provider_alert_keys: the first 64 bits of
+-- md5('state|links|announcement_date|md5(subject)') as a signed bigint, each value trimmed
+-- and the date as 'YYYY-MM-DD' (older rows hold 'MM/DD/YYYY'). A trigger keeps natural_key
+-- current; ingest upserts on it (on_conflict='natural_key'), so rows are matched on their
+-- content instead of the sheet's id column and id stays the table's own, stable identity.
+
+CREATE OR REPLACE FUNCTION provider_alert_date(value text)
+RETURNS text
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE
+        WHEN btrim(value, E' \t\r\n') ~ '^\d{1,2}/\d{1,2}/\d{4}$'
+            THEN to_char(to_date(btrim(value, E' \t\r\n'), 'MM/DD/YYYY'), 'YYYY-MM-DD')
+        ELSE left(btrim(coalesce(value, ''), E' \t\r\n'), 10)
+    END
+$$;
+
+CREATE OR REPLACE FUNCTION provider_alert_key(state text, links text, announcement_date text, subject text)
+RETURNS bigint
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT ('x' || substr(md5(concat_ws('|',
+        btrim(coalesce(state, ''), E' \t\r\n'),
+        btrim(coalesce(links, ''), E' \t\r\n'),
+        provider_alert_date(announcement_date),
+        md5(btrim(coalesce(subject, ''), E' \t\r\n'))
+    )), 1, 16))::bit(64)::bigint
+$$;
+
+ALTER TABLE provider_alerts ADD COLUMN IF NOT EXISTS natural_key bigint;
+
+CREATE OR REPLACE FUNCTION set_provider_alert_key()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.natural_key := provider_alert_key(NEW.state::text, NEW.links::text, NEW.announcement_date::text, NEW.subject::text);
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS provider_alerts_natural_key ON provider_alerts;
+CREATE TRIGGER provider_alerts_natural_key
+    BEFORE INSERT OR UPDATE OF state, links, announcement_date, subject, natural_key ON provider_alerts
+    FOR EACH ROW EXECUTE FUNCTION set_provider_alert_key();
+
+UPDATE provider_alerts
+SET natural_key = provider_alert_key(state::text, links::text, announcement_date::text, subject::text)
+WHERE natural_key IS DISTINCT FROM provider_alert_key(state::text, links::text, announcement_date::text, subject::text);
+
+-- Earlier ingests inserted a sheet row again whenever its spreadsheet id was unknown. Keep
+-- the first row (lowest id) of each alert, so the ids other tables and sessions hold stay valid.
+DELETE FROM provider_alerts a
+USING provider_alerts b
+WHERE a.natural_key = b.natural_key AND a.id > b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS provider_alerts_natural_key_uniq ON provider_alerts (natural_key);
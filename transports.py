@@ -0,0 +1,220 @@
+import os
+import smtplib
+import threading
+import time
+from abc import ABC, abstractmethod
+from email.message import EmailMessage
+from email.utils import formataddr, make_msgid
+
+# ============================================================================
+# MAIL TRANSPORTS
+# ============================================================================
+
+# Every transport has send(recipient, subject, html) -> provider message id, raising on
+# failure, plus close() and a TransportStats with per-message latency and throughput.
+
+
+class DeliveryUncertain(Exception):
+    """The send failed after the message was handed over, so it may have been delivered.
+
+    Raised instead of retrying; the outbox marks the message 'unknown' rather than resending it.
+    """
+
+
+class TransportStats:
+    """Per-message send latency and overall throughput of one transport"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+        self._first = None
+        self._last = None
+
+    def record(self, seconds, nbytes=0, failed=False):
+        now = time.perf_counter()
+        with self._lock:
+            if self._first is None:
+                self._first = now - seconds
+            self._last = now
+            if failed:
+                self.errors += 1
+            else:
+                self.latencies.append(seconds)
+                self.bytes += nbytes
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            elapsed = (self._last - self._first) if self._first is not None else 0.0
+            errors, nbytes = self.errors, self.bytes
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            "messages": len(latencies),
+            "errors": errors,
+            "bytes": nbytes,
+            "seconds": round(elapsed, 3),
+            "messages_per_second": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "latency_avg_ms": round(1000 * sum(latencies) / len(latencies), 2) if latencies else None,
+            "latency_p50_ms": round(1000 * percentile(0.50), 2),
+            "latency_p95_ms": round(1000 * percentile(0.95), 2),
+            "latency_max_ms": round(1000 * latencies[-1], 2) if latencies else None,
+        }
+
+
+def build_message(sender, recipient, subject, html):
+    message = EmailMessage()
+    message["From"] = formataddr((sender["name"], sender["email"]))
+    message["To"] = recipient
+    message["Subject"] = subject
+    message["Message-ID"] = make_msgid(domain=sender["email"].rsplit("@", 1)[-1])
+    message.set_content("This message requires an HTML capable mail client.")
+    message.add_alternative(html, subtype="html")
+    return message
+
+
+class MailTransport(ABC):
+    name = "base"
+
+    def __init__(self, sender):
+        self.sender = sender
+        self.stats = TransportStats()
+
+    def send(self, recipient, subject, html):
+        started = time.perf_counter()
+        try:
+            message_id = self._send(recipient, subject, html)
+        except Exception:
+            self.stats.record(time.perf_counter() - started, failed=True)
+            raise
+        self.stats.record(time.perf_counter() - started, len(html.encode("utf-8")))
+        return message_id
+
+    @abstractmethod
+    def _send(self, recipient, subject, html):
+        """Send one message and return its provider message id, raising on failure"""
+
+    def close(self):
+        pass
+
+
+class BrevoTransport(MailTransport):
+    """Brevo transactional API; get_api is called per message so injected fakes take effect"""
+
+    name = "brevo"
+
+    def __init__(self, sender, get_api):
+        super().__init__(sender)
+        self._get_api = get_api
+
+    def _send(self, recipient, subject, html):
+        from sib_api_v3_sdk.models import SendSmtpEmail
+        response = self._get_api().send_transac_email(SendSmtpEmail(
+            to=[{"email": recipient}],
+            sender=self.sender,
+            subject=subject,
+            html_content=html,
+        ))
+        if isinstance(response, dict):
+            return response.get("messageId")
+        return getattr(response, "message_id", None)
+
+
+class _TrackedSMTP(smtplib.SMTP):
+    """smtplib.SMTP that notes when the DATA command of the current message was issued"""
+
+    data_started = False
+
+    def data(self, msg):
+        self.data_started = True
+        return super().data(msg)
+
+
+class SmtpTransport(MailTransport):
+    """SMTP over one persistent connection, reopened only when the server drops it.
+
+    A connection dropped before DATA (typically an idle one the server closed) is reopened
+    and the message sent again. From DATA on the server may already have accepted it, so a
+    dropped connection or timeout raises DeliveryUncertain instead of risking a duplicate.
+
+    Works against any SMTP server, including a local `python -m aiosmtpd -n -l localhost:8025`
+    for load tests.
+    """
+
+    name = "smtp"
+
+    def __init__(self, sender, host, port=25, username=None, password=None, starttls=False, timeout=30):
+        super().__init__(sender)
+        self.host, self.port = host, port
+        self.username, self.password = username, password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = _TrackedSMTP(self.host, self.port, timeout=self.timeout)
+        connection.ehlo()
+        if self.starttls:
+            connection.starttls()
+            connection.ehlo()
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+
+    def _send(self, recipient, subject, html):
+        message = build_message(self.sender, recipient, subject, html)
+        with self._lock:
+            for attempt in range(2):
+                if self._connection is None:
+                    self._connection = self._connect()
+                connection = self._connection
+                connection.data_started = False
+                try:
+                    connection.send_message(message)
+                    return message["Message-ID"]
+                except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                    raise  # the server answered: a definite refusal
+                except OSError as e:
+                    self._connection = None
+                    if connection.data_started:
+                        raise DeliveryUncertain(f"connection lost after DATA: {e}") from e
+                    if attempt or not isinstance(e, smtplib.SMTPServerDisconnected):
+                        raise
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                try:
+                    self._connection.quit()
+                except smtplib.SMTPException:
+                    pass
+                self._connection = None
+
+
+class FileSinkTransport(MailTransport):
+    """Writes each message as an .eml file into a directory instead of sending it"""
+
+    name = "file"
+
+    def __init__(self, sender, directory):
+        super().__init__(sender)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def _send(self, recipient, subject, html):
+        message = build_message(self.sender, recipient, subject, html)
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        safe_recipient = "".join(c if c.isalnum() or c in "@._-" else "_" for c in recipient)
+        path = os.path.join(self.directory, f"{os.getpid()}-{counter:06d}-{safe_recipient}.eml")
+        with open(path, "wb") as f:
+            f.write(bytes(message))
+        return message["Message-ID"]
@@ -0,0 +1,55 @@
+import hashlib
+
+import pandas as pd
+
+# ============================================================================
+# CANONICAL BILL URL KEYS
+# ============================================================================
+
+# A bill's identity is its url up to trivial variants: surrounding whitespace, case, a
+# #fragment and trailing slashes. url_key is the first 64 bits of md5(canonical url) as a
+# signed int64, the same value SQL bill_url_key() computes (sql/bill_track_50_url_key.sql),
+# so frames join and test membership on integers instead of long strings. The stored url
+# itself is never rewritten; only the key is canonical.
+
+
+def canonical_urls(urls):
+    """Series of urls -> canonical form; same as SQL canonical_bill_url()"""
+    return urls.astype("string").str.strip().str.lower().str.replace(r"#.*$", "", regex=True).str.rstrip("/")
+
+
+def canonical_url(url):
+    return canonical_urls(pd.Series([url])).iloc[0]
+
+
+def _key(canonical):
+    return int.from_bytes(hashlib.md5(canonical.encode("utf-8")).digest()[:8], "big", signed=True)
+
+
+def url_key(url):
+    """int64 key of one url"""
+    return _key(canonical_url(url))
+
+
+def url_keys(urls):
+    """int64 Series of keys for a Series of urls, which must all be present"""
+    canonical = canonical_urls(urls)
+    keys = {value: _key(value) for value in canonical.unique()}
+    return canonical.map(keys).astype("int64")
+
+
+def add_url_key(df):
+    """Add df['url_key'] computed from df['url'] (once per frame) and return df"""
+    df['url_key'] = url_keys(df['url'])
+    return df
+
+
+def url_key_collisions(*frames):
+    """{url_key: [canonical urls]} for keys shared by different canonical urls across frames"""
+    pairs = pd.concat(
+        [pd.DataFrame({"url_key": frame['url_key'], "canonical": canonical_urls(frame['url'])}) for frame in frames if len(frame)],
+        ignore_index=True,
+    ) if any(len(frame) for frame in frames) else pd.DataFrame(columns=["url_key", "canonical"])
+    pairs = pairs.drop_duplicates()
+    shared = pairs[pairs.duplicated("url_key", keep=False)]
+    return {key: sorted(group["canonical"]) for key, group in shared.groupby("url_key")}
@@ -0,0 +1,150 @@
+"""Headless entry point for scheduled (cron / Kubernetes job) runs of the alert pipeline.
+
+    python worker.py update   # ingest Bill Track and Provider Alerts
+    python worker.py notify   # email users about new alerts they have not received yet
+    python worker.py notify --shards 8 --processes 4   # same, split across local processes
+    python worker.py notify-shard --shards 8           # join a sharded run from another host
+    python worker.py all      # update, then notify if both pipelines succeeded
+    python worker.py compact --days 180   # drop old sent-alert ledger rows
+    python worker.py sync-service-lines   # rebuild the alert_service_lines projection
+    python worker.py update --profile     # also save cProfile/tracemalloc artifacts to PROFILE_DIR
+
+Streamlit is never imported on this path; logs go to stdout through a log sink.
+"""
+import argparse
+import sys
+from datetime import datetime
+
+from log_buffer import LogRecord
+
+# Exit codes (argparse itself exits with 2 on usage errors)
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_CONNECTION = 3
+
+_LEVEL_TAGS = {"success": "OK", "error": "ERROR", "warning": "WARN", "info": "INFO"}
+
+
+def stdout_log_sink(record):
+    """Log sink that writes one line per record; errors go to stderr"""
+    level = _LEVEL_TAGS.get(record.level, record.level.upper())
+    line = f"{record.timestamp:%Y-%m-%d %H:%M:%S} {level:<5} [{record.phase}] {record.message}"
+    stream = sys.stderr if record.level == "error" else sys.stdout
+    print(line, file=stream, flush=True)
+
+
+def durable_ledger_configured():
+    """Whether the sent-alert ledger outlives this process's container.
+
+    With DATABASE_URL it lives in Postgres. Otherwise it is the SQLite file at OUTBOX_PATH,
+    which must then be set explicitly to a path on a persistent volume: in an ephemeral
+    container the default file would be lost after every run and users mailed again.
+    """
+    from data_processor import get_setting, log_message
+    if get_setting("DATABASE_URL") or get_setting("OUTBOX_PATH"):
+        return True
+    log_message("❌ No durable delivery ledger: set DATABASE_URL, or OUTBOX_PATH to a file on a persistent volume", "error", phase="Notification")
+    return False
+
+
+def run_update(notify=False, max_workers=2, profile=None):
+    from pipeline import run_update_pipeline
+    result = run_update_pipeline(notify=notify, max_workers=max_workers, profile=profile)
+    if not result['connected']:
+        return EXIT_CONNECTION
+    return EXIT_OK if result['succeeded'] else EXIT_FAILED
+
+
+def run_notify(shards=1, processes=1, profile=None):
+    if shards > 1:
+        from pipeline import run_sharded_notify
+        result = run_sharded_notify(shard_count=shards, processes=processes)
+    else:
+        from pipeline import run_notify as notify
+        result = notify(profile=profile)
+    if not result['connected']:
+        return EXIT_CONNECTION
+    return EXIT_OK if result['succeeded'] else EXIT_FAILED
+
+
+def run_notify_shard(shards):
+    from data_processor import log_connection_status
+    from pipeline import notify_shards
+    if not log_connection_status(blob_storage=False):
+        return EXIT_CONNECTION
+    results = notify_shards(shards)
+    return EXIT_OK if all(result['succeeded'] for result in results) else EXIT_FAILED
+
+
+def run_compact(days):
+    from data_processor import get_outbox, get_setting, log_message
+    lookback = int(get_setting("NOTIFY_LOOKBACK_DAYS", "7"))
+    if days <= lookback:
+        log_message(f"❌ --days must be larger than NOTIFY_LOOKBACK_DAYS ({lookback}), or alerts in the window would be re-sent", "error", phase="General")
+        return EXIT_FAILED
+    ledger_rows, messages = get_outbox().compact_ledger(days)
+    log_message(f"🧹 Compacted {ledger_rows} ledger rows and {messages} outbox messages older than {days} days", "success", phase="General")
+    return EXIT_OK
+
+
+def run_sync_service_lines():
+    from data_processor import backfill_alert_service_lines, log_connection_status, log_message
+    if not log_connection_status(blob_storage=False):
+        return EXIT_CONNECTION
+    rows = backfill_alert_service_lines()
+    if rows is None:
+        log_message("❌ alert_service_lines rebuild failed", "error", phase="General")
+        return EXIT_FAILED
+    log_message(f"✅ alert_service_lines rebuilt with {rows} rows", "success", phase="General")
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="worker.py", description="Run the Medirate alert pipeline without Streamlit.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update = subparsers.add_parser("update", help="ingest Bill Track and Provider Alerts data")
+    update.add_argument("--max-workers", type=int, default=2, help="pipelines to run concurrently (default: 2)")
+    update.add_argument("--profile", action="store_true", default=None, help="profile the run (default: PROFILE_RUNS)")
+    notify = subparsers.add_parser("notify", help="send email notifications for new alerts")
+    notify.add_argument("--shards", type=int, default=1, help="split recipients into this many shards (default: 1)")
+    notify.add_argument("--processes", type=int, default=None, help="local worker processes for a sharded run (default: --shards)")
+    notify.add_argument("--profile", action="store_true", default=None, help="profile an unsharded run (default: PROFILE_RUNS)")
+    notify_shard = subparsers.add_parser("notify-shard", help="claim and process shards of a sharded notify run")
+    notify_shard.add_argument("--shards", type=int, required=True, help="shard count used by every worker of the run")
+    run_all = subparsers.add_parser("all", help="update, then notify if every pipeline succeeded")
+    run_all.add_argument("--max-workers", type=int, default=2, help="pipelines to run concurrently (default: 2)")
+    run_all.add_argument("--profile", action="store_true", default=None, help="profile the run (default: PROFILE_RUNS)")
+    compact = subparsers.add_parser("compact", help="delete old sent-alert ledger rows and finished outbox messages")
+    compact.add_argument("--days", type=int, default=180, help="keep this many days of delivery history (default: 180)")
+    subparsers.add_parser("sync-service-lines", help="rebuild the alert_service_lines projection from both alert tables")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    from data_processor import set_log_sink
+    set_log_sink(stdout_log_sink)
+    try:
+        if args.command == "update":
+            return run_update(notify=False, max_workers=args.max_workers, profile=args.profile)
+        if args.command in ("notify", "notify-shard", "all") and not durable_ledger_configured():
+            return EXIT_FAILED
+        if args.command == "notify":
+            return run_notify(args.shards, args.processes or args.shards, args.profile)
+        if args.command == "notify-shard":
+            return run_notify_shard(args.shards)
+        if args.command == "compact":
+            return run_compact(args.days)
+        if args.command == "sync-service-lines":
+            return run_sync_service_lines()
+        return run_update(notify=True, max_workers=args.max_workers, profile=args.profile)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as e:
+        stdout_log_sink(LogRecord(datetime.now(), "error", "General", f"❌ Unhandled error in worker: {e}"))
+        return EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())